@@ -1,7 +1,12 @@
+import os
 from flask import Flask
 from flask_login import LoginManager
 from app.database import init_db, db
 from app.config import Config
+from app.cache import init_cache
+from app.metrics import init_metrics
+from app.sqlite import init_sqlite
+from app.replica import init_replica
 
 login_manager = LoginManager()
 
@@ -15,12 +20,21 @@ def create_app():
     login_manager.init_app(app)
     login_manager.login_view = 'auth.login'
     
-    # Initialize SQLAlchemy
+    # Initialize SQLAlchemy (one pooled engine per process)
+    os.makedirs(app.instance_path, exist_ok=True)
     db.init_app(app)
     
-    # Initialize database within application context
-    with app.app_context():
-        init_db()
+    # Tune SQLite connections and queue their writes
+    init_sqlite(app)
+    
+    # Route reporting reads to the read replica, if one is configured
+    init_replica(app)
+    
+    # Initialize the dashboard cache
+    init_cache(app)
+    
+    # Initialize request timing and SQL profiling
+    init_metrics(app)
     
     # Register blueprints
     from app.routes import auth, main, admin, employee
@@ -29,9 +43,31 @@ def create_app():
     app.register_blueprint(admin.bp)
     app.register_blueprint(employee.bp)
     
+    # Tables and the admin user are set up by migrate.py or `flask init-db`,
+    # not by every worker that boots
+    @app.cli.command('init-db')
+    def init_db_command():
+        """Create the tables and admin user and apply pending migrations."""
+        from app.migrations import run_migrations
+        init_db()
+        run_migrations()
+    
     return app
 
+def after_fork(app):
+    """Reset what a forked worker inherits from the process that built app.
+    
+    Called by gunicorn's post_fork hook when the app is preloaded (see
+    gunicorn.conf.py). Pooled connections belong to the parent, so the
+    child's engines start with empty pools; the parent's own connections
+    are left open for it.
+    """
+    db.get_engine(app).dispose(close=False)
+    replica = app.extensions.get('db_replica')
+    if replica is not None:
+        replica.engine.dispose(close=False)
+
 @login_manager.user_loader
 def load_user(user_id):
-    from app.models import User
-    return User.get(user_id) 
\ No newline at end of file
+    from app.identity import load_user
+    return load_user(user_id) 
\ No newline at end of file
@@ -0,0 +1,151 @@
+"""Bulk import of work records from CSV or XLSX timesheets.
+
+A file needs employee_id, date (YYYY-MM-DD) and hours_worked columns. It
+is read row by row and validated in a single pass, the hourly rates of
+every employee it mentions are loaded with batched IN queries into a
+RateTable, so each record is priced at the rate in effect on its date
+without a query per row, and the records are inserted with executemany
+batches in one transaction with their rollup updates.
+
+By default a file with any invalid row imports nothing, so a bad timesheet
+can be fixed and uploaded again as a whole. With skip_invalid=True the
+valid rows are imported and the rest reported.
+"""
+import csv
+import io
+import time
+import zipfile
+from datetime import date, datetime
+from app.database import execute_many, transaction
+from app.rollups import record_deltas
+from app.rates import RateTable
+from app.stats import invalidate_admin_dashboard, STATS_FRAGMENT, RECENT_FRAGMENT
+
+# Rows per executemany call
+BATCH_SIZE = 1000
+
+REQUIRED_COLUMNS = ('employee_id', 'date', 'hours_worked')
+
+INSERT_RECORD = """
+    INSERT INTO work_records (employee_id, date, hours_worked, amount_earned)
+    VALUES (:employee_id, :date, :hours_worked, :amount_earned)
+"""
+
+def read_rows(stream, filename, required_columns=REQUIRED_COLUMNS):
+    """Yield (line_number, row) pairs from a binary CSV or XLSX stream.
+
+    Raises ValueError if a required column is missing or an XLSX file
+    cannot be opened.
+    """
+    if filename.lower().endswith('.xlsx'):
+        return _read_xlsx(stream, required_columns)
+    return _read_csv(stream, required_columns)
+
+def _read_csv(stream, required_columns):
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    reader = csv.reader(text)
+    yield from _rows(next(reader, None), reader, required_columns)
+
+def _read_xlsx(stream, required_columns):
+    from openpyxl import load_workbook
+    from openpyxl.utils.exceptions import InvalidFileException
+    try:
+        sheet = load_workbook(stream, read_only=True, data_only=True).active
+    except (zipfile.BadZipFile, InvalidFileException, KeyError):
+        raise ValueError('not a valid XLSX file')
+    rows = sheet.iter_rows(values_only=True)
+    yield from _rows(next(rows, None), rows, required_columns)
+
+def _rows(header, rows, required_columns):
+    if header is None:
+        return
+    names = [str(name).strip().lower() if name is not None else '' for name in header]
+    missing = [column for column in required_columns if column not in names]
+    if missing:
+        raise ValueError(f"Missing column(s): {', '.join(missing)}")
+    for line, row in enumerate(rows, start=2):
+        # Skip blank lines
+        if all(value in (None, '') for value in row):
+            continue
+        yield line, dict(zip(names, row))
+
+def parse_row(row):
+    """Return (employee_id, date, hours_worked), or raise ValueError."""
+    value = row.get('employee_id')
+    try:
+        if isinstance(value, float) and value.is_integer():
+            value = int(value)
+        employee_id = int(str(value).strip())
+    except (TypeError, ValueError):
+        raise ValueError('employee_id must be a whole number')
+
+    value = row.get('date')
+    if isinstance(value, datetime):
+        day = value.date()
+    elif isinstance(value, date):
+        day = value
+    else:
+        try:
+            day = datetime.strptime(str(value).strip(), '%Y-%m-%d').date()
+        except ValueError:
+            raise ValueError('date must be YYYY-MM-DD')
+
+    try:
+        hours_worked = float(row.get('hours_worked'))
+    except (TypeError, ValueError):
+        raise ValueError('hours_worked must be a number')
+    if not 0 < hours_worked <= 24:
+        raise ValueError('hours_worked must be more than 0 and at most 24')
+
+    return employee_id, day, hours_worked
+
+def import_work_records(rows, skip_invalid=False):
+    """Validate and insert rows from read_rows().
+
+    Returns a dict with the number of rows read and inserted, a list of
+    {'line', 'error'} entries, the time taken and rows per second.
+    """
+    started = time.perf_counter()
+    total = 0
+    parsed = []
+    errors = []
+    for line, row in rows:
+        total += 1
+        try:
+            parsed.append((line,) + parse_row(row))
+        except ValueError as e:
+            errors.append({'line': line, 'error': str(e)})
+
+    rates = RateTable.load({employee_id for _, employee_id, _, _ in parsed})
+    records = []
+    for line, employee_id, day, hours_worked in parsed:
+        if employee_id not in rates:
+            errors.append({'line': line, 'error': f'Employee {employee_id} not found'})
+            continue
+        records.append({
+            'employee_id': employee_id,
+            'date': day,
+            'hours_worked': hours_worked,
+            'amount_earned': hours_worked * rates.rate_on(employee_id, day),
+        })
+    errors.sort(key=lambda error: error['line'])
+
+    inserted = 0
+    if records and (skip_invalid or not errors):
+        with transaction(long=True):
+            for start in range(0, len(records), BATCH_SIZE):
+                inserted += execute_many(INSERT_RECORD, records[start:start + BATCH_SIZE])
+            record_deltas(
+                (r['employee_id'], r['date'], r['hours_worked'], r['amount_earned'])
+                for r in records
+            )
+        invalidate_admin_dashboard(STATS_FRAGMENT, RECENT_FRAGMENT)
+
+    seconds = time.perf_counter() - started
+    return {
+        'rows': total,
+        'inserted': inserted,
+        'errors': errors,
+        'seconds': round(seconds, 3),
+        'rows_per_second': round(total / seconds) if seconds else 0,
+    }
@@ -0,0 +1,128 @@
+"""Pluggable cache for dashboard fragments.
+
+The default backend is an in-process LRU with a TTL. Setting
+CACHE_BACKEND=redis stores entries in a Redis-compatible server instead,
+so gunicorn workers share them. invalidate() only reaches the backend it
+runs against; data that every worker must see change is keyed by a
+shared version instead (see app/stats.py).
+
+Hit and miss counters are kept per fragment (the first two segments of a
+key, e.g. "dashboard:stats") and reported by get_stats().
+"""
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+class MemoryCache:
+    """Thread-safe LRU cache whose entries expire after a TTL."""
+
+    def __init__(self, max_entries=1024, default_ttl=30):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires = time.monotonic() + (ttl or self.default_ttl)
+        with self._lock:
+            self._entries[key] = (expires, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+class RedisCache:
+    """Cache backed by a Redis-compatible server (needs the redis package)."""
+
+    def __init__(self, url, default_ttl=30, prefix='payroll:'):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError('CACHE_BACKEND=redis requires the redis package (pip install redis)')
+        self.client = redis.Redis.from_url(url)
+        self.default_ttl = default_ttl
+        self.prefix = prefix
+
+    def get(self, key):
+        raw = self.client.get(self.prefix + key)
+        return None if raw is None else pickle.loads(raw)
+
+    def set(self, key, value, ttl=None):
+        self.client.set(self.prefix + key, pickle.dumps(value), ex=int(ttl or self.default_ttl))
+
+    def delete(self, *keys):
+        if keys:
+            self.client.delete(*(self.prefix + key for key in keys))
+
+    def clear(self):
+        keys = list(self.client.scan_iter(self.prefix + '*'))
+        if keys:
+            self.client.delete(*keys)
+
+_backend = MemoryCache()
+_stats = {}
+_stats_lock = threading.Lock()
+
+def init_cache(app):
+    """Create the cache backend from the application config."""
+    global _backend
+    ttl = app.config.get('CACHE_DEFAULT_TTL', 30)
+    if app.config.get('CACHE_BACKEND') == 'redis':
+        _backend = RedisCache(app.config['CACHE_REDIS_URL'], default_ttl=ttl)
+    else:
+        _backend = MemoryCache(app.config.get('CACHE_MAX_ENTRIES', 1024), default_ttl=ttl)
+
+def count(key, hit):
+    """Record a hit or miss for the fragment of key in get_stats()."""
+    fragment = ':'.join(key.split(':')[:2])
+    with _stats_lock:
+        counters = _stats.setdefault(fragment, {'hits': 0, 'misses': 0})
+        counters['hits' if hit else 'misses'] += 1
+
+def cached(key, loader, ttl=None):
+    """Return the cached value for key, calling loader() on a miss."""
+    value = _backend.get(key)
+    if value is not None:
+        count(key, True)
+        return value
+    count(key, False)
+    value = loader()
+    _backend.set(key, value, ttl)
+    return value
+
+def invalidate(*keys):
+    """Drop cached entries so the next read reloads them."""
+    _backend.delete(*keys)
+
+def clear():
+    _backend.clear()
+
+def get_stats():
+    """Return hit/miss counters and hit rate per fragment for this process."""
+    with _stats_lock:
+        stats = {}
+        for fragment, counters in _stats.items():
+            total = counters['hits'] + counters['misses']
+            stats[fragment] = dict(counters, hit_rate=counters['hits'] / total if total else 0.0)
+    return {'backend': type(_backend).__name__, 'fragments': stats}
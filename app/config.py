@@ -1,5 +1,32 @@
 import os
+import tempfile
 from datetime import timedelta
+from sqlalchemy.pool import QueuePool
+
+def _env_flag(name, default):
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.lower() in ('1', 'true', 'yes', 'on')
+
+def engine_options(uri):
+    """Build the SQLAlchemy engine options for the process-wide pool.
+
+    The same pool settings apply to every dialect. SQLite file databases
+    default to NullPool, so they are switched to a QueuePool explicitly and
+    allowed to hand connections between gunicorn threads.
+    """
+    options = {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', 5)),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 10)),
+        'pool_timeout': int(os.environ.get('DB_POOL_TIMEOUT', 30)),
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 1800)),
+        'pool_pre_ping': _env_flag('DB_POOL_PRE_PING', True),
+    }
+    if uri.startswith('sqlite'):
+        options['poolclass'] = QueuePool
+        options['connect_args'] = {'check_same_thread': False}
+    return options
 
 class Config:
     # Security
@@ -8,10 +35,92 @@ class Config:
     # Database
     DATABASE_URL = os.environ.get('DATABASE_URL')
     if DATABASE_URL:
+        # Render hands out postgres:// URLs, which SQLAlchemy 1.4 rejects
+        if DATABASE_URL.startswith('postgres://'):
+            DATABASE_URL = DATABASE_URL.replace('postgres://', 'postgresql://', 1)
         SQLALCHEMY_DATABASE_URI = DATABASE_URL
     else:
         SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(os.path.dirname(os.path.dirname(__file__)), 'instance', 'payroll.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI)
+    
+    # SQLite production profile (see app/sqlite.py); ignored on PostgreSQL.
+    # Sizes follow SQLite: mmap_size in bytes, a negative cache_size in KiB
+    SQLITE_TUNING = _env_flag('SQLITE_TUNING', True)
+    SQLITE_JOURNAL_MODE = os.environ.get('SQLITE_JOURNAL_MODE', 'WAL')
+    SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')
+    SQLITE_BUSY_TIMEOUT = int(os.environ.get('SQLITE_BUSY_TIMEOUT', 5000))
+    SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+    SQLITE_CACHE_SIZE = int(os.environ.get('SQLITE_CACHE_SIZE', -64 * 1024))
+    
+    # Opt in to writes of concurrent threads in one process sharing a
+    # transaction, committed after SQLITE_GROUP_COMMIT_MAX units or
+    # SQLITE_GROUP_COMMIT_MAX_MS milliseconds, whichever comes first
+    SQLITE_GROUP_COMMIT = _env_flag('SQLITE_GROUP_COMMIT', False)
+    SQLITE_GROUP_COMMIT_MAX = int(os.environ.get('SQLITE_GROUP_COMMIT_MAX', 32))
+    SQLITE_GROUP_COMMIT_MAX_MS = float(os.environ.get('SQLITE_GROUP_COMMIT_MAX_MS', 20))
+    
+    # Read replica for reports and listings (see app/replica.py). On SQLite,
+    # REPLICA_SNAPSHOT_SECONDS > 0 without a URL keeps a snapshot copy at
+    # REPLICA_SNAPSHOT_PATH, refreshed once it is that many seconds old
+    DATABASE_REPLICA_URL = os.environ.get('DATABASE_REPLICA_URL')
+    REPLICA_SNAPSHOT_SECONDS = int(os.environ.get('REPLICA_SNAPSHOT_SECONDS', 0))
+    REPLICA_SNAPSHOT_PATH = os.environ.get('REPLICA_SNAPSHOT_PATH') or os.path.join(os.path.dirname(os.path.dirname(__file__)), 'instance', 'payroll-replica.db')
+    REPLICA_MAX_LAG_SECONDS = float(os.environ.get('REPLICA_MAX_LAG_SECONDS', 30))
+    REPLICA_LAG_CHECK_SECONDS = float(os.environ.get('REPLICA_LAG_CHECK_SECONDS', 5))
+    REPLICA_RETRY_SECONDS = float(os.environ.get('REPLICA_RETRY_SECONDS', 30))
+    
+    # Cache for dashboard fragments: 'memory' (per process) or 'redis'
+    CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'memory')
+    CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL', 'redis://localhost:6379/0')
+    CACHE_DEFAULT_TTL = int(os.environ.get('CACHE_DEFAULT_TTL', 30))
+    CACHE_MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES', 1024))
+    
+    # Background report generation: 'process' pool or 'thread' pool
+    REPORT_EXECUTOR = os.environ.get('REPORT_EXECUTOR', 'process')
+    REPORT_WORKERS = int(os.environ.get('REPORT_WORKERS', 2))
+    REPORT_JOB_STALE_SECONDS = int(os.environ.get('REPORT_JOB_STALE_SECONDS', 60))
+    REPORT_JOB_TIMEOUT = int(os.environ.get('REPORT_JOB_TIMEOUT', 600))
+    
+    # Content-addressed store for generated report files
+    REPORT_STORE_PATH = os.environ.get('REPORT_STORE_PATH') or os.path.join(os.path.dirname(os.path.dirname(__file__)), 'instance', 'reports')
+    
+    # Processes hashing passwords during bulk onboarding (0 = one per CPU)
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', 0))
+    
+    # Hash policy for new and upgraded passwords (werkzeug method string);
+    # older hashes are rehashed under it on the next successful login
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:260000')
+    PASSWORD_SALT_LENGTH = int(os.environ.get('PASSWORD_SALT_LENGTH', 16))
+    
+    # Password checks at login: a 'thread' or 'process' pool of
+    # PASSWORD_VERIFY_WORKERS per process, at most PASSWORD_VERIFY_LIMIT
+    # running or queued per process, at most PASSWORD_VERIFY_HOST_LIMIT
+    # hashing at once across all processes on the host (lock files under
+    # PASSWORD_VERIFY_LOCK_DIR), and the seconds a login waits for a slot
+    # before it is refused
+    PASSWORD_VERIFY_EXECUTOR = os.environ.get('PASSWORD_VERIFY_EXECUTOR', 'thread')
+    PASSWORD_VERIFY_WORKERS = int(os.environ.get('PASSWORD_VERIFY_WORKERS', 2))
+    PASSWORD_VERIFY_HOST_LIMIT = int(os.environ.get('PASSWORD_VERIFY_HOST_LIMIT', max(1, (os.cpu_count() or 1) // 2)))
+    PASSWORD_VERIFY_LOCK_DIR = os.environ.get('PASSWORD_VERIFY_LOCK_DIR') or os.path.join(tempfile.gettempdir(), 'payroll-password-slots')
+    PASSWORD_VERIFY_LIMIT = int(os.environ.get('PASSWORD_VERIFY_LIMIT', 16))
+    PASSWORD_VERIFY_TIMEOUT = float(os.environ.get('PASSWORD_VERIFY_TIMEOUT', 10))
+    
+    # Pay runs: hours per week after which overtime is paid, and its rate
+    OVERTIME_WEEKLY_HOURS = float(os.environ.get('OVERTIME_WEEKLY_HOURS', 40))
+    OVERTIME_MULTIPLIER = float(os.environ.get('OVERTIME_MULTIPLIER', 1.5))
+    
+    # Seconds the user's role and employee id are trusted from the signed
+    # session cookie before they are read again (0 = every request)
+    IDENTITY_CACHE_SECONDS = int(os.environ.get('IDENTITY_CACHE_SECONDS', 60))
+    
+    # Request timing and SQL profiling, served in the Prometheus format at
+    # /metrics to admins or to scrapers sending METRICS_TOKEN as a bearer
+    # token; Server-Timing adds each request's own figures to its response
+    METRICS_ENABLED = _env_flag('METRICS_ENABLED', True)
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+    METRICS_SERVER_TIMING = _env_flag('METRICS_SERVER_TIMING', False)
+    SLOW_QUERY_SECONDS = float(os.environ.get('SLOW_QUERY_SECONDS', 0.5))
     
     # Session configuration
     PERMANENT_SESSION_LIFETIME = timedelta(minutes=60)
@@ -21,4 +130,4 @@ class Config:
     ADMIN_PASSWORD = 'admin123'  # Change this in production!
     
     # Flask configuration
-    DEBUG = True 
\ No newline at end of file
+    DEBUG = True 
@@ -1,9 +1,12 @@
 from flask import g, current_app
 from flask_sqlalchemy import SQLAlchemy
-from werkzeug.security import generate_password_hash
-import os
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from collections.abc import Mapping
+from contextlib import contextmanager
+from functools import lru_cache
 from datetime import datetime
-from app.config import Config
+import re
 
 db = SQLAlchemy()
 
@@ -12,28 +15,39 @@ class User(db.Model):
     
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
-    password = db.Column(db.String(120), nullable=False)
+    # Long enough for the hash of any PASSWORD_HASH_METHOD werkzeug offers
+    password = db.Column(db.String(255), nullable=False)
     is_admin = db.Column(db.Boolean, default=False)
     employee_id = db.Column(db.Integer, db.ForeignKey('employees.id'), nullable=True)
     
+    __table_args__ = (
+        db.Index('ix_users_employee_id', 'employee_id'),
+    )
+    
     def set_password(self, password):
-        self.password = generate_password_hash(password)
+        from app.passwords import hash_password
+        self.password = hash_password(password)
     
     def check_password(self, password):
-        from werkzeug.security import check_password_hash
-        return check_password_hash(self.password, password)
+        from app.passwords import verify_password
+        return verify_password(self.password, password)[0]
 
 class Employee(db.Model):
     __tablename__ = 'employees'
     
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
+    # Rate as of the last edit; pay uses employee_rates (app/rates.py)
     hourly_rate = db.Column(db.Float, nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
     
     # Relationship
-    user = db.relationship('User', backref='employee', uselist=False)
+    user = db.relationship('User', backref='employee', uselist=False, foreign_keys=[user_id])
     work_records = db.relationship('WorkRecord', backref='employee', lazy=True)
+    
+    __table_args__ = (
+        db.Index('ix_employees_name_id', 'name', 'id'),
+    )
 
 class WorkRecord(db.Model):
     __tablename__ = 'work_records'
@@ -43,6 +57,13 @@ class WorkRecord(db.Model):
     date = db.Column(db.Date, nullable=False)
     hours_worked = db.Column(db.Float, nullable=False)
     amount_earned = db.Column(db.Float, nullable=False)
+    
+    # Keep in sync with the indexes created by app/migrations.py
+    __table_args__ = (
+        # Covers per-employee range scans and dashboard sums
+        db.Index('ix_work_records_employee_date', 'employee_id', 'date', 'hours_worked', 'amount_earned'),
+        db.Index('ix_work_records_date_id', 'date', 'id'),
+    )
 
 class Report(db.Model):
     __tablename__ = 'reports'
@@ -50,29 +71,154 @@ class Report(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     employee_id = db.Column(db.Integer, db.ForeignKey('employees.id'), nullable=True)
     report_type = db.Column(db.String(50), nullable=False)
+    file_format = db.Column(db.String(10), nullable=False, default='pdf', server_default='pdf')
+    start_date = db.Column(db.Date, nullable=False)
+    end_date = db.Column(db.Date, nullable=False)
+    # Inline PDF from before the report store; empty for stored reports
+    content = db.Column(db.Text, nullable=False, default='')
+    content_hash = db.Column(db.String(64), nullable=True)
+    content_size = db.Column(db.Integer, nullable=True)
+    fingerprint = db.Column(db.String(64), nullable=True)
+    date_created = db.Column(db.DateTime, default=datetime.utcnow, server_default=db.func.current_timestamp())
+    
+    __table_args__ = (
+        db.Index('ix_reports_fingerprint', 'fingerprint'),
+        db.Index('ix_reports_employee_created', 'employee_id', 'date_created'),
+        db.Index('ix_reports_created', 'date_created'),
+    )
+
+class ReportJob(db.Model):
+    """A queued report, built in the background by app/jobs.py."""
+    __tablename__ = 'report_jobs'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    status = db.Column(db.String(20), nullable=False, default='queued')
+    source = db.Column(db.String(20), nullable=False)
+    requested_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+    employee_id = db.Column(db.Integer, db.ForeignKey('employees.id'), nullable=True)
+    report_type = db.Column(db.String(50), nullable=False)
+    file_format = db.Column(db.String(10), nullable=False, default='pdf', server_default='pdf')
     start_date = db.Column(db.Date, nullable=False)
     end_date = db.Column(db.Date, nullable=False)
-    content = db.Column(db.Text, nullable=False)
-    date_created = db.Column(db.DateTime, default=datetime.utcnow)
-
-def get_db_path():
-    """Get the path to the SQLite database file."""
-    return Config.DATABASE_PATH
-
-def get_db():
-    """Get the database connection for the current application context."""
-    if not hasattr(g, 'db'):
-        # Ensure the instance directory exists
-        os.makedirs(os.path.dirname(get_db_path()), exist_ok=True)
-        
-        g.db = SQLAlchemy(app)
-    return g.db
-
-def close_db(e=None):
-    """Close the database connection."""
-    db = g.pop('db', None)
-    if db is not None:
-        db.session.close()
+    report_id = db.Column(db.Integer, db.ForeignKey('reports.id'), nullable=True)
+    fingerprint = db.Column(db.String(64), nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    
+    __table_args__ = (
+        db.Index('ix_report_jobs_status_created', 'status', 'created_at'),
+        db.Index('ix_report_jobs_fingerprint', 'fingerprint', 'status'),
+    )
+
+class EmployeeRate(db.Model):
+    """An hourly rate and the day it took effect, managed by app/rates.py."""
+    __tablename__ = 'employee_rates'
+    
+    employee_id = db.Column(db.Integer, db.ForeignKey('employees.id'), primary_key=True)
+    effective_from = db.Column(db.Date, primary_key=True)
+    hourly_rate = db.Column(db.Float, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow,
+                           server_default=db.func.current_timestamp())
+
+class PayrollDaily(db.Model):
+    """Work record totals per employee per day, maintained by app/rollups.py."""
+    __tablename__ = 'payroll_daily'
+    
+    employee_id = db.Column(db.Integer, db.ForeignKey('employees.id'), primary_key=True)
+    date = db.Column(db.Date, primary_key=True)
+    record_count = db.Column(db.Integer, nullable=False, default=0)
+    total_hours = db.Column(db.Float, nullable=False, default=0)
+    total_earnings = db.Column(db.Float, nullable=False, default=0)
+    
+    __table_args__ = (
+        db.Index('ix_payroll_daily_date', 'date'),
+    )
+
+class PayrollMonthly(db.Model):
+    """Work record totals per employee per month (month is its first day)."""
+    __tablename__ = 'payroll_monthly'
+    
+    employee_id = db.Column(db.Integer, db.ForeignKey('employees.id'), primary_key=True)
+    month = db.Column(db.Date, primary_key=True)
+    record_count = db.Column(db.Integer, nullable=False, default=0)
+    total_hours = db.Column(db.Float, nullable=False, default=0)
+    total_earnings = db.Column(db.Float, nullable=False, default=0)
+    
+    __table_args__ = (
+        db.Index('ix_payroll_monthly_month', 'month'),
+    )
+
+class PayrollOrgMonthly(db.Model):
+    """Work record totals across all employees per month."""
+    __tablename__ = 'payroll_org_monthly'
+    
+    month = db.Column(db.Date, primary_key=True)
+    record_count = db.Column(db.Integer, nullable=False, default=0)
+    total_hours = db.Column(db.Float, nullable=False, default=0)
+    total_earnings = db.Column(db.Float, nullable=False, default=0)
+
+class PayrollVersion(db.Model):
+    """Change counter per employee per month; rows are never deleted."""
+    __tablename__ = 'payroll_versions'
+    
+    employee_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    month = db.Column(db.Date, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=1)
+    
+    __table_args__ = (
+        db.Index('ix_payroll_versions_month', 'month'),
+    )
+
+class CacheGeneration(db.Model):
+    """Change counter per cached dashboard fragment, shared by all workers."""
+    __tablename__ = 'cache_generations'
+    
+    name = db.Column(db.String(50), primary_key=True)
+    generation = db.Column(db.Integer, nullable=False, default=1)
+
+class PayRun(db.Model):
+    """A pay period computed by app/payroll.py, with its totals."""
+    __tablename__ = 'pay_runs'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    period_start = db.Column(db.Date, nullable=False)
+    period_end = db.Column(db.Date, nullable=False)
+    overtime_threshold = db.Column(db.Float, nullable=False)
+    overtime_multiplier = db.Column(db.Float, nullable=False)
+    employee_count = db.Column(db.Integer, nullable=False, default=0)
+    record_count = db.Column(db.Integer, nullable=False, default=0)
+    regular_hours = db.Column(db.Float, nullable=False, default=0)
+    overtime_hours = db.Column(db.Float, nullable=False, default=0)
+    gross_pay = db.Column(db.Float, nullable=False, default=0)
+    created_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_pay_runs_created', 'created_at'),
+    )
+
+class PayRunLine(db.Model):
+    """Gross pay of one employee in a pay run.
+    
+    employee_id has no foreign key so pay history outlives deleted employees.
+    """
+    __tablename__ = 'pay_run_lines'
+    
+    pay_run_id = db.Column(db.Integer, db.ForeignKey('pay_runs.id'), primary_key=True)
+    employee_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    record_count = db.Column(db.Integer, nullable=False, default=0)
+    regular_hours = db.Column(db.Float, nullable=False, default=0)
+    overtime_hours = db.Column(db.Float, nullable=False, default=0)
+    gross_pay = db.Column(db.Float, nullable=False, default=0)
+
+class SchemaVersion(db.Model):
+    __tablename__ = 'schema_version'
+    
+    version = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    description = db.Column(db.String(200), nullable=False)
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
 
 def init_db():
     """Initialize the database with required tables and admin user."""
@@ -82,36 +228,244 @@ def init_db():
     db.create_all()
     
     # Check if admin user exists
-    admin_user = User.query.filter_by(username=Config.ADMIN_USERNAME).first()
+    admin_user = query_db("SELECT id FROM users WHERE username = ?", (Config.ADMIN_USERNAME,), one=True)
     
     if not admin_user:
         # Create default admin user
-        admin_user = User(
-            username=Config.ADMIN_USERNAME,
-            is_admin=True
+        from app.passwords import hash_password
+        execute_db(
+            "INSERT INTO users (username, password, is_admin) VALUES (?, ?, ?)",
+            (Config.ADMIN_USERNAME, hash_password(Config.ADMIN_PASSWORD), True)
         )
-        admin_user.set_password(Config.ADMIN_PASSWORD)
-        
-        db.session.add(admin_user)
-        db.session.commit()
         print(f"Admin user '{Config.ADMIN_USERNAME}' created successfully!")
     else:
         print(f"Admin user '{Config.ADMIN_USERNAME}' already exists!")
     
     print("Database initialization completed!")
 
+# Column names that SQLite hands back as plain strings. Typing them keeps
+# rows identical to what PostgreSQL returns (date/datetime objects).
+RESULT_TYPES = {
+    'date': db.Date,
+    'start_date': db.Date,
+    'end_date': db.Date,
+    'date_created': db.DateTime,
+    'month': db.Date,
+    'created_at': db.DateTime,
+    'started_at': db.DateTime,
+    'finished_at': db.DateTime,
+    'period_start': db.Date,
+    'period_end': db.Date,
+    'effective_from': db.Date,
+}
+
+# Matches a quoted string literal or a bare qmark placeholder
+_PLACEHOLDER = re.compile(r"'(?:[^']|'')*'|\?")
+
+# A single-row INSERT ... VALUES statement, capturing the table name
+_VALUES_INSERT = re.compile(r'\s*INSERT\s+INTO\s+(\w+)\b(?:(?!\bSELECT\b).)*\bVALUES\b', re.I | re.S)
+
+# g.db_replica once a read_replica() block has settled on the primary
+_PRIMARY = 'primary'
+
+class Row(dict):
+    """A result row with key, attribute and positional access."""
+    
+    def __getitem__(self, key):
+        if isinstance(key, int):
+            return list(self.values())[key]
+        return dict.__getitem__(self, key)
+    
+    def __getattr__(self, name):
+        try:
+            return dict.__getitem__(self, name)
+        except KeyError:
+            raise AttributeError(name)
+
+@lru_cache(maxsize=256)
+def _statement(query, typed):
+    """Compile a SQL string once and reuse it for every later call."""
+    statement = text(query)
+    if typed:
+        statement = statement.columns(**RESULT_TYPES)
+    return statement
+
+def _bind(query, args):
+    """Turn qmark placeholders into named binds SQLAlchemy renders per dialect."""
+    if isinstance(args, Mapping):
+        return query, dict(args)
+    args = list(args)
+    params = {}
+    
+    def replace(match):
+        if match.group(0) != '?':
+            return match.group(0)
+        name = f'p{len(params)}'
+        params[name] = args[len(params)]
+        return f':{name}'
+    
+    return _PLACEHOLDER.sub(replace, query), params
+
+@contextmanager
+def read_replica():
+    """Let the reads in the block go to the read replica, if one is configured.
+    
+    Only for reports and listings that can be a few seconds stale; reads
+    inside transaction() and all writes stay on the primary. The source is
+    picked once for the whole block, so its reads see one point in time
+    unless the replica fails midway. See app/replica.py for when the
+    primary is picked.
+    """
+    if g.get('db_replica'):
+        yield
+        return
+    g.db_replica = True
+    try:
+        yield
+    finally:
+        g.pop('db_replica', None)
+
+def _replica():
+    """The replica the next read should use, or None for the primary."""
+    routed = g.get('db_replica')
+    if not routed or g.get('db_conn') is not None:
+        return None
+    if routed is True:
+        replica = current_app.extensions.get('db_replica')
+        routed = g.db_replica = replica if replica is not None and replica.route() else _PRIMARY
+    return None if routed is _PRIMARY else routed
+
+@contextmanager
+def _connection(replica=None):
+    """Yield the unit-of-work connection if one is open, else a pooled one."""
+    conn = g.get('db_conn')
+    if conn is not None:
+        yield conn
+        return
+    with (replica.engine if replica else db.engine).begin() as conn:
+        yield conn
+
+@contextmanager
+def transaction(long=False):
+    """Run several query_db/execute_db calls as a single unit of work.
+    
+    Everything inside the block shares one pooled connection and is
+    committed once on exit, or rolled back if the block raises. Nested
+    blocks join the outer transaction. On a tuned SQLite database the
+    block runs as a unit of the process's write queue (see app/sqlite.py);
+    pass long for blocks that write a lot, so they never join a group
+    commit.
+    """
+    if g.get('db_conn') is not None:
+        yield g.db_conn
+        return
+    writes = current_app.extensions.get('sqlite_writes')
+    with (writes.unit(long=long) if writes else db.engine.begin()) as conn:
+        g.db_conn = conn
+        try:
+            yield conn
+        finally:
+            g.pop('db_conn', None)
+    replica = current_app.extensions.get('db_replica')
+    if replica is not None:
+        replica.note_write()
+
 def query_db(query, args=(), one=False):
-    """Execute a query and return the results."""
-    db = get_db()
-    cursor = db.session.execute(query, args)
-    rv = cursor.fetchall()
-    cursor.close()
+    """Execute a query and return the results as Row objects.
+    
+    Placeholders may be qmark (?) with a sequence of args, or named
+    (:name) with a mapping.
+    """
+    query, params = _bind(query, args)
+    statement = _statement(query, True)
+    replica = _replica()
+    if replica is not None:
+        try:
+            with _connection(replica) as conn:
+                rv = [Row(row._mapping) for row in conn.execute(statement, params)]
+        except OperationalError as e:
+            replica.failed(e)
+            g.db_replica = _PRIMARY
+            replica = None
+    if replica is None:
+        with _connection() as conn:
+            rv = [Row(row._mapping) for row in conn.execute(statement, params)]
     return (rv[0] if rv else None) if one else rv
 
+def iter_query(query, args=(), batch_size=1000):
+    """Yield a query's rows as Row objects without loading them all.
+    
+    Rows are fetched from the cursor batch_size at a time, so memory does
+    not grow with the size of the result. The connection is held until
+    the generator is exhausted or closed.
+    """
+    query, params = _bind(query, args)
+    with _connection(_replica()) as conn:
+        result = conn.execution_options(stream_results=True).execute(_statement(query, True), params)
+        while True:
+            rows = result.fetchmany(batch_size)
+            if not rows:
+                break
+            for row in rows:
+                yield Row(row._mapping)
+
+def iter_batches(query, args=(), batch_size=50000):
+    """Yield a query's rows as lists of plain tuples, batch_size at a time.
+    
+    Skips building a Row per result and the result typing, for callers
+    that load numeric columns straight into arrays.
+    """
+    query, params = _bind(query, args)
+    with _connection(_replica()) as conn:
+        result = conn.execution_options(stream_results=True).execute(_statement(query, False), params)
+        while True:
+            rows = result.fetchmany(batch_size)
+            if not rows:
+                break
+            yield [tuple(row) for row in rows]
+
+def _needs_returning(query):
+    """Whether a single-row INSERT needs RETURNING id to report its new id.
+    
+    PostgreSQL has no cursor.lastrowid, so the id is fetched explicitly
+    for VALUES inserts into tables that have an id column.
+    """
+    if db.engine.dialect.name != 'postgresql' or 'RETURNING' in query.upper():
+        return False
+    match = _VALUES_INSERT.match(query)
+    if not match:
+        return False
+    table = db.metadata.tables.get(match.group(1))
+    return table is not None and 'id' in table.c
+
 def execute_db(query, args=()):
-    """Execute a query that modifies the database."""
-    db = get_db()
-    cursor = db.session.execute(query, args)
-    db.session.commit()
-    cursor.close()
-    return cursor.lastrowid 
\ No newline at end of file
+    """Execute a query that modifies the database.
+    
+    Outside of transaction() the statement is committed on its own.
+    Returns the new row id for INSERT ... VALUES statements and the
+    number of affected rows for anything else.
+    """
+    query, params = _bind(query, args)
+    returning = _needs_returning(query)
+    if returning:
+        query += ' RETURNING id'
+    with transaction() as conn:
+        result = conn.execute(_statement(query, False), params)
+        if returning:
+            return result.scalar()
+        if _VALUES_INSERT.match(query):
+            return result.lastrowid
+        return result.rowcount
+
+def execute_many(query, rows):
+    """Execute a statement once for each mapping of named binds in rows.
+    
+    The whole batch goes to the driver in one executemany call instead
+    of one round trip per row. Returns the number of rows sent.
+    """
+    rows = list(rows)
+    if not rows:
+        return 0
+    with transaction() as conn:
+        conn.execute(_statement(query, False), rows)
+    return len(rows)
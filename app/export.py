@@ -0,0 +1,88 @@
+"""Streaming exports of raw work records.
+
+Rows are read from a streaming cursor (database.iter_query) and encoded
+in batches, so an export is sent as it is read and a worker never holds
+more than one batch of it, however many rows match.
+"""
+import csv
+import io
+import json
+import zlib
+from app.database import iter_query, read_replica
+from app.rates import rate_sql
+
+# Rows encoded per chunk of the response
+BATCH_SIZE = 1000
+
+COLUMNS = ['id', 'employee_id', 'employee_name', 'hourly_rate', 'date', 'hours_worked', 'amount_earned']
+
+def export_rows(start_date, end_date, employee_id=None):
+    """Stream work records joined with their employee, oldest first, from the read replica.
+
+    hourly_rate is the rate in effect on each record's date.
+    """
+    query = f"""
+        SELECT wr.id, wr.employee_id, e.name AS employee_name,
+               COALESCE({rate_sql('wr.employee_id', 'wr.date')}, e.hourly_rate) AS hourly_rate,
+               wr.date, wr.hours_worked, wr.amount_earned
+        FROM work_records wr
+        JOIN employees e ON wr.employee_id = e.id
+        WHERE wr.date BETWEEN ? AND ?
+    """
+    params = [start_date, end_date]
+
+    if employee_id is not None:
+        query += " AND wr.employee_id = ?"
+        params.append(employee_id)
+
+    query += " ORDER BY wr.date, wr.id"
+    with read_replica():
+        yield from iter_query(query, params, batch_size=BATCH_SIZE)
+
+def _batches(rows):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == BATCH_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def csv_chunks(rows):
+    """Encode rows as CSV with a header line, one batch per chunk."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS)
+    yield buffer.getvalue().encode()
+    for batch in _batches(rows):
+        buffer.seek(0)
+        buffer.truncate()
+        for row in batch:
+            writer.writerow([row[column] for column in COLUMNS])
+        yield buffer.getvalue().encode()
+
+def ndjson_chunks(rows):
+    """Encode rows as newline-delimited JSON, one batch per chunk."""
+    for batch in _batches(rows):
+        lines = []
+        for row in batch:
+            record = {column: row[column] for column in COLUMNS}
+            record['date'] = record['date'].isoformat()
+            lines.append(json.dumps(record))
+        yield ('\n'.join(lines) + '\n').encode()
+
+def gzip_chunks(chunks, level=6):
+    """Compress a stream of byte chunks into a single gzip stream."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+# format -> (mimetype, encoder)
+FORMATS = {
+    'csv': ('text/csv', csv_chunks),
+    'ndjson': ('application/x-ndjson', ndjson_chunks),
+}
@@ -0,0 +1,108 @@
+"""Request-scoped user loading for Flask-Login.
+
+load_user() runs on every authenticated request. It builds a light
+CurrentUser from a short-lived copy of the user's name, role and employee
+id kept in the signed session cookie, so most requests load the user
+without touching the database. When the copy is missing or older than
+IDENTITY_CACHE_SECONDS, the user and their employee row are read with a
+single join and the copy is refreshed.
+
+current_user.employee is the employee row, read at most once per request
+and already there on the join path, so routes no longer query employees
+for the logged-in user themselves.
+
+A role change or a deleted account takes effect within
+IDENTITY_CACHE_SECONDS; 0 reads the database on every request.
+"""
+import time
+from flask import current_app, session
+from flask_login import UserMixin
+from app.database import query_db, Row
+
+SESSION_KEY = '_identity'
+
+_NOT_LOADED = object()
+
+class CurrentUser(UserMixin):
+    """The logged-in user, as loaded for one request."""
+
+    def __init__(self, id, username, is_admin, employee_id, employee=_NOT_LOADED):
+        self.id = id
+        self.username = username
+        self.is_admin = bool(is_admin)
+        self.employee_id = employee_id
+        self._employee = employee
+
+    def get_id(self):
+        return str(self.id)
+
+    @property
+    def employee(self):
+        """The user's employees row, or None for an admin."""
+        if self._employee is _NOT_LOADED:
+            self._employee = None
+            if self.employee_id is not None:
+                self._employee = query_db(
+                    "SELECT * FROM employees WHERE id = ?",
+                    (self.employee_id,),
+                    one=True
+                )
+                if self._employee is None:
+                    # Deleted since the identity was cached; read it
+                    # again on the next request
+                    forget()
+        return self._employee
+
+def _remember(user):
+    session[SESSION_KEY] = {
+        'id': user.id,
+        'username': user.username,
+        'is_admin': user.is_admin,
+        'employee_id': user.employee_id,
+        'loaded_at': int(time.time()),
+    }
+
+def _cached(user_id):
+    identity = session.get(SESSION_KEY)
+    max_age = current_app.config['IDENTITY_CACHE_SECONDS']
+    if not identity or identity.get('id') != user_id:
+        return None
+    if time.time() - identity.get('loaded_at', 0) >= max_age:
+        return None
+    return CurrentUser(identity['id'], identity['username'], identity['is_admin'], identity['employee_id'])
+
+def load_user(user_id):
+    """Return the CurrentUser for a session's user id, or None."""
+    try:
+        user_id = int(user_id)
+    except (TypeError, ValueError):
+        return None
+
+    user = _cached(user_id)
+    if user is not None:
+        return user
+
+    row = query_db("""
+        SELECT u.id, u.username, u.is_admin, u.employee_id,
+               e.id AS e_id, e.name AS e_name, e.hourly_rate AS e_hourly_rate, e.user_id AS e_user_id
+        FROM users u
+        LEFT JOIN employees e ON e.id = u.employee_id
+        WHERE u.id = ?
+    """, (user_id,), one=True)
+    if row is None:
+        forget()
+        return None
+
+    employee = None
+    if row['e_id'] is not None:
+        employee = Row(
+            id=row['e_id'], name=row['e_name'], hourly_rate=row['e_hourly_rate'], user_id=row['e_user_id']
+        )
+    user = CurrentUser(row['id'], row['username'], row['is_admin'], row['employee_id'], employee)
+    if current_app.config['IDENTITY_CACHE_SECONDS'] > 0:
+        _remember(user)
+    return user
+
+def forget():
+    """Drop the cached identity, e.g. on logout."""
+    session.pop(SESSION_KEY, None)
@@ -0,0 +1,171 @@
+"""Background report generation.
+
+The generate_report routes insert a row into report_jobs, hand the job id
+to a local process pool and return straight away. A pool worker claims
+the job, builds the PDF, saves it to the report store and marks the job
+done. Clients poll the job until it has a report_id to download.
+
+No broker is involved: the job table is the source of truth. A queued job
+whose worker went away is resubmitted when it is polled, and a job that
+has been running for longer than REPORT_JOB_TIMEOUT is marked failed.
+
+Identical requests are deduplicated through app/report_cache.py: a request
+for a report that is already being built joins the existing job.
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+from flask import current_app
+from app.database import query_db, execute_db, transaction, read_replica
+from app import storage, report_cache, metrics
+from app.report_engine import build_report
+
+_executor = None
+_executor_lock = threading.Lock()
+
+# The Flask app of a pool worker process, created by _init_worker()
+_worker_app = None
+
+def _init_worker():
+    global _worker_app
+    from app import create_app
+    _worker_app = create_app()
+
+def _reset_after_fork():
+    # Pool threads and processes stay with the parent of a forked worker
+    global _executor, _executor_lock
+    _executor = None
+    _executor_lock = threading.Lock()
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+def _get_executor(reset=False):
+    global _executor
+    with _executor_lock:
+        if reset and _executor is not None:
+            _executor.shutdown(wait=False)
+            _executor = None
+        if _executor is None:
+            workers = current_app.config.get('REPORT_WORKERS', 2)
+            if current_app.config.get('REPORT_EXECUTOR') == 'thread':
+                _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='report')
+            else:
+                _executor = ProcessPoolExecutor(
+                    max_workers=workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_worker
+                )
+        return _executor
+
+def _submit(job_id):
+    # Thread workers share this process's app; process workers build their own
+    app = None
+    if current_app.config.get('REPORT_EXECUTOR') == 'thread':
+        app = current_app._get_current_object()
+    try:
+        _get_executor().submit(run_report_job, job_id, app)
+    except BrokenProcessPool:
+        _get_executor(reset=True).submit(run_report_job, job_id, app)
+
+def enqueue_report(source, employee_id, report_type, start_date, end_date, requested_by,
+                   file_format='pdf', fingerprint=None):
+    """Record a report job and start it in the background. Returns the job id.
+
+    source is the layout to use ('admin' or 'employee'), employee_id is
+    None for an all-employee report and file_format is one of
+    report_engine.FORMATS. If a job with the same fingerprint is already
+    queued or running, its id is returned instead of starting another.
+    """
+    if fingerprint:
+        pending = report_cache.find_pending_job(fingerprint)
+        if pending:
+            return pending
+
+    job_id = execute_db(
+        """INSERT INTO report_jobs
+           (status, source, requested_by, employee_id, report_type, file_format,
+            start_date, end_date, fingerprint, created_at)
+           VALUES ('queued', ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+        (source, requested_by, employee_id, report_type, file_format,
+         start_date, end_date, fingerprint, datetime.utcnow())
+    )
+    _submit(job_id)
+    return job_id
+
+def get_job(job_id):
+    return query_db("SELECT * FROM report_jobs WHERE id = ?", (job_id,), one=True)
+
+def poll_job(job):
+    """Return a job row, from get_job(), for a status check.
+
+    A job whose worker is gone is resubmitted or marked timed out first, so
+    check that the caller may see the job before polling it.
+    """
+    job_id = job['id']
+    now = datetime.utcnow()
+    stale = timedelta(seconds=current_app.config.get('REPORT_JOB_STALE_SECONDS', 60))
+    timeout = timedelta(seconds=current_app.config.get('REPORT_JOB_TIMEOUT', 600))
+
+    if job['status'] == 'queued' and job['created_at'] < now - stale:
+        # Claiming is atomic, so a duplicate submit can never run it twice
+        _submit(job_id)
+    elif job['status'] == 'running' and job['started_at'] < now - timeout:
+        execute_db(
+            "UPDATE report_jobs SET status = 'failed', error = ?, finished_at = ? WHERE id = ? AND status = 'running'",
+            ('Report generation timed out', now, job_id)
+        )
+        job = get_job(job_id)
+    return job
+
+def _build(job):
+    with metrics.timed('report'):
+        return build_report(job['source'], job['employee_id'], job['report_type'],
+                            job['start_date'], job['end_date'], job['file_format'])
+
+def run_report_job(job_id, app=None):
+    """Claim a queued job, build its report and store the result."""
+    app = app or _worker_app
+    with app.app_context():
+        claimed = execute_db(
+            "UPDATE report_jobs SET status = 'running', started_at = ? WHERE id = ? AND status = 'queued'",
+            (datetime.utcnow(), job_id)
+        )
+        if not claimed:
+            return
+
+        job = get_job(job_id)
+        try:
+            # Taken before reading the data, so a write during the build
+            # leaves the report with an older, never again matching stamp.
+            # Both come from the read replica, or both from the primary
+            with read_replica():
+                fingerprint = report_cache.report_fingerprint(
+                    job['source'], job['employee_id'], job['report_type'],
+                    job['start_date'], job['end_date'], job['file_format']
+                )
+                output = _build(job)
+            try:
+                content_hash, content_size = storage.store(output)
+            finally:
+                output.close()
+            with transaction():
+                report_id = execute_db(
+                    """INSERT INTO reports
+                       (employee_id, report_type, file_format, start_date, end_date,
+                        content, content_hash, content_size, fingerprint)
+                       VALUES (?, ?, ?, ?, ?, '', ?, ?, ?)""",
+                    (job['employee_id'], job['report_type'], job['file_format'], job['start_date'],
+                     job['end_date'], content_hash, content_size, fingerprint)
+                )
+                execute_db(
+                    "UPDATE report_jobs SET status = 'done', report_id = ?, finished_at = ? WHERE id = ?",
+                    (report_id, datetime.utcnow(), job_id)
+                )
+        except Exception as e:
+            execute_db(
+                "UPDATE report_jobs SET status = 'failed', error = ?, finished_at = ? WHERE id = ?",
+                (str(e), datetime.utcnow(), job_id)
+            )
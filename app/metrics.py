@@ -0,0 +1,242 @@
+"""Request timing and SQL profiling.
+
+init_metrics() hooks into the app, Jinja and SQLAlchemy so that every
+request records its wall time, the number and time of the SQL statements
+it ran and the time spent rendering templates. Totals are kept per
+endpoint in this process and served in the Prometheus text format by
+render() at /metrics.
+
+With METRICS_SERVER_TIMING on, every response also carries the figures of
+its own request in a Server-Timing header, which browser dev tools show
+next to the network timings.
+
+A statement slower than SLOW_QUERY_SECONDS is logged with the endpoint it
+ran for and its parameterized SQL; bound values are left out of the log.
+
+Other slow steps can be timed with `with timed('name'):`. Work outside a
+request, such as report jobs on the thread executor, is counted under the
+endpoint 'background'. Every gunicorn worker keeps its own totals, so a
+scrape reports the worker that answered it.
+"""
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from flask import current_app, g, has_request_context, request
+from jinja2 import Template
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+BACKGROUND = 'background'
+
+# Upper bounds of the request duration histogram buckets, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_lock = threading.Lock()
+_requests = {}     # (endpoint, status) -> requests
+_durations = {}    # endpoint -> [count per bucket..., count above the last, total seconds]
+_spans = {}        # (endpoint, span) -> [count, seconds]
+_slow_queries = {}  # endpoint -> slow statements
+
+_settings = {'enabled': False, 'slow_query_seconds': None, 'server_timing': False}
+
+# Transaction control that app/sqlite.py and nested transactions send as
+# statements; it is not a query and is left out of the SQL figures
+_TRANSACTION_CONTROL = ('BEGIN', 'SAVEPOINT', 'RELEASE', 'ROLLBACK TO')
+
+class TimedTemplate(Template):
+    """A Jinja template that counts its render time as the 'template' span."""
+
+    def render(self, *args, **kwargs):
+        with timed('template'):
+            return super().render(*args, **kwargs)
+
+def _endpoint():
+    if has_request_context():
+        return request.endpoint or 'unmatched'
+    return BACKGROUND
+
+def _add(span, seconds):
+    if not _settings['enabled']:
+        return
+    if has_request_context() and '_timings' in g:
+        entry = g._timings.setdefault(span, [0, 0.0])
+        entry[0] += 1
+        entry[1] += seconds
+        return
+    with _lock:
+        entry = _spans.setdefault((BACKGROUND, span), [0, 0.0])
+        entry[0] += 1
+        entry[1] += seconds
+
+@contextmanager
+def timed(span):
+    """Count the time spent in the block under span for the current request."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        _add(span, time.perf_counter() - started)
+
+def is_query(statement):
+    """False for the transaction control statements left out of the SQL figures."""
+    return not statement.lstrip()[:12].upper().startswith(_TRANSACTION_CONTROL)
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if not is_query(statement):
+        return
+    conn.info.setdefault('metrics_started', []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if not is_query(statement):
+        return
+    seconds = time.perf_counter() - conn.info['metrics_started'].pop()
+    _add('sql', seconds)
+    limit = _settings['slow_query_seconds']
+    if limit is not None and seconds >= limit:
+        endpoint = _endpoint()
+        with _lock:
+            _slow_queries[endpoint] = _slow_queries.get(endpoint, 0) + 1
+        logger.warning('Slow query (%.3fs) in %s: %s', seconds, endpoint, ' '.join(statement.split()))
+
+def _handle_error(context):
+    if context.statement is None or not is_query(context.statement):
+        return
+    started = context.connection.info.get('metrics_started') if context.connection else None
+    if started:
+        started.pop()
+
+def _start_request():
+    g._started = time.perf_counter()
+    g._timings = {}
+
+def _record(status):
+    """Add the current request to the totals, once; return its wall time."""
+    seconds = time.perf_counter() - g.pop('_started')
+    endpoint = _endpoint()
+    with _lock:
+        key = (endpoint, status)
+        _requests[key] = _requests.get(key, 0) + 1
+        histogram = _durations.setdefault(endpoint, [0] * (len(BUCKETS) + 1) + [0.0])
+        histogram[next((n for n, bound in enumerate(BUCKETS) if seconds <= bound), len(BUCKETS))] += 1
+        histogram[-1] += seconds
+        for span, (count, span_seconds) in g._timings.items():
+            entry = _spans.setdefault((endpoint, span), [0, 0.0])
+            entry[0] += count
+            entry[1] += span_seconds
+    return seconds
+
+def _finish_request(response):
+    if '_started' not in g:
+        return response
+    seconds = _record(response.status_code)
+
+    if _settings['server_timing']:
+        timings = [f'app;dur={seconds * 1000:.1f}']
+        for span, (count, span_seconds) in g._timings.items():
+            description = f';desc="{count} queries"' if span == 'sql' else ''
+            timings.append(f'{span}{description};dur={span_seconds * 1000:.1f}')
+        response.headers.add('Server-Timing', ', '.join(timings))
+    return response
+
+def _teardown_request(exc):
+    # A request that raised past the error handlers, or failed in an
+    # after_request hook, never reached _finish_request
+    if '_started' in g:
+        _record(500)
+
+def init_metrics(app):
+    """Start recording request, SQL and template timings for app."""
+    if not app.config['METRICS_ENABLED']:
+        return
+    _settings.update(
+        enabled=True,
+        slow_query_seconds=app.config['SLOW_QUERY_SECONDS'],
+        server_timing=app.config['METRICS_SERVER_TIMING'],
+    )
+    # Engine events are registered on the class, once per process
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        event.listen(Engine, 'handle_error', _handle_error)
+    app.jinja_env.template_class = TimedTemplate
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    app.teardown_request(_teardown_request)
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _metric(lines, name, kind, help_text, samples):
+    lines.append(f'# HELP {name} {help_text}')
+    lines.append(f'# TYPE {name} {kind}')
+    for labels, value in samples:
+        label_text = ','.join(f'{key}="{_label(val)}"' for key, val in labels.items())
+        lines.append(f'{name}{{{label_text}}} {value}' if label_text else f'{name} {value}')
+
+def render():
+    """Return this process's metrics in the Prometheus text format."""
+    from app import cache, passwords
+
+    with _lock:
+        requests = sorted(_requests.items())
+        durations = sorted((endpoint, list(histogram)) for endpoint, histogram in _durations.items())
+        spans = sorted((key, list(entry)) for key, entry in _spans.items())
+        slow_queries = sorted(_slow_queries.items())
+
+    lines = []
+    _metric(lines, 'payroll_requests_total', 'counter', 'Requests handled, by endpoint and status.',
+            [({'endpoint': endpoint, 'status': status}, count) for (endpoint, status), count in requests])
+
+    lines.append('# HELP payroll_request_duration_seconds Request wall time.')
+    lines.append('# TYPE payroll_request_duration_seconds histogram')
+    for endpoint, histogram in durations:
+        label = _label(endpoint)
+        cumulative = 0
+        for bound, count in zip(BUCKETS + ('+Inf',), histogram[:-1]):
+            cumulative += count
+            lines.append(f'payroll_request_duration_seconds_bucket{{endpoint="{label}",le="{bound}"}} {cumulative}')
+        lines.append(f'payroll_request_duration_seconds_sum{{endpoint="{label}"}} {histogram[-1]:.6f}')
+        lines.append(f'payroll_request_duration_seconds_count{{endpoint="{label}"}} {cumulative}')
+
+    by_kind = {'sql': [], 'template': [], 'other': []}
+    for (endpoint, span), entry in spans:
+        by_kind[span if span in by_kind else 'other'].append((endpoint, span, entry))
+    _metric(lines, 'payroll_sql_queries_total', 'counter', 'SQL statements run, by endpoint.',
+            [({'endpoint': endpoint}, count) for endpoint, _, (count, _) in by_kind['sql']])
+    _metric(lines, 'payroll_sql_seconds_total', 'counter', 'Time spent in SQL statements, by endpoint.',
+            [({'endpoint': endpoint}, f'{seconds:.6f}') for endpoint, _, (_, seconds) in by_kind['sql']])
+    _metric(lines, 'payroll_sql_slow_queries_total', 'counter', 'SQL statements slower than SLOW_QUERY_SECONDS.',
+            [({'endpoint': endpoint}, count) for endpoint, count in slow_queries])
+    _metric(lines, 'payroll_template_seconds_total', 'counter', 'Time spent rendering templates, by endpoint.',
+            [({'endpoint': endpoint}, f'{seconds:.6f}') for endpoint, _, (_, seconds) in by_kind['template']])
+    _metric(lines, 'payroll_span_seconds_total', 'counter', 'Time spent in other timed steps, by endpoint.',
+            [({'endpoint': endpoint, 'span': span}, f'{seconds:.6f}') for endpoint, span, (_, seconds) in by_kind['other']])
+
+    cache_stats = cache.get_stats()['fragments']
+    _metric(lines, 'payroll_cache_hits_total', 'counter', 'Dashboard cache hits, by fragment.',
+            [({'fragment': fragment}, counters['hits']) for fragment, counters in sorted(cache_stats.items())])
+    _metric(lines, 'payroll_cache_misses_total', 'counter', 'Dashboard cache misses, by fragment.',
+            [({'fragment': fragment}, counters['misses']) for fragment, counters in sorted(cache_stats.items())])
+
+    login_stats = passwords.get_stats()
+    _metric(lines, 'payroll_password_checks_total', 'counter', 'Password checks, by result.',
+            [({'result': result}, login_stats[result]) for result in ('succeeded', 'failed', 'rejected')])
+    _metric(lines, 'payroll_password_checks_in_flight', 'gauge', 'Password checks running or queued.',
+            [({}, login_stats['in_flight'])])
+
+    replica = current_app.extensions.get('db_replica')
+    if replica is not None:
+        replica_stats = replica.get_stats()
+        _metric(lines, 'payroll_replica_blocks_total', 'counter', 'read_replica() blocks, by the source they read from.',
+                [({'source': 'replica'}, replica_stats['routed'])]
+                + [({'source': 'primary', 'reason': reason}, replica_stats[f'fallback_{reason}'])
+                   for reason in ('lag', 'down', 'own_write')])
+        _metric(lines, 'payroll_replica_failures_total', 'counter', 'Replica queries or lag checks that failed.',
+                [({}, replica_stats['failures'])])
+        if replica_stats['lag_seconds'] is not None:
+            _metric(lines, 'payroll_replica_lag_seconds', 'gauge', 'Seconds the read replica was behind at its last check.',
+                    [({}, f"{replica_stats['lag_seconds']:.3f}")])
+    return '\n'.join(lines) + '\n'
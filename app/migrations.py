@@ -0,0 +1,126 @@
+"""Versioned schema migrations.
+
+db.create_all() only creates missing tables and never alters an existing
+one, so changes to deployed databases are listed here and applied in order
+by migrate.py. Each applied version is recorded in the schema_version table.
+
+A migration step is either a SQL string or a callable run inside the
+migration's transaction.
+"""
+from sqlalchemy import inspect
+from app.database import query_db, execute_db, transaction
+from app.rollups import rebuild_rollups, bump_all_versions
+from app.rates import backfill_rates
+from app import storage
+
+def add_column(table, column, ddl):
+    """Return a step that adds a column unless create_all already did."""
+    def step():
+        with transaction() as conn:
+            existing = {c['name'] for c in inspect(conn).get_columns(table)}
+            if column not in existing:
+                execute_db(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}")
+    step.__name__ = f'add_{table}_{column}'
+    return step
+
+def move_report_content():
+    """Move inline report PDFs into the content-addressed report store."""
+    while True:
+        batch = query_db(
+            "SELECT id, content FROM reports WHERE content_hash IS NULL AND content <> '' LIMIT 50"
+        )
+        if not batch:
+            break
+        for report in batch:
+            content = report['content']
+            if isinstance(content, str):
+                content = content.encode('latin-1')
+            content_hash, content_size = storage.store(content)
+            execute_db(
+                "UPDATE reports SET content_hash = ?, content_size = ?, content = '' WHERE id = ?",
+                (content_hash, content_size, report['id'])
+            )
+
+def widen_password_column():
+    """Make room for hashes longer than 120 characters, e.g. pbkdf2:sha512."""
+    with transaction() as conn:
+        # SQLite does not enforce VARCHAR lengths
+        if conn.dialect.name == 'postgresql':
+            execute_db("ALTER TABLE users ALTER COLUMN password TYPE VARCHAR(255)")
+
+MIGRATIONS = [
+    (1, 'Indexes for work record, report and user lookups', [
+        """CREATE INDEX IF NOT EXISTS ix_work_records_employee_date
+           ON work_records (employee_id, date, hours_worked, amount_earned)""",
+        """CREATE INDEX IF NOT EXISTS ix_work_records_date_id
+           ON work_records (date, id)""",
+        """CREATE INDEX IF NOT EXISTS ix_reports_employee_created
+           ON reports (employee_id, date_created)""",
+        """CREATE INDEX IF NOT EXISTS ix_reports_created
+           ON reports (date_created)""",
+        """CREATE INDEX IF NOT EXISTS ix_users_employee_id
+           ON users (employee_id)""",
+    ]),
+    (2, 'Index for keyset pagination of the employee list', [
+        """CREATE INDEX IF NOT EXISTS ix_employees_name_id
+           ON employees (name, id)""",
+    ]),
+    (3, 'Backfill the payroll rollup tables', [
+        rebuild_rollups,
+    ]),
+    (4, 'Move report PDFs into the content-addressed file store', [
+        add_column('reports', 'content_hash', 'VARCHAR(64)'),
+        add_column('reports', 'content_size', 'INTEGER'),
+        move_report_content,
+    ]),
+    (5, 'Fingerprints for reusing generated reports', [
+        add_column('reports', 'fingerprint', 'VARCHAR(64)'),
+        add_column('report_jobs', 'fingerprint', 'VARCHAR(64)'),
+        """CREATE INDEX IF NOT EXISTS ix_reports_fingerprint
+           ON reports (fingerprint)""",
+        """CREATE INDEX IF NOT EXISTS ix_report_jobs_fingerprint
+           ON report_jobs (fingerprint, status)""",
+        bump_all_versions,
+    ]),
+    (6, 'Output format of reports and report jobs', [
+        add_column('reports', 'file_format', "VARCHAR(10) NOT NULL DEFAULT 'pdf'"),
+        add_column('report_jobs', 'file_format', "VARCHAR(10) NOT NULL DEFAULT 'pdf'"),
+    ]),
+    (7, 'Backfill the effective-dated hourly rate history', [
+        backfill_rates,
+    ]),
+    (8, 'Widen users.password for longer password hashes', [
+        widen_password_column,
+    ]),
+]
+
+def current_version():
+    """Return the highest applied schema version, or 0 for a new database."""
+    row = query_db("SELECT COALESCE(MAX(version), 0) AS version FROM schema_version", one=True)
+    return row['version']
+
+def pending_migrations():
+    """Return the migrations that have not been applied yet."""
+    version = current_version()
+    return [m for m in MIGRATIONS if m[0] > version]
+
+def run_migrations():
+    """Apply every pending migration, one transaction per version."""
+    applied = []
+    for version, description, steps in pending_migrations():
+        with transaction():
+            for step in steps:
+                if callable(step):
+                    step()
+                else:
+                    execute_db(step)
+            execute_db(
+                "INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, CURRENT_TIMESTAMP)",
+                (version, description)
+            )
+        print(f"Applied migration {version}: {description}")
+        applied.append(version)
+    
+    if not applied:
+        print(f"Schema is up to date (version {current_version()})")
+    return applied
@@ -0,0 +1,171 @@
+"""Bulk onboarding of employees from a CSV or XLSX file.
+
+A file needs name and hourly_rate columns and may add username (defaults
+to the lower-cased name, as in admin.add_employee) and password (defaults
+to DEFAULT_PASSWORD). Rows are validated in one pass, usernames are
+checked against the users table with batched IN queries, and the slow
+PBKDF2 hashing is spread over a process pool.
+
+All accounts are then created in one transaction: users and employees are
+inserted with executemany, each employee (and its starting rate) finding
+its user by username, and users.employee_id is filled in by a single
+set-based UPDATE.
+"""
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from flask import current_app
+from app.database import query_db, execute_db, execute_many, transaction
+from app.passwords import hasher
+from app.bulk_import import read_rows
+from app.rates import FIRST_DAY, LOOKUP_SIZE
+from app.stats import invalidate_admin_dashboard, STATS_FRAGMENT, EMPLOYEES_FRAGMENT
+
+DEFAULT_PASSWORD = 'password123'
+
+REQUIRED_COLUMNS = ('name', 'hourly_rate')
+
+# Below this many passwords a pool costs more to start than it saves
+POOL_THRESHOLD = 8
+
+INSERT_USER = """
+    INSERT INTO users (username, password, is_admin)
+    VALUES (:username, :password, :is_admin)
+"""
+
+INSERT_EMPLOYEE = """
+    INSERT INTO employees (name, hourly_rate, user_id)
+    SELECT :name, :hourly_rate, id FROM users WHERE username = :username
+"""
+
+INSERT_RATE = """
+    INSERT INTO employee_rates (employee_id, effective_from, hourly_rate)
+    SELECT e.id, :effective_from, e.hourly_rate
+    FROM employees e JOIN users u ON e.user_id = u.id
+    WHERE u.username = :username
+"""
+
+LINK_USERS = """
+    UPDATE users SET employee_id = (
+        SELECT e.id FROM employees e WHERE e.user_id = users.id
+    )
+    WHERE employee_id IS NULL
+      AND EXISTS (SELECT 1 FROM employees e WHERE e.user_id = users.id)
+"""
+
+def read_employee_rows(stream, filename):
+    """Yield (line_number, row) pairs from an onboarding CSV or XLSX file.
+
+    Raises ValueError if a required column is missing or an XLSX file
+    cannot be opened.
+    """
+    return read_rows(stream, filename, REQUIRED_COLUMNS)
+
+def parse_row(row):
+    """Return (name, hourly_rate, username, password), or raise ValueError."""
+    name = str(row.get('name') or '').strip()
+    if not name:
+        raise ValueError('name is required')
+
+    try:
+        hourly_rate = float(row.get('hourly_rate'))
+    except (TypeError, ValueError):
+        raise ValueError('hourly_rate must be a number')
+    if hourly_rate <= 0:
+        raise ValueError('hourly_rate must be greater than 0')
+
+    username = str(row.get('username') or '').strip() or name.lower()
+    password = str(row.get('password') or '') or DEFAULT_PASSWORD
+    return name, hourly_rate, username, password
+
+def existing_usernames(usernames):
+    """Return the subset of usernames already taken."""
+    usernames = sorted(usernames)
+    taken = set()
+    for start in range(0, len(usernames), LOOKUP_SIZE):
+        chunk = usernames[start:start + LOOKUP_SIZE]
+        rows = query_db(
+            f"SELECT username FROM users WHERE username IN ({', '.join('?' * len(chunk))})",
+            chunk
+        )
+        taken.update(row['username'] for row in rows)
+    return taken
+
+def hash_passwords(passwords):
+    """Hash passwords in parallel, returning hashes in the same order."""
+    passwords = list(passwords)
+    workers = current_app.config.get('PASSWORD_HASH_WORKERS') or os.cpu_count() or 1
+    workers = min(workers, len(passwords))
+    hash_password = hasher()
+    if workers < 2 or len(passwords) < POOL_THRESHOLD:
+        return [hash_password(password) for password in passwords]
+
+    with ProcessPoolExecutor(max_workers=workers,
+                             mp_context=multiprocessing.get_context('spawn')) as pool:
+        chunksize = max(1, len(passwords) // (workers * 4))
+        return list(pool.map(hash_password, passwords, chunksize=chunksize))
+
+def onboard_employees(rows, skip_invalid=False):
+    """Validate rows from read_employee_rows() and create the accounts.
+
+    Returns a dict with the number of rows read and created, the created
+    usernames, a list of {'line', 'error'} entries and the time taken.
+    Nothing is created if any row is invalid, unless skip_invalid is set.
+    """
+    started = time.perf_counter()
+    total = 0
+    parsed = []
+    errors = []
+    seen = set()
+    for line, row in rows:
+        total += 1
+        try:
+            name, hourly_rate, username, password = parse_row(row)
+        except ValueError as e:
+            errors.append({'line': line, 'error': str(e)})
+            continue
+        if username in seen:
+            errors.append({'line': line, 'error': f'Username {username} appears more than once'})
+            continue
+        seen.add(username)
+        parsed.append((line, name, hourly_rate, username, password))
+
+    taken = existing_usernames(seen)
+    accounts = []
+    for line, name, hourly_rate, username, password in parsed:
+        if username in taken:
+            errors.append({'line': line, 'error': f'An employee with username {username} already exists'})
+            continue
+        accounts.append((name, hourly_rate, username, password))
+    errors.sort(key=lambda error: error['line'])
+
+    created = []
+    if accounts and (skip_invalid or not errors):
+        hashes = hash_passwords(password for _, _, _, password in accounts)
+        with transaction(long=True):
+            execute_many(INSERT_USER, [
+                {'username': username, 'password': password_hash, 'is_admin': False}
+                for (_, _, username, _), password_hash in zip(accounts, hashes)
+            ])
+            execute_many(INSERT_EMPLOYEE, [
+                {'name': name, 'hourly_rate': hourly_rate, 'username': username}
+                for name, hourly_rate, username, _ in accounts
+            ])
+            execute_many(INSERT_RATE, [
+                {'effective_from': FIRST_DAY, 'username': username}
+                for _, _, username, _ in accounts
+            ])
+            execute_db(LINK_USERS)
+        invalidate_admin_dashboard(STATS_FRAGMENT, EMPLOYEES_FRAGMENT)
+        created = [username for _, _, username, _ in accounts]
+
+    seconds = time.perf_counter() - started
+    return {
+        'rows': total,
+        'created': len(created),
+        'usernames': created,
+        'errors': errors,
+        'seconds': round(seconds, 3),
+        'rows_per_second': round(total / seconds) if seconds else 0,
+    }
@@ -0,0 +1,85 @@
+"""Keyset (cursor) pagination for the listing pages.
+
+A cursor holds the sort key of the last row on a page, so the next page is
+an index seek on that key instead of an OFFSET scan. Every page costs the
+same no matter how far back into the history it is.
+"""
+import base64
+import json
+from datetime import date, datetime
+from app.database import query_db
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+def get_page_size(args):
+    """Read the per_page argument, clamped to 1..MAX_PAGE_SIZE."""
+    try:
+        size = int(args.get('per_page', DEFAULT_PAGE_SIZE))
+    except (TypeError, ValueError):
+        return DEFAULT_PAGE_SIZE
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+def encode_cursor(values):
+    """Encode the sort key of a row as an opaque URL-safe token."""
+    values = [v.isoformat() if isinstance(v, (date, datetime)) else v for v in values]
+    raw = json.dumps(values, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor, parsers):
+    """Decode a cursor token, or return None if it is missing or invalid."""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+        if len(values) != len(parsers):
+            return None
+        return [parse(value) for parse, value in zip(parsers, values)]
+    except (ValueError, TypeError):
+        return None
+
+def keyset_page(query, where, params, keys, cursor=None, page_size=DEFAULT_PAGE_SIZE, descending=True):
+    """Fetch one page of a query ordered by a unique key.
+
+    query is a SELECT without WHERE/ORDER BY clauses, where a list of SQL
+    conditions using named binds from params. keys is a list of
+    (sql_expression, row_key, parser) tuples ending in a unique column.
+    Returns (rows, next_cursor); next_cursor is None on the last page.
+    """
+    where = list(where)
+    params = dict(params)
+
+    values = decode_cursor(cursor, [parse for _, _, parse in keys])
+    if values is not None:
+        names = [f'cursor_{i}' for i in range(len(keys))]
+        operator = '<' if descending else '>'
+        where.append('({}) {} ({})'.format(
+            ', '.join(expr for expr, _, _ in keys),
+            operator,
+            ', '.join(':' + name for name in names)
+        ))
+        params.update(zip(names, values))
+
+    if where:
+        query += ' WHERE ' + ' AND '.join(where)
+    direction = 'DESC' if descending else 'ASC'
+    query += ' ORDER BY ' + ', '.join(f'{expr} {direction}' for expr, _, _ in keys)
+    query += ' LIMIT :page_limit'
+
+    # One extra row tells us whether there is a next page
+    params['page_limit'] = page_size + 1
+    rows = query_db(query, params)
+
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = encode_cursor([rows[-1][key] for _, key, _ in keys])
+    return rows, next_cursor
+
+def serialize_row(row):
+    """Make a row JSON friendly, with ISO formatted dates."""
+    return {
+        key: value.isoformat() if isinstance(value, (date, datetime)) else value
+        for key, value in row.items()
+    }
@@ -0,0 +1,283 @@
+"""Password hashing policy and pooled verification.
+
+New hashes use PASSWORD_HASH_METHOD and PASSWORD_SALT_LENGTH. A stored hash
+made under an older policy still verifies, and is replaced with one under
+the current policy the next time its owner logs in with the right
+password, so raising the cost needs no reset.
+
+Checking a password costs a full PBKDF2 run, which at shift change adds
+up to every gunicorn worker hashing at once while dashboards wait. Checks
+therefore run on a small pool of PASSWORD_VERIFY_WORKERS per process, and
+at most PASSWORD_VERIFY_LIMIT of them may be running or queued per process.
+On top of that only PASSWORD_VERIFY_HOST_LIMIT checks hash at once on the
+whole host, whatever the number of workers or their class: the slots are
+lock files shared by every process, so the sync workers of the shipped
+`gunicorn run:app` count against the same limit, and a worker that dies
+frees its slot. A login that gets no slot within PASSWORD_VERIFY_TIMEOUT
+seconds is turned away with VerifierBusy rather than piling up.
+
+Counters and the recent check rate are kept per process, see get_stats().
+"""
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from flask import current_app
+from sqlalchemy.exc import SQLAlchemyError
+from werkzeug.security import generate_password_hash, check_password_hash, DEFAULT_PBKDF2_ITERATIONS
+from app.database import query_db, execute_db
+
+try:
+    import fcntl
+except ImportError:  # Windows: the host limit only bounds each process
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Seconds of checks behind checks_per_minute
+RATE_WINDOW = 60
+
+class VerifierBusy(Exception):
+    """Too many password checks are already running or queued."""
+
+_executor = None
+_slots = None
+_host_slots = None
+_executor_lock = threading.Lock()
+
+_stats_lock = threading.Lock()
+_stats = {
+    'checks': 0,
+    'succeeded': 0,
+    'failed': 0,
+    'rejected': 0,
+    'rehashed': 0,
+    'rehash_failed': 0,
+    'in_flight': 0,
+    'peak_in_flight': 0,
+    'hashes': 0,
+    'wait_seconds': 0.0,
+    'hash_seconds': 0.0,
+}
+_recent = deque()
+
+def hasher(config=None):
+    """Return a picklable function hashing a password under the current policy."""
+    config = config or current_app.config
+    return partial(
+        generate_password_hash,
+        method=config['PASSWORD_HASH_METHOD'],
+        salt_length=config['PASSWORD_SALT_LENGTH']
+    )
+
+def hash_password(password):
+    """Hash a password under the current policy, in the calling thread."""
+    return hasher()(password)
+
+def _normalize(method):
+    """Spell out the digest and iterations werkzeug fills in for pbkdf2."""
+    parts = method.split(':')
+    if parts[0] == 'pbkdf2':
+        if len(parts) == 1:
+            parts.append('sha256')
+        if len(parts) == 2:
+            parts.append(str(DEFAULT_PBKDF2_ITERATIONS))
+    return ':'.join(parts)
+
+def needs_rehash(pwhash):
+    """True if pwhash was made under a different method or a shorter salt."""
+    if pwhash.count('$') < 2:
+        return True
+    method, salt, _ = pwhash.split('$', 2)
+    config = current_app.config
+    return (_normalize(method) != _normalize(config['PASSWORD_HASH_METHOD'])
+            or len(salt) < config['PASSWORD_SALT_LENGTH'])
+
+def _check(pwhash, password, rehash=None):
+    """Pool task: verify password, and hash it again with rehash if it matches."""
+    if not check_password_hash(pwhash, password):
+        return False, None
+    return True, rehash(password) if rehash else None
+
+class HostSlots:
+    """Hashing slots shared by every process on the host.
+
+    A slot is a lock file under directory, held with flock for as long as a
+    check hashes. Workers forked by gunicorn, and separate gunicorn
+    processes, take from the same slots, and the kernel frees a slot when
+    the process holding it dies. Threads of one process first take one of
+    its own at most limit slots, so they do not spin on each other's locks.
+    """
+
+    POLL_SECONDS = 0.005
+
+    def __init__(self, directory, limit):
+        self.paths = [os.path.join(directory, f'slot-{n}.lock') for n in range(limit)]
+        self.local = threading.BoundedSemaphore(limit)
+        if fcntl is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def acquire(self, timeout):
+        """Take a slot within timeout seconds; returns its handle, or None."""
+        deadline = time.monotonic() + timeout
+        if not self.local.acquire(timeout=max(timeout, 0)):
+            return None
+        if fcntl is None:
+            return True
+        while True:
+            for path in self.paths:
+                handle = open(path, 'a')
+                try:
+                    fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    handle.close()
+                else:
+                    return handle
+            if time.monotonic() >= deadline:
+                self.local.release()
+                return None
+            time.sleep(self.POLL_SECONDS)
+
+    def release(self, handle):
+        if handle is not True:
+            # Closing the file drops its lock
+            handle.close()
+        self.local.release()
+
+def _reset_after_fork():
+    # Pool threads and processes, and the checks holding slots, stay with
+    # the parent of a forked worker
+    global _executor, _slots, _host_slots, _executor_lock
+    _executor = None
+    _slots = None
+    _host_slots = None
+    _executor_lock = threading.Lock()
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+def _get_executor(reset=False):
+    global _executor, _slots, _host_slots
+    with _executor_lock:
+        if reset and _executor is not None:
+            _executor.shutdown(wait=False)
+            _executor = None
+        if _executor is None:
+            config = current_app.config
+            workers = config['PASSWORD_VERIFY_WORKERS']
+            if config['PASSWORD_VERIFY_EXECUTOR'] == 'process':
+                _executor = ProcessPoolExecutor(
+                    max_workers=workers,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+            else:
+                _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password')
+            if _slots is None:
+                _slots = threading.BoundedSemaphore(max(config['PASSWORD_VERIFY_LIMIT'], workers))
+                # No more host slots than pool workers, so a check holding
+                # one never queues behind the pool
+                _host_slots = HostSlots(config['PASSWORD_VERIFY_LOCK_DIR'],
+                                        min(config['PASSWORD_VERIFY_HOST_LIMIT'], workers))
+        return _executor
+
+def _count(**changes):
+    with _stats_lock:
+        for name, value in changes.items():
+            _stats[name] += value
+        _stats['peak_in_flight'] = max(_stats['peak_in_flight'], _stats['in_flight'])
+
+def _run(task, *args):
+    """Run task on the pool within the concurrency limits and return its result."""
+    executor = _get_executor()
+    slots, host_slots = _slots, _host_slots
+    timeout = current_app.config['PASSWORD_VERIFY_TIMEOUT']
+    queued = time.perf_counter()
+    if not slots.acquire(timeout=timeout):
+        _count(rejected=1, wait_seconds=time.perf_counter() - queued)
+        raise VerifierBusy()
+    _count(in_flight=1)
+    try:
+        slot = host_slots.acquire(timeout - (time.perf_counter() - queued))
+        if slot is None:
+            _count(rejected=1, wait_seconds=time.perf_counter() - queued)
+            raise VerifierBusy()
+        started = time.perf_counter()
+        try:
+            try:
+                return executor.submit(task, *args).result()
+            except BrokenProcessPool:
+                return _get_executor(reset=True).submit(task, *args).result()
+        finally:
+            host_slots.release(slot)
+            _count(hashes=1, wait_seconds=started - queued,
+                   hash_seconds=time.perf_counter() - started)
+    finally:
+        slots.release()
+        _count(in_flight=-1)
+
+def verify_password(pwhash, password, rehash=False):
+    """Check password against pwhash on the pool.
+
+    With rehash, a matching password whose hash is out of policy is hashed
+    again in the same pool task. Returns (matches, new_hash); new_hash is
+    None unless it should replace pwhash. Raises VerifierBusy when no slot
+    frees up within PASSWORD_VERIFY_TIMEOUT.
+    """
+    upgrade = hasher() if rehash and needs_rehash(pwhash) else None
+    _count(checks=1)
+    with _stats_lock:
+        _recent.append(time.monotonic())
+    matches, new_hash = _run(_check, pwhash, password, upgrade)
+    _count(succeeded=int(matches), failed=int(not matches))
+    return matches, new_hash
+
+def authenticate(username, password):
+    """Return the users row for username if password is right, else None.
+
+    A hash made under an older policy is replaced on the way. If saving
+    the new hash fails the login still succeeds on the old one, and the
+    upgrade is tried again next time.
+    """
+    user = query_db("SELECT * FROM users WHERE username = ?", (username,), one=True)
+    if user is None:
+        return None
+    matches, new_hash = verify_password(user['password'], password, rehash=True)
+    if not matches:
+        return None
+    if new_hash:
+        try:
+            execute_db("UPDATE users SET password = ? WHERE id = ?", (new_hash, user['id']))
+        except SQLAlchemyError:
+            logger.exception('Saving the upgraded password hash of user %s failed', user['id'])
+            _count(rehash_failed=1)
+        else:
+            _count(rehashed=1)
+    return user
+
+def change_password(user_id, current_password, new_password):
+    """Set a user's password if current_password is right; returns whether it was."""
+    user = query_db("SELECT password FROM users WHERE id = ?", (user_id,), one=True)
+    if user is None or not verify_password(user['password'], current_password)[0]:
+        return False
+    execute_db(
+        "UPDATE users SET password = ? WHERE id = ?",
+        (_run(hasher(), new_password), user_id)
+    )
+    return True
+
+def get_stats():
+    """Return this process's password check counters and recent check rate."""
+    now = time.monotonic()
+    with _stats_lock:
+        while _recent and now - _recent[0] > RATE_WINDOW:
+            _recent.popleft()
+        stats = dict(_stats, checks_per_minute=len(_recent) * 60 / RATE_WINDOW)
+    tasks = stats['hashes']
+    stats['avg_wait_ms'] = round(stats.pop('wait_seconds') * 1000 / tasks, 2) if tasks else 0.0
+    stats['avg_hash_ms'] = round(stats.pop('hash_seconds') * 1000 / tasks, 2) if tasks else 0.0
+    stats['policy'] = current_app.config['PASSWORD_HASH_METHOD']
+    return stats
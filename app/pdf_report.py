@@ -0,0 +1,148 @@
+"""Streaming PDF rendering for tabular reports.
+
+A report is a title block followed by one table. Rather than building a
+single Table over every row, rows are pulled from an iterator (normally
+database.iter_query) and laid out one page at a time: each page gets its
+own fixed-width table with the header repeated, and the next page's table
+is only created once ReportLab has drawn the previous one. Layout work per
+page is constant and rows never pile up in memory.
+
+The PDF is written to a SpooledTemporaryFile that moves to disk once it
+grows past SPOOL_MAX_SIZE. The only thing that still grows with the
+report is ReportLab's list of finished (compressed) pages.
+"""
+from tempfile import SpooledTemporaryFile
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import letter
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from app.report_engine import SPOOL_MAX_SIZE
+
+# Padding a Frame keeps on each side
+FRAME_PADDING = 6
+
+_styles = getSampleStyleSheet()
+
+TITLE_STYLE = ParagraphStyle(
+    'CustomTitle',
+    parent=_styles['Heading1'],
+    fontSize=16,
+    spaceAfter=30
+)
+
+TEXT_STYLE = _styles['Normal']
+
+TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, 0), 12),
+    ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+    ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+    ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
+    ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+    ('FONTSIZE', (0, 1), (-1, -1), 10),
+    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ('GRID', (0, 0), (-1, -1), 1, colors.black)
+])
+
+_END = object()
+
+class _FlowableStream(list):
+    """A story list that refills itself from an iterator of flowables.
+
+    doc.build() only ever looks at the first few flowables, removes them
+    from the front and pushes split remainders back, so a short buffer
+    topped up on access is all it needs.
+    """
+
+    BUFFER = 4
+
+    def __init__(self, flowables):
+        super().__init__()
+        self._source = iter(flowables)
+
+    def _fill(self):
+        while self._source is not None and list.__len__(self) < self.BUFFER:
+            flowable = next(self._source, _END)
+            if flowable is _END:
+                self._source = None
+            else:
+                self.append(flowable)
+
+    def __len__(self):
+        self._fill()
+        return list.__len__(self)
+
+    def __getitem__(self, index):
+        self._fill()
+        return list.__getitem__(self, index)
+
+def _chunks(rows, first_size, size):
+    chunk = []
+    limit = first_size
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == limit:
+            yield chunk
+            chunk = []
+            limit = size
+    if chunk:
+        yield chunk
+
+def _measure(flowables, width, height):
+    """Height the flowables take at the top of a frame."""
+    total = 0
+    for i, flowable in enumerate(flowables):
+        _, h = flowable.wrap(width, height)
+        total += h + flowable.getSpaceAfter()
+        if i:
+            total += flowable.getSpaceBefore()
+    return total
+
+def _rows_per_page(header, col_widths, width, height):
+    """How many body rows fit under the header in the given height."""
+    sample = Table([header, ['0'] * len(header)], colWidths=col_widths, style=TABLE_STYLE)
+    sample.wrap(width, height)
+    header_height, row_height = sample._rowHeights
+    # Keep one row spare so rounding never pushes a table onto a new page
+    return max(1, int((height - header_height) // row_height) - 1)
+
+def render_table_pdf(title, lines, header, rows, col_widths=None):
+    """Render a titled single-table report and return it as an open file.
+
+    lines are the text lines under the title, header the column headings
+    and rows an iterable of lists of cell strings. col_widths are
+    fractions of the page width (equal columns by default). The returned
+    SpooledTemporaryFile is rewound and ready for storage.store().
+    """
+    output = SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    doc = SimpleDocTemplate(output, pagesize=letter)
+
+    width = doc.width - 2 * FRAME_PADDING
+    height = doc.height - 2 * FRAME_PADDING
+    fractions = col_widths or [1.0 / len(header)] * len(header)
+    widths = [width * fraction for fraction in fractions]
+
+    preamble = [Paragraph(title, TITLE_STYLE)]
+    preamble += [Paragraph(line, TEXT_STYLE) for line in lines]
+    preamble.append(Spacer(1, 20))
+
+    first_page_rows = _rows_per_page(header, widths, width, height - _measure(preamble, width, height))
+    page_rows = _rows_per_page(header, widths, width, height)
+
+    def story():
+        yield from preamble
+        empty = True
+        for chunk in _chunks(rows, first_page_rows, page_rows):
+            if not empty:
+                yield PageBreak()
+            empty = False
+            yield Table([header] + chunk, colWidths=widths, repeatRows=1, style=TABLE_STYLE)
+        if empty:
+            yield Table([header], colWidths=widths, style=TABLE_STYLE)
+
+    doc.build(_FlowableStream(story()))
+    output.seek(0)
+    return output
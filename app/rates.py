@@ -0,0 +1,189 @@
+"""Effective-dated hourly rates.
+
+employee_rates keeps every hourly rate an employee has had, keyed by the
+day it took effect, and is the only source of truth for pay.
+employees.hourly_rate is the rate as of the employee's last edit: set_rate()
+copies the rate in effect that day, and a future-dated rate only reaches
+it with the next edit. It is what the employee pages show; anything that
+prices or reports work records uses rate_sql() or RateTable instead.
+
+Work records are paid at the rate in effect on their own date, so a new
+rate no longer rewrites the pay of earlier records. A date before an
+employee's first rate uses that first rate.
+
+rate_on() answers a single lookup with one query. RateTable loads the
+history of many employees at once and answers lookups in memory with a
+bisect per employee, for paths that need a rate for many rows.
+"""
+from bisect import bisect_right
+from datetime import date, timedelta
+from app.database import query_db, iter_query, execute_db, execute_many
+
+# Employee ids per history lookup, well below SQLite's bind parameter limit
+LOOKUP_SIZE = 500
+
+# Rate rows per executemany call
+BATCH_SIZE = 1000
+
+# Effective date of an employee's starting rate, so that it covers work
+# records dated before the employee was added
+FIRST_DAY = date(1970, 1, 1)
+
+UPSERT_RATE = """
+    INSERT INTO employee_rates (employee_id, effective_from, hourly_rate)
+    VALUES (:employee_id, :effective_from, :hourly_rate)
+    ON CONFLICT (employee_id, effective_from) DO UPDATE SET hourly_rate = excluded.hourly_rate
+"""
+
+def rate_sql(employee_id, day):
+    """SQL for the rate of an employee on a day, given as columns or binds.
+
+    A day before the employee's first rate gets that first rate; an
+    employee with no history gets NULL.
+    """
+    return f"""
+        COALESCE(
+            (SELECT r.hourly_rate FROM employee_rates r
+             WHERE r.employee_id = {employee_id} AND r.effective_from <= {day}
+             ORDER BY r.effective_from DESC LIMIT 1),
+            (SELECT r.hourly_rate FROM employee_rates r
+             WHERE r.employee_id = {employee_id}
+             ORDER BY r.effective_from LIMIT 1)
+        )
+    """
+
+_RATE_ON = rate_sql(':employee_id', ':day')
+
+def rate_on(employee_id, day):
+    """Return the hourly rate in effect on day, or None if there is no such employee."""
+    row = query_db(
+        f"SELECT COALESCE({_RATE_ON}, e.hourly_rate) AS hourly_rate FROM employees e WHERE e.id = :employee_id",
+        {'employee_id': employee_id, 'day': day},
+        one=True
+    )
+    return row['hourly_rate'] if row else None
+
+def set_rate(employee_id, hourly_rate, effective_from):
+    """Record a rate from effective_from onwards.
+
+    employees.hourly_rate is set to the rate in effect today, which is the
+    previous one if effective_from is in the future.
+    """
+    execute_db(UPSERT_RATE, {
+        'employee_id': employee_id,
+        'effective_from': effective_from,
+        'hourly_rate': hourly_rate,
+    })
+    execute_db(
+        f"UPDATE employees SET hourly_rate = {_RATE_ON} WHERE id = :employee_id",
+        {'employee_id': employee_id, 'day': date.today()}
+    )
+
+def rate_history(employee_id):
+    """Return an employee's rates, most recent first."""
+    return query_db("""
+        SELECT effective_from, hourly_rate, created_at
+        FROM employee_rates
+        WHERE employee_id = ?
+        ORDER BY effective_from DESC
+    """, (employee_id,))
+
+def remove_rates(employee_id):
+    """Delete an employee's rate history, before the employee is deleted."""
+    execute_db("DELETE FROM employee_rates WHERE employee_id = ?", (employee_id,))
+
+class RateTable:
+    """Rate histories of many employees for in-memory as-of lookups."""
+
+    def __init__(self, rows):
+        """Build from (employee_id, effective_from, hourly_rate) rows.
+
+        Rows must be sorted by employee and date. effective_from is None
+        for an employee with no history, whose rate applies on every day.
+        """
+        self._days = {}
+        self._rates = {}
+        for employee_id, effective_from, hourly_rate in rows:
+            self._days.setdefault(employee_id, []).append(effective_from or date.min)
+            self._rates.setdefault(employee_id, []).append(hourly_rate)
+
+    @classmethod
+    def load(cls, employee_ids=None):
+        """Load the history of employee_ids, or of every employee.
+
+        Ids with no employee are left out, so `in` doubles as an
+        existence check.
+        """
+        query = """
+            SELECT e.id AS employee_id, r.effective_from, COALESCE(r.hourly_rate, e.hourly_rate) AS hourly_rate
+            FROM employees e
+            LEFT JOIN employee_rates r ON r.employee_id = e.id
+        """
+        order = " ORDER BY e.id, r.effective_from"
+        if employee_ids is None:
+            rows = iter_query(query + order)
+        else:
+            employee_ids = sorted(employee_ids)
+            rows = []
+            for start in range(0, len(employee_ids), LOOKUP_SIZE):
+                chunk = employee_ids[start:start + LOOKUP_SIZE]
+                rows.extend(query_db(
+                    f"{query} WHERE e.id IN ({', '.join('?' * len(chunk))}){order}",
+                    chunk
+                ))
+        return cls((row['employee_id'], row['effective_from'], row['hourly_rate']) for row in rows)
+
+    def __contains__(self, employee_id):
+        return employee_id in self._days
+
+    def __len__(self):
+        return len(self._days)
+
+    def rate_on(self, employee_id, day):
+        """Return the rate in effect on day; raises KeyError for an unknown employee."""
+        days = self._days[employee_id]
+        index = bisect_right(days, day) - 1
+        return self._rates[employee_id][max(index, 0)]
+
+def backfill_rates():
+    """Seed employee_rates from the rates work records were paid at.
+
+    Every change in an employee's amount_earned / hours_worked over time
+    becomes a rate effective from that record's date, the first one from
+    FIRST_DAY. An employee whose current hourly_rate differs from the last
+    recorded one gets it effective from today, and one with no work
+    records gets it as their starting rate.
+    """
+    history = {}
+    for record in iter_query("""
+        SELECT employee_id, date, hours_worked, amount_earned
+        FROM work_records
+        WHERE hours_worked > 0
+        ORDER BY employee_id, date, id
+    """, batch_size=5000):
+        rate = round(record['amount_earned'] / record['hours_worked'], 4)
+        rates = history.setdefault(record['employee_id'], [])
+        if not rates:
+            rates.append((FIRST_DAY, rate))
+        elif rates[-1][0] == record['date']:
+            # The last record of a day decides that day's rate
+            rates[-1] = (record['date'], rate)
+        elif rates[-1][1] != rate:
+            rates.append((record['date'], rate))
+
+    rows = []
+    today = date.today()
+    for employee in query_db("SELECT id, hourly_rate FROM employees"):
+        rates = history.get(employee['id'], [])
+        if not rates:
+            rates.append((FIRST_DAY, employee['hourly_rate']))
+        elif rates[-1][1] != round(employee['hourly_rate'], 4):
+            # Never ahead of records already paid at the previous rate
+            rates.append((max(today, rates[-1][0] + timedelta(days=1)), employee['hourly_rate']))
+        rows.extend(
+            {'employee_id': employee['id'], 'effective_from': effective_from, 'hourly_rate': hourly_rate}
+            for effective_from, hourly_rate in rates
+        )
+    for start in range(0, len(rows), BATCH_SIZE):
+        execute_many(UPSERT_RATE, rows[start:start + BATCH_SIZE])
+    return len(rows)
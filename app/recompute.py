@@ -0,0 +1,140 @@
+"""Batch recompute of work record amounts after rate changes.
+
+recompute_amounts() reprices the work records of a set of employees over a
+date range at the rates in effect on their dates (see app/rates.py).
+Records are walked in id order, CHUNK_SIZE at a time, and each chunk is
+its own short transaction that
+
+1. sums the change per employee per day with one grouped SELECT,
+2. rewrites amount_earned with one set-based correlated UPDATE, and
+3. applies the summed changes to the rollups with batched upserts.
+
+Only records whose amount actually changes are written, so running it
+twice is harmless, and the write lock is never held for longer than one
+chunk while the app keeps serving.
+"""
+import time
+from app.database import query_db, execute_db, transaction
+from app.rates import rate_sql, LOOKUP_SIZE
+from app.rollups import record_deltas
+from app.stats import invalidate_admin_dashboard, STATS_FRAGMENT, RECENT_FRAGMENT
+
+# Work records per transaction
+CHUNK_SIZE = 5000
+
+# Amount differences below this are float noise, not stale amounts
+TOLERANCE = 0.000001
+
+_NEW_AMOUNT = f"wr.hours_worked * {rate_sql('wr.employee_id', 'wr.date')}"
+
+def _filters(employee_ids, start_date, end_date):
+    """SQL conditions and binds for the records a recompute covers."""
+    where, params = [], {}
+    if employee_ids is not None:
+        names = [f'e{n}' for n in range(len(employee_ids))]
+        where.append(f"wr.employee_id IN ({', '.join(':' + name for name in names)})")
+        params.update(zip(names, employee_ids))
+    if start_date is not None:
+        where.append("wr.date >= :start_date")
+        params['start_date'] = start_date
+    if end_date is not None:
+        where.append("wr.date <= :end_date")
+        params['end_date'] = end_date
+    return where, params
+
+def _recompute_chunk(where, params):
+    """Reprice the records in one id range and return how many changed."""
+    conditions = ' AND '.join(where + ["wr.id BETWEEN :low AND :high"])
+    with transaction(long=True):
+        changes = query_db(f"""
+            SELECT employee_id, date, SUM(new_amount - amount_earned) AS amount, COUNT(*) AS records
+            FROM (
+                SELECT wr.employee_id, wr.date, wr.amount_earned, {_NEW_AMOUNT} AS new_amount
+                FROM work_records wr
+                WHERE {conditions}
+            ) repriced
+            WHERE ABS(new_amount - amount_earned) > {TOLERANCE}
+            GROUP BY employee_id, date
+        """, params)
+        if not changes:
+            return 0
+        # A correlated UPDATE works on SQLite and PostgreSQL alike; the
+        # aliased conditions are applied through an IN over the chunk
+        execute_db(f"""
+            UPDATE work_records
+            SET amount_earned = hours_worked * {rate_sql('work_records.employee_id', 'work_records.date')}
+            WHERE id IN (
+                SELECT wr.id FROM work_records wr
+                WHERE {conditions}
+                  AND ABS({_NEW_AMOUNT} - wr.amount_earned) > {TOLERANCE}
+            )
+        """, params)
+        record_deltas(
+            ((change['employee_id'], change['date'], 0, change['amount']) for change in changes),
+            count=0
+        )
+    return sum(change['records'] for change in changes)
+
+def recompute_amounts(employee_ids=None, start_date=None, end_date=None,
+                      chunk_size=CHUNK_SIZE, progress=None):
+    """Reprice work records at their effective-dated rates.
+
+    employee_ids limits the run to those employees (None means everyone);
+    start_date and end_date bound the record dates and may be None.
+    progress, if given, is called after every chunk with a dict of the
+    records scanned so far, the total and the records updated.
+
+    Returns a dict with the records in range, the records updated, the
+    number of chunks and the time taken.
+    """
+    started = time.perf_counter()
+    if employee_ids is not None:
+        employee_ids = sorted(set(employee_ids))
+        groups = [employee_ids[n:n + LOOKUP_SIZE] for n in range(0, len(employee_ids), LOOKUP_SIZE)]
+    else:
+        groups = [None]
+
+    total = 0
+    for group in groups:
+        where, params = _filters(group, start_date, end_date)
+        row = query_db(
+            f"SELECT COUNT(*) AS records FROM work_records wr{' WHERE ' + ' AND '.join(where) if where else ''}",
+            params,
+            one=True
+        )
+        total += row['records']
+
+    scanned = updated = chunks = 0
+    for group in groups:
+        where, params = _filters(group, start_date, end_date)
+        after = 0
+        while True:
+            # Chunk boundaries come from the ids that match, so each
+            # chunk holds chunk_size records however sparse they are
+            ids = query_db(f"""
+                SELECT wr.id FROM work_records wr
+                WHERE {' AND '.join(where + ['wr.id > :after'])}
+                ORDER BY wr.id
+                LIMIT {int(chunk_size)}
+            """, dict(params, after=after))
+            if not ids:
+                break
+            low, high = ids[0]['id'], ids[-1]['id']
+            updated += _recompute_chunk(where, dict(params, low=low, high=high))
+            scanned += len(ids)
+            chunks += 1
+            after = high
+            if progress:
+                progress({'scanned': scanned, 'total': total, 'updated': updated})
+
+    if updated:
+        invalidate_admin_dashboard(STATS_FRAGMENT, RECENT_FRAGMENT)
+
+    seconds = time.perf_counter() - started
+    return {
+        'records': total,
+        'updated': updated,
+        'chunks': chunks,
+        'seconds': round(seconds, 3),
+        'rows_per_second': round(scanned / seconds) if seconds else 0,
+    }
@@ -0,0 +1,226 @@
+"""Read replica routing for reporting and listing queries.
+
+Reads made inside `with database.read_replica():` go to the read replica,
+as long as they are not part of a transaction(). That covers query_db,
+iter_query and iter_batches. All other reads and every write stay on the
+primary, so report scans and listings stop competing with timesheet
+entry. The source is picked once per block.
+
+The replica is DATABASE_REPLICA_URL. On SQLite it can also be:
+
+- the primary file opened read-only, which gives reporting its own pool
+  with no lag:
+  sqlite:///file:/path/to/payroll.db?mode=ro&uri=true
+- with REPLICA_SNAPSHOT_SECONDS and no URL, a snapshot copy of the
+  database at REPLICA_SNAPSHOT_PATH. The copy is made with SQLite's online
+  backup API, which does not block writers in WAL mode. Once the copy is
+  older than that many seconds, a background thread makes a new one next
+  to it and swaps it in, so readers never see a half-made copy.
+
+Lag is measured at most every REPLICA_LAG_CHECK_SECONDS: the age of the
+snapshot, or the replay delay of a PostgreSQL standby. A read_replica()
+block reads from the primary instead when:
+
+- the lag is over REPLICA_MAX_LAG_SECONDS;
+- the replica failed within the last REPLICA_RETRY_SECONDS (a query_db
+  that fails on the replica is retried on the primary);
+- the user's session wrote something the replica may not have yet, so
+  people always see their own changes.
+"""
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from flask import has_request_context, session
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+from app.config import engine_options
+from app.database import db
+
+logger = logging.getLogger(__name__)
+
+WROTE_KEY = '_db_wrote_at'
+
+# Seconds of clock skew and replication delay allowed for the user's own writes
+WRITE_MARGIN = 1.0
+
+_PG_LAG = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+    END
+"""
+
+class Snapshot:
+    """A copy of an SQLite primary, remade with the backup API and swapped in."""
+
+    def __init__(self, primary, path, interval):
+        self.primary = primary
+        self.path = path
+        self.interval = interval
+        # The replica engine reading the snapshot, see init_replica()
+        self.engine = None
+        self._refreshing = threading.Lock()
+
+    def taken_at(self, engine):
+        """Unix time the snapshot was taken, or None if there is none yet."""
+        with engine.connect() as conn:
+            return conn.execute(text("SELECT taken_at FROM replica_snapshot")).scalar()
+
+    def refresh(self):
+        """Copy the primary over the snapshot. Returns False if a refresh is already running."""
+        if not self._refreshing.acquire(blocking=False):
+            return False
+        try:
+            taken_at = time.time()
+            # Made complete under a temporary name and then renamed over the
+            # old copy, which readers never see half-made
+            fd, building = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.path)),
+                                            prefix=os.path.basename(self.path) + '.', suffix='.tmp')
+            os.close(fd)
+            try:
+                source = self.primary.raw_connection()
+                try:
+                    target = sqlite3.connect(building, timeout=30)
+                    try:
+                        source.dbapi_connection.backup(target)
+                        # A WAL copy could not be opened read-only without its -shm file
+                        target.execute("PRAGMA journal_mode=DELETE")
+                        target.execute("CREATE TABLE replica_snapshot (taken_at REAL NOT NULL)")
+                        target.execute("INSERT INTO replica_snapshot (taken_at) VALUES (?)", (taken_at,))
+                        target.commit()
+                    finally:
+                        target.close()
+                finally:
+                    source.close()
+                os.replace(building, self.path)
+            except BaseException:
+                os.remove(building)
+                raise
+            if self.engine is not None:
+                # Pooled connections still have the old copy open
+                self.engine.dispose()
+            return True
+        finally:
+            self._refreshing.release()
+
+    def refresh_in_background(self):
+        def run():
+            try:
+                self.refresh()
+            except Exception:
+                logger.exception('Refreshing the replica snapshot %s failed', self.path)
+        threading.Thread(target=run, name='replica-snapshot', daemon=True).start()
+
+class Replica:
+    """Decides, per read, whether the replica may serve it."""
+
+    def __init__(self, engine, max_lag, check_every, retry_after, snapshot=None):
+        self.engine = engine
+        self.max_lag = max_lag
+        self.check_every = check_every
+        self.retry_after = retry_after
+        self.snapshot = snapshot
+        self._lock = threading.Lock()
+        self._lag = None
+        self._checked_at = None
+        self._down_until = 0.0
+        self.stats = {'routed': 0, 'failures': 0, 'fallback_lag': 0, 'fallback_down': 0, 'fallback_own_write': 0}
+
+    def _measure(self):
+        if self.snapshot is not None:
+            if not os.path.exists(self.snapshot.path):
+                # The first snapshot is still to be taken
+                self.snapshot.refresh_in_background()
+                return None
+            taken_at = self.snapshot.taken_at(self.engine)
+            lag = time.time() - taken_at
+            if lag >= self.snapshot.interval:
+                self.snapshot.refresh_in_background()
+            return lag
+        if self.engine.dialect.name == 'postgresql':
+            with self.engine.connect() as conn:
+                return float(conn.execute(text(_PG_LAG)).scalar() or 0)
+        return 0.0
+
+    def lag(self):
+        """Seconds the replica is behind, or None while it is unavailable."""
+        now = time.monotonic()
+        with self._lock:
+            due = self._checked_at is None or now - self._checked_at >= self.check_every
+            if due:
+                self._checked_at = now
+        if due:
+            try:
+                self._lag = self._measure()
+            except OperationalError as e:
+                self._lag = None
+                self.failed(e)
+                if self.snapshot is not None:
+                    self.snapshot.refresh_in_background()
+        return self._lag
+
+    def route(self):
+        """Return True if a read_replica() block starting now may use the replica."""
+        if time.monotonic() < self._down_until:
+            reason = 'fallback_down'
+        else:
+            lag = self.lag()
+            if lag is None:
+                reason = 'fallback_down'
+            elif lag > self.max_lag:
+                reason = 'fallback_lag'
+            elif has_request_context() and session.get(WROTE_KEY, 0) > time.time() - lag - WRITE_MARGIN:
+                reason = 'fallback_own_write'
+            else:
+                reason = 'routed'
+        self._count(reason)
+        return reason == 'routed'
+
+    def failed(self, error):
+        """Send reads to the primary for the next retry_after seconds."""
+        self._down_until = time.monotonic() + self.retry_after
+        self._count('failures')
+        logger.warning('Read replica failed, using the primary for %ss: %s', self.retry_after, error)
+
+    def note_write(self):
+        """Remember that this session has just written to the primary."""
+        if has_request_context():
+            session[WROTE_KEY] = time.time()
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self.stats, lag_seconds=self._lag)
+
+def init_replica(app):
+    """Create the replica engine, if one is configured, as app.extensions['db_replica']."""
+    config = app.config
+    url = config['DATABASE_REPLICA_URL']
+    primary = db.get_engine(app)
+    snapshot = None
+    if not url and config['REPLICA_SNAPSHOT_SECONDS'] > 0 and primary.dialect.name == 'sqlite':
+        path = config['REPLICA_SNAPSHOT_PATH']
+        snapshot = Snapshot(primary, path, config['REPLICA_SNAPSHOT_SECONDS'])
+        url = f'sqlite:///file:{path}?mode=ro&uri=true'
+    if not url:
+        return
+    if url.startswith('postgres://'):
+        url = url.replace('postgres://', 'postgresql://', 1)
+
+    engine = create_engine(url, **engine_options(url))
+    if snapshot is not None:
+        snapshot.engine = engine
+    app.extensions['db_replica'] = Replica(
+        engine,
+        max_lag=config['REPLICA_MAX_LAG_SECONDS'],
+        check_every=config['REPLICA_LAG_CHECK_SECONDS'],
+        retry_after=config['REPLICA_RETRY_SECONDS'],
+        snapshot=snapshot,
+    )
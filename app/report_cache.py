@@ -0,0 +1,68 @@
+"""Reuse of previously generated reports.
+
+A report request is fingerprinted from its parameters plus a data version:
+the sum of the payroll_versions counters for the months (and employee) it
+covers. The counters only go up, so any work record write in that range
+changes the fingerprint. A request whose fingerprint matches a stored
+report, or a job that is still running, is served from that instead of
+building the report again.
+"""
+import hashlib
+import json
+from app.database import query_db
+from app import cache
+
+# Bump when the report layout changes so old artifacts are not reused
+RENDERER_VERSION = 2
+
+def data_version(employee_id, start_date, end_date):
+    """Return the change stamp for an employee (or everyone) over a range."""
+    query = """
+        SELECT COALESCE(SUM(version), 0) AS version
+        FROM payroll_versions
+        WHERE month >= :month_start AND month <= :month_end
+    """
+    params = {
+        'month_start': start_date.replace(day=1),
+        'month_end': end_date.replace(day=1),
+    }
+    if employee_id is not None:
+        query += " AND employee_id = :employee_id"
+        params['employee_id'] = int(employee_id)
+    return query_db(query, params, one=True)['version']
+
+def report_fingerprint(source, employee_id, report_type, start_date, end_date, file_format='pdf'):
+    """Hash the report parameters together with the current data version."""
+    key = [
+        RENDERER_VERSION,
+        source,
+        None if employee_id is None else int(employee_id),
+        report_type,
+        file_format,
+        start_date.isoformat(),
+        end_date.isoformat(),
+        data_version(employee_id, start_date, end_date),
+    ]
+    return hashlib.sha256(json.dumps(key).encode()).hexdigest()
+
+def find_report(fingerprint):
+    """Return the id of a stored report with this fingerprint, if any."""
+    row = query_db(
+        "SELECT id FROM reports WHERE fingerprint = ? ORDER BY id DESC LIMIT 1",
+        (fingerprint,),
+        one=True
+    )
+    cache.count('reports:artifact', row is not None)
+    return row['id'] if row else None
+
+def find_pending_job(fingerprint):
+    """Return the id of a queued or running job with this fingerprint, if any."""
+    row = query_db(
+        """SELECT id FROM report_jobs
+           WHERE fingerprint = ? AND status IN ('queued', 'running')
+           ORDER BY id DESC LIMIT 1""",
+        (fingerprint,),
+        one=True
+    )
+    cache.count('reports:pending_job', row is not None)
+    return row['id'] if row else None
@@ -0,0 +1,176 @@
+"""Report templates and output formats.
+
+Every report is a title, a few lines of text and one table. The three
+report types are defined once in TEMPLATES as a list of columns; employee
+reports use the same templates without the Employee column and name the
+employee in the heading instead. The table can be written out as PDF, CSV,
+JSON or XLSX. ReportLab and openpyxl are only imported when the first
+report in that format is built, so web workers that never render one do
+not pay for loading them.
+
+Records are streamed from the database into the chosen backend, and every
+backend writes to a SpooledTemporaryFile ready for storage.store().
+"""
+import csv
+import io
+import json
+from datetime import date
+from itertools import chain
+from tempfile import SpooledTemporaryFile
+from app.database import iter_query
+from app.rollups import get_earnings_summary
+from app.rates import rate_sql
+
+# Reports up to this size are kept in memory, larger ones go to a temp file
+SPOOL_MAX_SIZE = 4 * 1024 * 1024
+
+class Column:
+    """A report column: heading, record key, PDF text format and width."""
+
+    def __init__(self, heading, key, text_format, width):
+        self.heading = heading
+        self.key = key
+        self.text_format = text_format
+        self.width = width
+
+    def value(self, record):
+        value = record[self.key]
+        return round(value, 2) if isinstance(value, float) else value
+
+    def text(self, record):
+        return self.text_format(record[self.key])
+
+def _plain(value):
+    return str(value)
+
+def _hours(value):
+    return f"{value:.2f}"
+
+def _money(value):
+    return f"${value:.2f}"
+
+def _day(value):
+    return value.strftime('%Y-%m-%d')
+
+EMPLOYEE = Column('Employee', 'employee_name', _plain, 0.32)
+DATE = Column('Date', 'date', _day, 0.17)
+HOURLY_RATE = Column('Hourly Rate', 'hourly_rate', _money, 0.17)
+HOURS_WORKED = Column('Hours Worked', 'hours_worked', _hours, 0.17)
+AMOUNT_EARNED = Column('Amount Earned', 'amount_earned', _money, 0.17)
+TOTAL_HOURS = Column('Total Hours', 'total_hours', _hours, 0.17)
+TOTAL_EARNINGS = Column('Total Earnings', 'total_earnings', _money, 0.17)
+
+TEMPLATES = {
+    'work_records': ('Work Records Report', [EMPLOYEE, DATE, HOURS_WORKED, AMOUNT_EARNED]),
+    'earnings': ('Earnings Summary Report', [EMPLOYEE, TOTAL_HOURS, TOTAL_EARNINGS]),
+    'detailed': ('Detailed Report', [EMPLOYEE, DATE, HOURLY_RATE, HOURS_WORKED, AMOUNT_EARNED]),
+}
+
+def _pdf(title, lines, columns, records):
+    from app.pdf_report import render_table_pdf
+    total = sum(column.width for column in columns)
+    return render_table_pdf(
+        title,
+        lines,
+        [column.heading for column in columns],
+        ([column.text(record) for column in columns] for record in records),
+        col_widths=[column.width / total for column in columns]
+    )
+
+def _csv(title, lines, columns, records):
+    output = SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    text = io.TextIOWrapper(output, encoding='utf-8', newline='')
+    writer = csv.writer(text)
+    writer.writerow([column.heading for column in columns])
+    writer.writerows([column.value(record) for column in columns] for record in records)
+    text.flush()
+    text.detach()
+    output.seek(0)
+    return output
+
+def _json_default(value):
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+def _json(title, lines, columns, records):
+    output = SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    head = json.dumps({'title': title, 'lines': lines, 'columns': [column.heading for column in columns]})
+    # Write the rows one at a time instead of building the whole document
+    output.write(head[:-1].encode() + b', "rows": [')
+    for i, record in enumerate(records):
+        row = [column.value(record) for column in columns]
+        if i:
+            output.write(b', ')
+        output.write(json.dumps(row, default=_json_default).encode())
+    output.write(b']}')
+    output.seek(0)
+    return output
+
+def _xlsx(title, lines, columns, records):
+    from openpyxl import Workbook
+    # A write-only workbook streams rows out instead of keeping every cell
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title[:31])
+    sheet.append([title])
+    for line in lines:
+        sheet.append([line])
+    sheet.append([])
+    sheet.append([column.heading for column in columns])
+    for record in records:
+        sheet.append([column.value(record) for column in columns])
+    output = SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    workbook.save(output)
+    output.seek(0)
+    return output
+
+# file_format -> (mimetype, backend)
+FORMATS = {
+    'pdf': ('application/pdf', _pdf),
+    'csv': ('text/csv', _csv),
+    'json': ('application/json', _json),
+    'xlsx': ('application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', _xlsx),
+}
+
+def fetch_records(report_type, start_date, end_date, employee_id=None):
+    """Return the records for a report, streamed where they can be large."""
+    if report_type == 'earnings':
+        return get_earnings_summary(start_date, end_date, employee_id)
+
+    # The rate each record was paid at, not the employee's latest one
+    query = f"""
+        SELECT wr.*, e.name as employee_name,
+               COALESCE({rate_sql('wr.employee_id', 'wr.date')}, e.hourly_rate) AS hourly_rate
+        FROM work_records wr
+        JOIN employees e ON wr.employee_id = e.id
+        WHERE wr.date BETWEEN ? AND ?
+    """
+    params = [start_date, end_date]
+
+    if employee_id is not None:
+        query += " AND wr.employee_id = ?"
+        params.append(employee_id)
+
+    query += " ORDER BY e.name, wr.date DESC"
+    return iter_query(query, params)
+
+def build_report(source, employee_id, report_type, start_date, end_date, file_format='pdf'):
+    """Build a report and return it as an open file.
+
+    source is 'admin' or 'employee'; employee reports leave out the
+    Employee column and name the employee under the title instead.
+    employee_id is None for a report covering all employees.
+    """
+    title, columns = TEMPLATES[report_type]
+    _, backend = FORMATS[file_format]
+    records = iter(fetch_records(report_type, start_date, end_date, employee_id))
+    lines = [f'Period: {start_date} to {end_date}']
+
+    if source == 'employee':
+        columns = [column for column in columns if column is not EMPLOYEE]
+        first = next(records, None)
+        if first:
+            lines.insert(0, f'Employee: {first["employee_name"]}')
+            records = chain([first], records)
+
+    return backend(title, lines, columns, records)
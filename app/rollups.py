@@ -0,0 +1,252 @@
+"""Incrementally maintained payroll rollup tables.
+
+payroll_daily, payroll_monthly and payroll_org_monthly hold record counts,
+hours and earnings per employee per day, per employee per month and for
+the whole organisation per month. Every work record write calls
+record_delta() in the same transaction, so summary queries read O(months)
+rows instead of re-aggregating work_records. rebuild_rollups() recomputes
+everything from work_records for backfills.
+
+payroll_versions holds a counter per employee per month that only ever
+goes up. It is bumped by every change to that employee's records in that
+month (or to the employee itself) and is what app/report_cache.py uses to
+tell whether a stored report is still current.
+"""
+from datetime import date, datetime, timedelta
+from app.database import db, query_db, execute_db, execute_many, transaction
+
+ROLLUP_TABLES = ('payroll_daily', 'payroll_monthly', 'payroll_org_monthly')
+
+def _as_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+def _month_of(column):
+    """SQL expression for the first day of the month of a date column."""
+    if db.engine.dialect.name == 'postgresql':
+        return f"CAST(date_trunc('month', {column}) AS DATE)"
+    return f"date({column}, 'start of month')"
+
+_DAILY_UPSERT = """
+    INSERT INTO payroll_daily (employee_id, date, record_count, total_hours, total_earnings)
+    VALUES (:employee_id, :date, :count, :hours, :amount)
+    ON CONFLICT (employee_id, date) DO UPDATE SET
+        record_count = payroll_daily.record_count + excluded.record_count,
+        total_hours = payroll_daily.total_hours + excluded.total_hours,
+        total_earnings = payroll_daily.total_earnings + excluded.total_earnings
+"""
+
+_MONTHLY_UPSERT = """
+    INSERT INTO payroll_monthly (employee_id, month, record_count, total_hours, total_earnings)
+    VALUES (:employee_id, :month, :count, :hours, :amount)
+    ON CONFLICT (employee_id, month) DO UPDATE SET
+        record_count = payroll_monthly.record_count + excluded.record_count,
+        total_hours = payroll_monthly.total_hours + excluded.total_hours,
+        total_earnings = payroll_monthly.total_earnings + excluded.total_earnings
+"""
+
+_ORG_MONTHLY_UPSERT = """
+    INSERT INTO payroll_org_monthly (month, record_count, total_hours, total_earnings)
+    VALUES (:month, :count, :hours, :amount)
+    ON CONFLICT (month) DO UPDATE SET
+        record_count = payroll_org_monthly.record_count + excluded.record_count,
+        total_hours = payroll_org_monthly.total_hours + excluded.total_hours,
+        total_earnings = payroll_org_monthly.total_earnings + excluded.total_earnings
+"""
+
+_VERSION_BUMP = """
+    INSERT INTO payroll_versions (employee_id, month, version)
+    VALUES (:employee_id, :month, 1)
+    ON CONFLICT (employee_id, month) DO UPDATE SET
+        version = payroll_versions.version + 1
+"""
+
+def record_delta(employee_id, day, hours, amount, count=1):
+    """Add one work record to the rollups, or remove it with count=-1."""
+    day = _as_date(day)
+    month = day.replace(day=1)
+    sign = 1 if count > 0 else -1
+    params = {
+        'employee_id': employee_id,
+        'date': day,
+        'month': month,
+        'count': count,
+        'hours': sign * hours,
+        'amount': sign * amount,
+    }
+    
+    with transaction():
+        execute_db(_DAILY_UPSERT, params)
+        execute_db(_MONTHLY_UPSERT, params)
+        execute_db(_ORG_MONTHLY_UPSERT, params)
+        execute_db(_VERSION_BUMP, params)
+        
+        if count < 0:
+            # Drop buckets that no longer hold any records
+            execute_db("DELETE FROM payroll_daily WHERE employee_id = :employee_id AND date = :date AND record_count <= 0", params)
+            execute_db("DELETE FROM payroll_monthly WHERE employee_id = :employee_id AND month = :month AND record_count <= 0", params)
+            execute_db("DELETE FROM payroll_org_monthly WHERE month = :month AND record_count <= 0", params)
+
+def _add(buckets, key, hours, amount, count=1):
+    bucket = buckets.setdefault(key, [0, 0.0, 0.0])
+    bucket[0] += count
+    bucket[1] += hours
+    bucket[2] += amount
+
+def record_deltas(records, count=1):
+    """Add many new work records to the rollups at once.
+    
+    records is an iterable of (employee_id, day, hours, amount). They are
+    summed per day and month first, so each table gets one batched upsert
+    per bucket instead of a statement per record. count is added per
+    record; pass 0 to apply changes to records already counted.
+    """
+    daily = {}
+    for employee_id, day, hours, amount in records:
+        _add(daily, (employee_id, _as_date(day)), hours, amount, count)
+    
+    monthly = {}
+    org_monthly = {}
+    for (employee_id, day), (count, hours, amount) in daily.items():
+        month = day.replace(day=1)
+        _add(monthly, (employee_id, month), hours, amount, count)
+        _add(org_monthly, month, hours, amount, count)
+    
+    with transaction():
+        execute_many(_DAILY_UPSERT, [
+            {'employee_id': employee_id, 'date': day, 'count': count, 'hours': hours, 'amount': amount}
+            for (employee_id, day), (count, hours, amount) in daily.items()
+        ])
+        execute_many(_MONTHLY_UPSERT, [
+            {'employee_id': employee_id, 'month': month, 'count': count, 'hours': hours, 'amount': amount}
+            for (employee_id, month), (count, hours, amount) in monthly.items()
+        ])
+        execute_many(_ORG_MONTHLY_UPSERT, [
+            {'month': month, 'count': count, 'hours': hours, 'amount': amount}
+            for month, (count, hours, amount) in org_monthly.items()
+        ])
+        execute_many(_VERSION_BUMP, [
+            {'employee_id': employee_id, 'month': month}
+            for employee_id, month in monthly
+        ])
+
+def bump_employee_versions(employee_id):
+    """Mark every month of an employee as changed, e.g. after a rename."""
+    execute_db(
+        "UPDATE payroll_versions SET version = version + 1 WHERE employee_id = ?",
+        (employee_id,)
+    )
+
+def bump_all_versions():
+    """Mark every month that has records as changed."""
+    # WHERE true keeps SQLite from reading ON CONFLICT as a join constraint
+    execute_db("""
+        INSERT INTO payroll_versions (employee_id, month, version)
+        SELECT employee_id, month, 1 FROM payroll_monthly WHERE true
+        ON CONFLICT (employee_id, month) DO UPDATE SET
+            version = payroll_versions.version + 1
+    """)
+
+def remove_employee(employee_id):
+    """Take all of an employee's records out of the rollups."""
+    params = {'employee_id': employee_id}
+    with transaction():
+        execute_db("""
+            UPDATE payroll_org_monthly SET
+                record_count = record_count - (SELECT pm.record_count FROM payroll_monthly pm
+                    WHERE pm.month = payroll_org_monthly.month AND pm.employee_id = :employee_id),
+                total_hours = total_hours - (SELECT pm.total_hours FROM payroll_monthly pm
+                    WHERE pm.month = payroll_org_monthly.month AND pm.employee_id = :employee_id),
+                total_earnings = total_earnings - (SELECT pm.total_earnings FROM payroll_monthly pm
+                    WHERE pm.month = payroll_org_monthly.month AND pm.employee_id = :employee_id)
+            WHERE month IN (SELECT month FROM payroll_monthly WHERE employee_id = :employee_id)
+        """, params)
+        execute_db("DELETE FROM payroll_org_monthly WHERE record_count <= 0")
+        bump_employee_versions(employee_id)
+        execute_db("DELETE FROM payroll_monthly WHERE employee_id = :employee_id", params)
+        execute_db("DELETE FROM payroll_daily WHERE employee_id = :employee_id", params)
+
+def rebuild_rollups():
+    """Recompute every rollup table from work_records."""
+    with transaction(long=True):
+        for table in ROLLUP_TABLES:
+            execute_db(f"DELETE FROM {table}")
+        execute_db("""
+            INSERT INTO payroll_daily (employee_id, date, record_count, total_hours, total_earnings)
+            SELECT employee_id, date, COUNT(*), SUM(hours_worked), SUM(amount_earned)
+            FROM work_records
+            GROUP BY employee_id, date
+        """)
+        month = _month_of('date')
+        execute_db(f"""
+            INSERT INTO payroll_monthly (employee_id, month, record_count, total_hours, total_earnings)
+            SELECT employee_id, {month}, SUM(record_count), SUM(total_hours), SUM(total_earnings)
+            FROM payroll_daily
+            GROUP BY employee_id, {month}
+        """)
+        execute_db("""
+            INSERT INTO payroll_org_monthly (month, record_count, total_hours, total_earnings)
+            SELECT month, SUM(record_count), SUM(total_hours), SUM(total_earnings)
+            FROM payroll_monthly
+            GROUP BY month
+        """)
+        bump_all_versions()
+    
+    row = query_db("SELECT COUNT(*) AS months FROM payroll_org_monthly", one=True)
+    return row['months']
+
+def get_org_totals():
+    """Return the record count and total payments across all history."""
+    return query_db("""
+        SELECT COALESCE(SUM(record_count), 0) AS record_count,
+               COALESCE(SUM(total_earnings), 0) AS total_payments
+        FROM payroll_org_monthly
+    """, one=True)
+
+def get_earnings_summary(start_date, end_date, employee_id=None):
+    """Hours and earnings per employee between two dates, inclusive.
+    
+    Whole months inside the range come from payroll_monthly and only the
+    partial months at either end are read from payroll_daily.
+    """
+    start_date, end_date = _as_date(start_date), _as_date(end_date)
+    
+    full_start = start_date if start_date.day == 1 else (start_date.replace(day=28) + timedelta(days=4)).replace(day=1)
+    full_end = (end_date + timedelta(days=1)).replace(day=1)
+    if full_start >= full_end:
+        # No whole month in the range, read it all from the daily rollup
+        full_start = full_end = end_date + timedelta(days=1)
+    
+    params = {
+        'start_date': start_date,
+        'end_date': end_date,
+        'full_start': full_start,
+        'full_end': full_end,
+    }
+    employee_filter = ''
+    if employee_id is not None:
+        employee_filter = 'WHERE t.employee_id = :employee_id'
+        params['employee_id'] = int(employee_id)
+    
+    return query_db(f"""
+        SELECT e.name as employee_name,
+               SUM(t.total_hours) as total_hours,
+               SUM(t.total_earnings) as total_earnings
+        FROM (
+            SELECT employee_id, total_hours, total_earnings
+            FROM payroll_monthly
+            WHERE month >= :full_start AND month < :full_end
+            UNION ALL
+            SELECT employee_id, total_hours, total_earnings
+            FROM payroll_daily
+            WHERE (date >= :start_date AND date < :full_start)
+               OR (date >= :full_end AND date <= :end_date)
+        ) t
+        JOIN employees e ON t.employee_id = e.id
+        {employee_filter}
+        GROUP BY e.id, e.name
+        ORDER BY e.name
+    """, params)
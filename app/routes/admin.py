@@ -1,14 +1,18 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request, make_response
+from flask import (Blueprint, render_template, redirect, url_for, flash, request, jsonify,
+                   Response, stream_with_context)
 from flask_login import login_required, current_user
 from datetime import datetime, date
-from app.database import execute_db, query_db, get_db
-from werkzeug.security import generate_password_hash
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
-import io
+from app.database import execute_db, query_db, transaction, read_replica
+from app.pagination import get_page_size, keyset_page, serialize_row
+from app.rollups import record_delta, remove_employee, bump_employee_versions
+from app.rates import rate_on, set_rate, rate_history, remove_rates, FIRST_DAY
+from app.stats import (get_admin_dashboard, invalidate_admin_dashboard,
+                       STATS_FRAGMENT, RECENT_FRAGMENT, EMPLOYEES_FRAGMENT)
+from app import cache, export, bulk_import, onboarding, recompute, passwords
+from app.jobs import enqueue_report, get_job, poll_job
+from app.storage import send_report
+from app.report_cache import report_fingerprint, find_report
+from app.report_engine import TEMPLATES, FORMATS
 
 bp = Blueprint('admin', __name__)
 
@@ -20,37 +24,9 @@ def dashboard():
         return redirect(url_for('employee.dashboard'))
     
     try:
-        # Get statistics
-        employee_count = query_db("SELECT COUNT(*) FROM employees", one=True)[0]
-        record_count = query_db("SELECT COUNT(*) FROM work_records", one=True)[0]
-        today_records = query_db(
-            "SELECT COUNT(*) FROM work_records WHERE date = ?",
-            (date.today().isoformat(),),
-            one=True
-        )[0]
-        total_payments = query_db(
-            "SELECT COALESCE(SUM(amount_earned), 0) FROM work_records",
-            one=True
-        )[0]
-        
-        stats = {
-            'employee_count': employee_count,
-            'record_count': record_count,
-            'today_records': today_records,
-            'total_payments': total_payments
-        }
-        
-        # Get recent records with employee names
-        recent_records = query_db("""
-            SELECT wr.*, e.name as employee_name
-            FROM work_records wr
-            JOIN employees e ON wr.employee_id = e.id
-            ORDER BY wr.date DESC
-            LIMIT 10
-        """)
-        
-        # Get all employees
-        employees = query_db("SELECT * FROM employees ORDER BY name")
+        # Get statistics, recent records with employee names and all
+        # employees, each served from the cache when it is fresh
+        stats, recent_records, employees = get_admin_dashboard()
         
         return render_template('admin/dashboard.html',
                              stats=stats,
@@ -60,6 +36,24 @@ def dashboard():
         flash(f'Error loading dashboard: {str(e)}', 'danger')
         return redirect(url_for('main.index'))
 
+@bp.route('/admin/cache_stats')
+@login_required
+def cache_stats():
+    if not current_user.is_admin:
+        flash('Access denied. Admin privileges required.', 'danger')
+        return redirect(url_for('employee.dashboard'))
+    
+    return jsonify(cache.get_stats())
+
+@bp.route('/admin/login_stats')
+@login_required
+def login_stats():
+    if not current_user.is_admin:
+        flash('Access denied. Admin privileges required.', 'danger')
+        return redirect(url_for('employee.dashboard'))
+    
+    return jsonify(passwords.get_stats())
+
 @bp.route('/employees')
 @login_required
 def employees():
@@ -68,8 +62,25 @@ def employees():
         return redirect(url_for('employee.dashboard'))
         
     try:
-        employees = query_db("SELECT * FROM employees ORDER BY name")
-        return render_template('admin/employees.html', employees=employees)
+        page_size = get_page_size(request.args)
+        with read_replica():
+            employees, next_cursor = keyset_page(
+                "SELECT * FROM employees e",
+                [], {},
+                keys=[('e.name', 'name', str), ('e.id', 'id', int)],
+                cursor=request.args.get('cursor'),
+                page_size=page_size,
+                descending=False
+            )
+        
+        if request.args.get('format') == 'json':
+            return jsonify(employees=[serialize_row(e) for e in employees],
+                           next_cursor=next_cursor)
+        
+        return render_template('admin/employees.html',
+                             employees=employees,
+                             next_cursor=next_cursor,
+                             per_page=page_size)
     except Exception as e:
         flash(f'Error loading employees: {str(e)}', 'error')
         return redirect(url_for('admin.dashboard'))
@@ -107,48 +118,32 @@ def add_employee():
             
             # Create user account first
             default_password = "password123"  # Default password for all new employees
-            hashed_password = generate_password_hash(default_password)
+            hashed_password = passwords.hash_password(default_password)
             
-            db = get_db()
-            cursor = db.cursor()
-            
-            try:
-                # Start transaction
-                cursor.execute("BEGIN")
-                
-                # Insert the user
-                cursor.execute(
+            # Insert the user, the employee and the link in one transaction
+            with transaction():
+                user_id = execute_db(
                     "INSERT INTO users (username, password, is_admin) VALUES (?, ?, ?)",
                     (name.lower(), hashed_password, False)
                 )
-                user_id = cursor.lastrowid
                 
-                # Create the employee record
-                cursor.execute(
+                employee_id = execute_db(
                     "INSERT INTO employees (name, hourly_rate, user_id) VALUES (?, ?, ?)",
                     (name, hourly_rate, user_id)
                 )
-                employee_id = cursor.lastrowid
+                set_rate(employee_id, hourly_rate, FIRST_DAY)
                 
-                # Update the user with the employee_id
-                cursor.execute(
+                execute_db(
                     "UPDATE users SET employee_id = ? WHERE id = ?",
                     (employee_id, user_id)
                 )
-                
-                # Commit transaction
-                db.commit()
-                
-                flash(f'''Employee {name} added successfully! 
-                      They can login with:
-                      Username: {name.lower()}
-                      Password: {default_password}''', 'success')
-                return redirect(url_for('admin.employees'))
-                
-            except Exception as e:
-                # Rollback transaction on error
-                db.rollback()
-                raise e
+            invalidate_admin_dashboard(STATS_FRAGMENT, EMPLOYEES_FRAGMENT)
+            
+            flash(f'''Employee {name} added successfully! 
+                  They can login with:
+                  Username: {name.lower()}
+                  Password: {default_password}''', 'success')
+            return redirect(url_for('admin.employees'))
             
         except Exception as e:
             flash(f'Error adding employee: {str(e)}', 'error')
@@ -156,6 +151,42 @@ def add_employee():
     
     return render_template('admin/add_employee.html')
 
+@bp.route('/admin/import_employees', methods=['GET', 'POST'])
+@login_required
+def import_employees():
+    if not current_user.is_admin:
+        flash('Access denied. Admin privileges required.', 'danger')
+        return redirect(url_for('employee.dashboard'))
+    
+    result = None
+    if request.method == 'POST':
+        upload = request.files.get('file')
+        if not upload or not upload.filename:
+            flash('Please choose a file to import.', 'danger')
+            return redirect(url_for('admin.import_employees'))
+        
+        try:
+            result = onboarding.onboard_employees(
+                onboarding.read_employee_rows(upload.stream, upload.filename),
+                skip_invalid=request.form.get('skip_invalid') == '1'
+            )
+        except ValueError as e:
+            flash(f'Could not read {upload.filename}: {str(e)}', 'danger')
+            return redirect(url_for('admin.import_employees'))
+        except Exception as e:
+            flash(f'Error importing employees: {str(e)}', 'danger')
+            return redirect(url_for('admin.import_employees'))
+        
+        if request.args.get('format') == 'json':
+            return jsonify(result), (200 if result['created'] or not result['errors'] else 422)
+        
+        if result['created']:
+            flash(f"Added {result['created']} employees.", 'success')
+    
+    return render_template('admin/import_employees.html',
+                         result=result,
+                         default_password=onboarding.DEFAULT_PASSWORD)
+
 @bp.route('/edit_employee/<int:id>', methods=['GET', 'POST'])
 @login_required
 def edit_employee(id):
@@ -173,6 +204,9 @@ def edit_employee(id):
         if request.method == 'POST':
             name = request.form['name']
             hourly_rate = float(request.form['hourly_rate'])
+            effective_from = request.form.get('effective_from')
+            effective_from = (datetime.strptime(effective_from, '%Y-%m-%d').date()
+                              if effective_from else date.today())
             
             if not name:
                 flash('Employee name is required', 'error')
@@ -182,15 +216,26 @@ def edit_employee(id):
                 flash('Hourly rate must be greater than 0', 'error')
                 return redirect(url_for('admin.edit_employee', id=id))
             
-            execute_db(
-                "UPDATE employees SET name = ?, hourly_rate = ? WHERE id = ?",
-                (name, hourly_rate, id)
-            )
+            with transaction():
+                execute_db("UPDATE employees SET name = ? WHERE id = ?", (name, id))
+                # A new rate applies from its effective date; earlier work
+                # records keep the rate they were paid at
+                if rate_on(id, effective_from) != hourly_rate:
+                    set_rate(id, hourly_rate, effective_from)
+                # Stored reports show the employee's name and rate
+                bump_employee_versions(id)
+            invalidate_admin_dashboard(RECENT_FRAGMENT, EMPLOYEES_FRAGMENT)
             
             flash('Employee updated successfully', 'success')
+            if request.form.get('recompute') == '1':
+                result = recompute.recompute_amounts([id], start_date=effective_from)
+                flash(f"Repriced {result['updated']} of {result['records']} work records.", 'info')
             return redirect(url_for('admin.employees'))
         
-        return render_template('admin/edit_employee.html', employee=employee)
+        return render_template('admin/edit_employee.html',
+                             employee=employee,
+                             rates=rate_history(id),
+                             today=date.today())
     except Exception as e:
         flash(f'Error editing employee: {str(e)}', 'error')
         return redirect(url_for('admin.employees'))
@@ -219,21 +264,49 @@ def delete_employee(id):
             flash('Cannot delete admin users', 'error')
             return redirect(url_for('admin.employees'))
             
-        # Delete the user account first
-        if employee['user_id']:
-            execute_db("DELETE FROM users WHERE id = ?", (employee['user_id'],))
-            
-        # Delete work records for this employee
-        execute_db("DELETE FROM work_records WHERE employee_id = ?", (id,))
-            
-        # Then delete the employee record
-        execute_db("DELETE FROM employees WHERE id = ?", (id,))
+        with transaction():
+            # Delete the user account first
+            if employee['user_id']:
+                execute_db("DELETE FROM users WHERE id = ?", (employee['user_id'],))
+                
+            # Delete work records for this employee
+            execute_db("DELETE FROM work_records WHERE employee_id = ?", (id,))
+                
+            remove_employee(id)
+            remove_rates(id)
+                
+            # Then delete the employee record
+            execute_db("DELETE FROM employees WHERE id = ?", (id,))
+        invalidate_admin_dashboard()
         
         flash('Employee deleted successfully', 'success')
     except Exception as e:
         flash(f'Error deleting employee: {str(e)}', 'error')
     return redirect(url_for('admin.employees'))
 
+def work_record_filters(args):
+    """Build SQL conditions for the employee and date range filters.
+    
+    Returns (where, params, filters) where filters holds the cleaned
+    arguments so they can be carried over into pagination links.
+    """
+    where, params, filters = [], {}, {}
+    
+    employee_id = args.get('employee_id')
+    if employee_id and employee_id != 'all':
+        where.append("wr.employee_id = :employee_id")
+        params['employee_id'] = int(employee_id)
+        filters['employee_id'] = params['employee_id']
+    
+    for name, operator in (('start_date', '>='), ('end_date', '<=')):
+        value = args.get(name)
+        if value:
+            params[name] = datetime.strptime(value, '%Y-%m-%d').date()
+            where.append(f"wr.date {operator} :{name}")
+            filters[name] = value
+    
+    return where, params, filters
+
 @bp.route('/admin/work_records')
 @login_required
 def work_records():
@@ -242,13 +315,35 @@ def work_records():
         return redirect(url_for('main.index'))
     
     try:
-        records = query_db("""
-            SELECT wr.*, e.name as employee_name
-            FROM work_records wr
-            JOIN employees e ON wr.employee_id = e.id
-            ORDER BY wr.date DESC
-        """)
-        return render_template('admin/work_records.html', records=records)
+        try:
+            where, params, filters = work_record_filters(request.args)
+        except ValueError:
+            flash('Invalid filter. Please check your values.', 'danger')
+            where, params, filters = [], {}, {}
+        
+        page_size = get_page_size(request.args)
+        with read_replica():
+            records, next_cursor = keyset_page(
+                """SELECT wr.*, e.name as employee_name
+                   FROM work_records wr
+                   JOIN employees e ON wr.employee_id = e.id""",
+                where, params,
+                keys=[('wr.date', 'date', date.fromisoformat), ('wr.id', 'id', int)],
+                cursor=request.args.get('cursor'),
+                page_size=page_size
+            )
+            
+            if request.args.get('format') == 'json':
+                return jsonify(records=[serialize_row(r) for r in records],
+                               next_cursor=next_cursor)
+            
+            employees = query_db("SELECT id, name FROM employees ORDER BY name")
+        return render_template('admin/work_records.html',
+                             records=records,
+                             employees=employees,
+                             filters=filters,
+                             next_cursor=next_cursor,
+                             per_page=page_size)
     except Exception as e:
         flash(f'Error loading work records: {str(e)}', 'danger')
         return redirect(url_for('main.index'))
@@ -266,26 +361,25 @@ def add_work_record():
             date = request.form.get('date')
             hours_worked = float(request.form.get('hours_worked'))
             
-            # Get employee's hourly rate
-            employee = query_db(
-                "SELECT hourly_rate FROM employees WHERE id = ?",
-                (employee_id,),
-                one=True
-            )
+            # Get the hourly rate in effect on the record's date
+            hourly_rate = rate_on(employee_id, datetime.strptime(date, '%Y-%m-%d').date())
             
-            if not employee:
+            if hourly_rate is None:
                 flash('Employee not found.', 'danger')
                 return redirect(url_for('admin.add_work_record'))
             
-            amount_earned = hours_worked * employee['hourly_rate']
+            amount_earned = hours_worked * hourly_rate
             
-            # Insert work record
-            execute_db(
-                """INSERT INTO work_records 
-                   (employee_id, date, hours_worked, amount_earned)
-                   VALUES (?, ?, ?, ?)""",
-                (employee_id, date, hours_worked, amount_earned)
-            )
+            # Insert work record and update the rollups
+            with transaction():
+                execute_db(
+                    """INSERT INTO work_records 
+                       (employee_id, date, hours_worked, amount_earned)
+                       VALUES (?, ?, ?, ?)""",
+                    (employee_id, date, hours_worked, amount_earned)
+                )
+                record_delta(employee_id, date, hours_worked, amount_earned)
+            invalidate_admin_dashboard(STATS_FRAGMENT, RECENT_FRAGMENT)
             
             flash('Work record added successfully!', 'success')
             return redirect(url_for('admin.work_records'))
@@ -299,6 +393,78 @@ def add_work_record():
     employees = query_db("SELECT id, name FROM employees ORDER BY name")
     return render_template('admin/add_work_record.html', employees=employees)
 
+@bp.route('/admin/import_work_records', methods=['GET', 'POST'])
+@login_required
+def import_work_records():
+    if not current_user.is_admin:
+        flash('Access denied. Admin privileges required.', 'danger')
+        return redirect(url_for('main.index'))
+    
+    result = None
+    if request.method == 'POST':
+        upload = request.files.get('file')
+        if not upload or not upload.filename:
+            flash('Please choose a file to import.', 'danger')
+            return redirect(url_for('admin.import_work_records'))
+        
+        try:
+            # Rows are parsed straight from the upload stream
+            result = bulk_import.import_work_records(
+                bulk_import.read_rows(upload.stream, upload.filename),
+                skip_invalid=request.form.get('skip_invalid') == '1'
+            )
+        except ValueError as e:
+            flash(f'Could not read {upload.filename}: {str(e)}', 'danger')
+            return redirect(url_for('admin.import_work_records'))
+        except Exception as e:
+            flash(f'Error importing work records: {str(e)}', 'danger')
+            return redirect(url_for('admin.import_work_records'))
+        
+        if request.args.get('format') == 'json':
+            return jsonify(result), (200 if result['inserted'] or not result['errors'] else 422)
+        
+        if result['inserted']:
+            flash(f"Imported {result['inserted']} work records.", 'success')
+    
+    return render_template('admin/import_work_records.html', result=result)
+
+@bp.route('/admin/recompute_amounts', methods=['GET', 'POST'])
+@login_required
+def recompute_amounts():
+    if not current_user.is_admin:
+        flash('Access denied. Admin privileges required.', 'danger')
+        return redirect(url_for('main.index'))
+    
+    result = None
+    if request.method == 'POST':
+        try:
+            employee_ids = [int(value) for value in request.form.getlist('employee_id') if value != 'all']
+            start_date = request.form.get('start_date')
+            end_date = request.form.get('end_date')
+            start_date = datetime.strptime(start_date, '%Y-%m-%d').date() if start_date else None
+            end_date = datetime.strptime(end_date, '%Y-%m-%d').date() if end_date else None
+        except ValueError:
+            flash('Invalid input. Please check your values.', 'danger')
+            return redirect(url_for('admin.recompute_amounts'))
+        
+        if start_date and end_date and end_date < start_date:
+            flash('End date must be after start date', 'danger')
+            return redirect(url_for('admin.recompute_amounts'))
+        
+        try:
+            result = recompute.recompute_amounts(employee_ids or None, start_date, end_date)
+        except Exception as e:
+            flash(f'Error recomputing amounts: {str(e)}', 'danger')
+            return redirect(url_for('admin.recompute_amounts'))
+        
+        if request.args.get('format') == 'json':
+            return jsonify(result)
+        
+        flash(f"Repriced {result['updated']} of {result['records']} work records.", 'success')
+    
+    employees = query_db("SELECT id, name FROM employees ORDER BY name")
+    return render_template('admin/recompute_amounts.html', employees=employees, result=result)
+
 @bp.route('/edit_work_record/<int:id>', methods=['GET', 'POST'])
 @login_required
 def edit_work_record(id):
@@ -327,27 +493,28 @@ def edit_work_record(id):
                     flash('Hours worked must be greater than 0', 'error')
                     return redirect(url_for('admin.edit_work_record', id=id))
                 
-                # Get employee's hourly rate
-                employee = query_db(
-                    "SELECT hourly_rate FROM employees WHERE id = ?",
-                    (record['employee_id'],),
-                    one=True
-                )
+                # Get the hourly rate in effect on the record's date
+                hourly_rate = rate_on(record['employee_id'], datetime.strptime(date, '%Y-%m-%d').date())
                 
-                if not employee:
+                if hourly_rate is None:
                     flash('Employee not found', 'error')
                     return redirect(url_for('admin.edit_work_record', id=id))
                 
                 # Calculate new amount earned
-                amount_earned = hours_worked * employee['hourly_rate']
+                amount_earned = hours_worked * hourly_rate
                 
-                # Update the work record
-                execute_db(
-                    """UPDATE work_records 
-                       SET date = ?, hours_worked = ?, amount_earned = ?
-                       WHERE id = ?""",
-                    (date, hours_worked, amount_earned, id)
-                )
+                # Update the work record and move it within the rollups
+                with transaction():
+                    execute_db(
+                        """UPDATE work_records 
+                           SET date = ?, hours_worked = ?, amount_earned = ?
+                           WHERE id = ?""",
+                        (date, hours_worked, amount_earned, id)
+                    )
+                    record_delta(record['employee_id'], record['date'],
+                                 record['hours_worked'], record['amount_earned'], count=-1)
+                    record_delta(record['employee_id'], date, hours_worked, amount_earned)
+                invalidate_admin_dashboard(STATS_FRAGMENT, RECENT_FRAGMENT)
                 
                 flash('Work record updated successfully', 'success')
                 return redirect(url_for('admin.work_records'))
@@ -379,8 +546,22 @@ def edit_work_record(id):
 @login_required
 def delete_work_record(id):
     try:
-        # Delete the work record
-        execute_db("DELETE FROM work_records WHERE id = ?", (id,))
+        record = query_db(
+            "SELECT * FROM work_records WHERE id = ?",
+            (id,),
+            one=True
+        )
+        
+        if not record:
+            flash('Work record not found', 'error')
+            return redirect(url_for('admin.work_records'))
+        
+        # Delete the work record and take it out of the rollups
+        with transaction():
+            execute_db("DELETE FROM work_records WHERE id = ?", (id,))
+            record_delta(record['employee_id'], record['date'],
+                         record['hours_worked'], record['amount_earned'], count=-1)
+        invalidate_admin_dashboard(STATS_FRAGMENT, RECENT_FRAGMENT)
         flash('Work record deleted successfully', 'success')
     except Exception as e:
         flash(f'Error deleting work record: {str(e)}', 'error')
@@ -399,7 +580,8 @@ def reports():
         
         # Get recent reports
         recent_reports = query_db("""
-            SELECT r.*, e.name as employee_name
+            SELECT r.id, r.employee_id, r.report_type, r.start_date, r.end_date,
+                   r.content_size, r.date_created, e.name as employee_name
             FROM reports r
             LEFT JOIN employees e ON r.employee_id = e.id
             ORDER BY r.date_created DESC
@@ -425,6 +607,11 @@ def generate_report():
         start_date = request.form.get('start_date')
         end_date = request.form.get('end_date')
         report_type = request.form.get('report_type')
+        file_format = request.form.get('file_format', 'pdf')
+        
+        if report_type not in TEMPLATES or file_format not in FORMATS:
+            flash('Unknown report type or format', 'danger')
+            return redirect(url_for('admin.reports'))
         
         # Validate dates
         start_date = datetime.strptime(start_date, '%Y-%m-%d').date()
@@ -434,85 +621,78 @@ def generate_report():
             flash('End date must be after start date', 'danger')
             return redirect(url_for('admin.reports'))
         
-        # Build query based on report type
-        if report_type == 'work_records':
-            query = """
-                SELECT wr.*, e.name as employee_name
-                FROM work_records wr
-                JOIN employees e ON wr.employee_id = e.id
-                WHERE wr.date BETWEEN ? AND ?
-            """
-            params = [start_date, end_date]
-            
-            if employee_id != 'all':
-                query += " AND wr.employee_id = ?"
-                params.append(employee_id)
-            
-            query += " ORDER BY e.name, wr.date DESC"
-            records = query_db(query, params)
-            
-            # Generate report content
-            pdf_content = generate_work_records_pdf(records, start_date, end_date)
-            
-        elif report_type == 'earnings':
-            query = """
-                SELECT e.name as employee_name, 
-                       SUM(wr.hours_worked) as total_hours,
-                       SUM(wr.amount_earned) as total_earnings
-                FROM work_records wr
-                JOIN employees e ON wr.employee_id = e.id
-                WHERE wr.date BETWEEN ? AND ?
-            """
-            params = [start_date, end_date]
-            
-            if employee_id != 'all':
-                query += " AND wr.employee_id = ?"
-                params.append(employee_id)
-            
-            query += " GROUP BY e.id, e.name ORDER BY e.name"
-            records = query_db(query, params)
-            
-            # Generate report content
-            pdf_content = generate_earnings_pdf(records, start_date, end_date)
-            
-        else:  # detailed report
-            query = """
-                SELECT wr.*, e.name as employee_name, e.hourly_rate
-                FROM work_records wr
-                JOIN employees e ON wr.employee_id = e.id
-                WHERE wr.date BETWEEN ? AND ?
-            """
-            params = [start_date, end_date]
-            
-            if employee_id != 'all':
-                query += " AND wr.employee_id = ?"
-                params.append(employee_id)
-            
-            query += " ORDER BY e.name, wr.date DESC"
-            records = query_db(query, params)
-            
-            # Generate report content
-            pdf_content = generate_detailed_pdf(records, start_date, end_date)
-        
-        # Save report to database
-        report_id = execute_db(
-            """INSERT INTO reports 
-               (employee_id, report_type, start_date, end_date, content)
-               VALUES (?, ?, ?, ?, ?)""",
-            (employee_id if employee_id != 'all' else None,
-             report_type,
-             start_date,
-             end_date,
-             pdf_content)
+        employee_id = employee_id if employee_id != 'all' else None
+        
+        # Serve an identical report over unchanged data straight from the store
+        fingerprint = report_fingerprint('admin', employee_id, report_type, start_date, end_date, file_format)
+        report_id = find_report(fingerprint)
+        if report_id:
+            download_url = url_for('admin.download_report', report_id=report_id)
+            if request.args.get('format') == 'json':
+                return jsonify(report_id=report_id, download_url=download_url)
+            return redirect(download_url)
+        
+        # Queue the report; a background worker builds and saves it
+        job_id = enqueue_report(
+            'admin',
+            employee_id,
+            report_type,
+            start_date,
+            end_date,
+            current_user.id,
+            file_format=file_format,
+            fingerprint=fingerprint
         )
         
-        flash('Report generated successfully!', 'success')
-        return redirect(url_for('admin.download_report', report_id=report_id))
+        if request.args.get('format') == 'json':
+            return jsonify(job_id=job_id,
+                           status_url=url_for('admin.report_job', job_id=job_id, format='json')), 202
+        
+        flash('Report queued. It will download when ready.', 'info')
+        return redirect(url_for('admin.report_job', job_id=job_id))
         
     except Exception as e:
         flash(f'Error generating report: {str(e)}', 'danger')
         return redirect(url_for('admin.reports'))
 
+@bp.route('/admin/export/work_records')
+@login_required
+def export_work_records():
+    if not current_user.is_admin:
+        flash('Access denied. Admin privileges required.', 'danger')
+        return redirect(url_for('employee.dashboard'))
+    
+    file_format = request.args.get('file_format', 'csv')
+    if file_format not in export.FORMATS:
+        flash('Unknown export format', 'danger')
+        return redirect(url_for('admin.reports'))
+    
+    try:
+        employee_id = request.args.get('employee_id', 'all')
+        start_date = datetime.strptime(request.args.get('start_date', ''), '%Y-%m-%d').date()
+        end_date = datetime.strptime(request.args.get('end_date', ''), '%Y-%m-%d').date()
+        employee_id = int(employee_id) if employee_id != 'all' else None
+    except ValueError:
+        flash('Export needs start_date and end_date as YYYY-MM-DD and an employee_id or "all"', 'danger')
+        return redirect(url_for('admin.reports'))
+    
+    if end_date < start_date:
+        flash('End date must be after start date', 'danger')
+        return redirect(url_for('admin.reports'))
+    
+    # Rows go out as they are read from the cursor, never buffered whole
+    mimetype, encode = export.FORMATS[file_format]
+    chunks = encode(export.export_rows(start_date, end_date, employee_id))
+    filename = f'work_records_{start_date}_{end_date}.{file_format}'
+    if request.args.get('gzip') == '1':
+        chunks = export.gzip_chunks(chunks)
+        mimetype = 'application/gzip'
+        filename += '.gz'
+    
+    response = Response(stream_with_context(chunks), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+    return response
+
 @bp.route('/admin/download_report/<int:report_id>')
 @login_required
 def download_report(report_id):
@@ -522,7 +702,7 @@ def download_report(report_id):
     
     try:
         report = query_db(
-            "SELECT * FROM reports WHERE id = ?",
+            "SELECT id, employee_id, file_format, content_hash, content_size FROM reports WHERE id = ?",
             (report_id,),
             one=True
         )
@@ -531,166 +711,114 @@ def download_report(report_id):
             flash('Report not found', 'danger')
             return redirect(url_for('admin.reports'))
         
-        # Create response with report content
-        response = make_response(report['content'])
-        response.headers['Content-Type'] = 'application/pdf'
-        response.headers['Content-Disposition'] = f'attachment; filename=report_{report_id}.pdf'
-        
-        return response
+        # Stream the stored file, honouring Range and If-None-Match
+        return send_report(report)
         
     except Exception as e:
         flash(f'Error downloading report: {str(e)}', 'danger')
         return redirect(url_for('admin.reports'))
 
-def generate_work_records_pdf(records, start_date, end_date):
-    """Generate PDF content for work records report"""
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=letter)
-    styles = getSampleStyleSheet()
-    elements = []
-    
-    # Title
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=16,
-        spaceAfter=30
-    )
-    elements.append(Paragraph('Work Records Report', title_style))
-    elements.append(Paragraph(f'Period: {start_date} to {end_date}', styles['Normal']))
-    elements.append(Spacer(1, 20))
-    
-    # Table data
-    data = [['Employee', 'Date', 'Hours Worked', 'Amount Earned']]
-    for record in records:
-        data.append([
-            record['employee_name'],
-            record['date'].strftime('%Y-%m-%d'),
-            f"{record['hours_worked']:.2f}",
-            f"${record['amount_earned']:.2f}"
-        ])
-    
-    # Create table
-    table = Table(data)
-    table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 12),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-        ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
-        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-        ('FONTSIZE', (0, 1), (-1, -1), 10),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black)
-    ]))
-    
-    elements.append(table)
-    doc.build(elements)
-    
-    buffer.seek(0)
-    return buffer.getvalue()
+@bp.route('/admin/report_jobs/<int:job_id>')
+@login_required
+def report_job(job_id):
+    if not current_user.is_admin:
+        flash('Access denied. Admin privileges required.', 'danger')
+        return redirect(url_for('employee.dashboard'))
+    
+    job = get_job(job_id)
+    if not job:
+        flash('Report job not found', 'danger')
+        return redirect(url_for('admin.reports'))
+    job = poll_job(job)
+    
+    download_url = None
+    if job['report_id']:
+        download_url = url_for('admin.download_report', report_id=job['report_id'])
+    
+    if request.args.get('format') == 'json':
+        return jsonify(job=serialize_row(job), download_url=download_url)
+    
+    return render_template('report_job.html',
+                         job=job,
+                         download_url=download_url,
+                         back_url=url_for('admin.reports'))
 
-def generate_earnings_pdf(records, start_date, end_date):
-    """Generate PDF content for earnings report"""
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=letter)
-    styles = getSampleStyleSheet()
-    elements = []
-    
-    # Title
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=16,
-        spaceAfter=30
-    )
-    elements.append(Paragraph('Earnings Summary Report', title_style))
-    elements.append(Paragraph(f'Period: {start_date} to {end_date}', styles['Normal']))
-    elements.append(Spacer(1, 20))
-    
-    # Table data
-    data = [['Employee', 'Total Hours', 'Total Earnings']]
-    for record in records:
-        data.append([
-            record['employee_name'],
-            f"{record['total_hours']:.2f}",
-            f"${record['total_earnings']:.2f}"
-        ])
-    
-    # Create table
-    table = Table(data)
-    table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 12),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-        ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
-        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-        ('FONTSIZE', (0, 1), (-1, -1), 10),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black)
-    ]))
-    
-    elements.append(table)
-    doc.build(elements)
-    
-    buffer.seek(0)
-    return buffer.getvalue()
+@bp.route('/admin/pay_runs', methods=['GET', 'POST'])
+@login_required
+def pay_runs():
+    if not current_user.is_admin:
+        flash('Access denied. Admin privileges required.', 'danger')
+        return redirect(url_for('employee.dashboard'))
+    
+    if request.method == 'POST':
+        try:
+            start_date = datetime.strptime(request.form.get('start_date', ''), '%Y-%m-%d').date()
+            end_date = datetime.strptime(request.form.get('end_date', ''), '%Y-%m-%d').date()
+        except ValueError:
+            flash('Please enter the pay period as YYYY-MM-DD dates', 'danger')
+            return redirect(url_for('admin.pay_runs'))
+        
+        if end_date < start_date:
+            flash('End date must be after start date', 'danger')
+            return redirect(url_for('admin.pay_runs'))
+        
+        # numpy is only loaded by the workers that actually run payroll
+        from app import payroll
+        try:
+            result = payroll.run_payroll(start_date, end_date, created_by=current_user.id)
+        except Exception as e:
+            flash(f'Error running payroll: {str(e)}', 'danger')
+            return redirect(url_for('admin.pay_runs'))
+        
+        if request.args.get('format') == 'json':
+            return jsonify(result), 201
+        
+        flash(f"Pay run computed for {result['employees']} employees from {result['records']} records.", 'success')
+        return redirect(url_for('admin.pay_run', pay_run_id=result['pay_run_id']))
+    
+    try:
+        runs = query_db("""
+            SELECT id, period_start, period_end, employee_count, record_count,
+                   regular_hours, overtime_hours, gross_pay, created_at
+            FROM pay_runs
+            ORDER BY created_at DESC, id DESC
+            LIMIT 20
+        """)
+        
+        if request.args.get('format') == 'json':
+            return jsonify(pay_runs=[serialize_row(run) for run in runs])
+        
+        return render_template('admin/pay_runs.html', pay_runs=runs)
+    except Exception as e:
+        flash(f'Error loading pay runs: {str(e)}', 'danger')
+        return redirect(url_for('admin.dashboard'))
 
-def generate_detailed_pdf(records, start_date, end_date):
-    """Generate PDF content for detailed report"""
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=letter)
-    styles = getSampleStyleSheet()
-    elements = []
-    
-    # Title
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=16,
-        spaceAfter=30
-    )
-    elements.append(Paragraph('Detailed Report', title_style))
-    elements.append(Paragraph(f'Period: {start_date} to {end_date}', styles['Normal']))
-    elements.append(Spacer(1, 20))
-    
-    # Table data
-    data = [['Employee', 'Date', 'Hourly Rate', 'Hours Worked', 'Amount Earned']]
-    for record in records:
-        data.append([
-            record['employee_name'],
-            record['date'].strftime('%Y-%m-%d'),
-            f"${record['hourly_rate']:.2f}",
-            f"{record['hours_worked']:.2f}",
-            f"${record['amount_earned']:.2f}"
-        ])
-    
-    # Create table
-    table = Table(data)
-    table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 12),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-        ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
-        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-        ('FONTSIZE', (0, 1), (-1, -1), 10),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black)
-    ]))
-    
-    elements.append(table)
-    doc.build(elements)
-    
-    buffer.seek(0)
-    return buffer.getvalue() 
\ No newline at end of file
+@bp.route('/admin/pay_runs/<int:pay_run_id>')
+@login_required
+def pay_run(pay_run_id):
+    if not current_user.is_admin:
+        flash('Access denied. Admin privileges required.', 'danger')
+        return redirect(url_for('employee.dashboard'))
+    
+    try:
+        run = query_db("SELECT * FROM pay_runs WHERE id = ?", (pay_run_id,), one=True)
+        if not run:
+            flash('Pay run not found', 'danger')
+            return redirect(url_for('admin.pay_runs'))
+        
+        lines = query_db("""
+            SELECT l.employee_id, e.name as employee_name, l.record_count,
+                   l.regular_hours, l.overtime_hours, l.gross_pay
+            FROM pay_run_lines l
+            LEFT JOIN employees e ON l.employee_id = e.id
+            WHERE l.pay_run_id = ?
+            ORDER BY e.name, l.employee_id
+        """, (pay_run_id,))
+        
+        if request.args.get('format') == 'json':
+            return jsonify(pay_run=serialize_row(run), lines=[serialize_row(line) for line in lines])
+        
+        return render_template('admin/pay_run.html', pay_run=run, lines=lines)
+    except Exception as e:
+        flash(f'Error loading pay run: {str(e)}', 'danger')
+        return redirect(url_for('admin.pay_runs'))
@@ -1,8 +1,6 @@
 from flask import Blueprint, render_template, redirect, url_for, flash, request
 from flask_login import login_user, logout_user, login_required, current_user
-from app.models import User
-from app.database import query_db, execute_db
-from werkzeug.security import generate_password_hash, check_password_hash
+from app import identity, passwords
 
 bp = Blueprint('auth', __name__)
 
@@ -22,10 +20,16 @@ def login():
             flash('Please enter both username and password', 'error')
             return render_template('auth/login.html')
         
-        user = User.get_by_username(username)
-        if user and user.check_password(password):
-            login_user(user)
-            if user.is_admin:
+        try:
+            user = passwords.authenticate(username, password)
+        except passwords.VerifierBusy:
+            # Refuse rather than queue behind a login burst
+            flash('Too many logins right now, please try again in a moment', 'error')
+            return render_template('auth/login.html'), 503, {'Retry-After': '5'}
+        
+        if user:
+            login_user(identity.load_user(user['id']))
+            if user['is_admin']:
                 return redirect(url_for('admin.dashboard'))
             else:
                 return redirect(url_for('employee.dashboard'))
@@ -38,6 +42,7 @@ def login():
 @login_required
 def logout():
     logout_user()
+    identity.forget()
     return redirect(url_for('auth.login'))
 
 @bp.route('/change-password', methods=['GET', 'POST'])
@@ -56,9 +61,13 @@ def change_password():
             flash('New passwords do not match', 'danger')
             return redirect(url_for('auth.change_password'))
         
-        user = User.get(current_user.id)
-        if user and user.check_password(current_password):
-            user.set_password(new_password)
+        try:
+            changed = passwords.change_password(current_user.id, current_password, new_password)
+        except passwords.VerifierBusy:
+            flash('Too many password checks right now, please try again in a moment', 'danger')
+            return redirect(url_for('auth.change_password'))
+        
+        if changed:
             flash('Your password has been updated!', 'success')
             if current_user.is_admin:
                 return redirect(url_for('admin.dashboard'))
@@ -1,15 +1,14 @@
-from flask import Blueprint, render_template, flash, redirect, url_for, request, make_response
+from flask import Blueprint, render_template, flash, redirect, url_for, request, jsonify, abort
 from flask_login import login_required, current_user
-from app.models import DailyWorkRecord, Employee
-from datetime import datetime, timedelta, date
-from app.database import query_db, execute_db
-from werkzeug.security import generate_password_hash, check_password_hash
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
-import io
+from datetime import datetime, date
+from app.database import query_db, read_replica
+from app.pagination import get_page_size, keyset_page, serialize_row
+from app.stats import get_employee_stats, get_recent_records
+from app.jobs import enqueue_report, get_job, poll_job
+from app.storage import send_report
+from app.report_cache import report_fingerprint, find_report
+from app.report_engine import TEMPLATES, FORMATS
+from app.passwords import change_password as set_new_password, VerifierBusy
 
 bp = Blueprint('employee', __name__)
 
@@ -21,57 +20,30 @@ def dashboard():
         return redirect(url_for('admin.dashboard'))
         
     try:
-        # Get employee details
-        employee = query_db(
-            "SELECT * FROM employees WHERE id = ?",
-            (current_user.employee_id,),
-            one=True
-        )
+        # Employee details, loaded with the user
+        employee = current_user.employee
         if not employee:
             flash('Employee not found', 'error')
             return redirect(url_for('auth.login'))
             
-        # Get employee's work records
-        work_records = query_db("""
-            SELECT * FROM work_records 
-            WHERE employee_id = ? 
-            ORDER BY date DESC
-        """, (current_user.employee_id,))
-        
-        # Calculate statistics
-        total_hours = sum(record['hours_worked'] for record in work_records)
-        total_earnings = sum(record['amount_earned'] for record in work_records)
-        
-        # Calculate this month's earnings
-        today = date.today()
-        first_day = today.replace(day=1)
-        month_earnings = sum(
-            record['amount_earned'] for record in work_records 
-            if isinstance(record['date'], date) and record['date'] >= first_day
-        )
-        
-        # Get recent records (last 10)
-        recent_records = work_records[:10]
+        # Get employee statistics and recent records
+        stats = get_employee_stats(current_user.employee_id)
+        stats['hourly_rate'] = employee['hourly_rate']
+        recent_records = get_recent_records(current_user.employee_id)
         
         # Get recent reports
         recent_reports = query_db("""
-            SELECT * FROM reports 
+            SELECT id, employee_id, report_type, start_date, end_date,
+                   content_size, date_created
+            FROM reports 
             WHERE employee_id = ? 
             ORDER BY date_created DESC
             LIMIT 10
         """, (current_user.employee_id,))
         
-        stats = {
-            'total_hours': total_hours,
-            'total_earnings': total_earnings,
-            'month_earnings': month_earnings,
-            'hourly_rate': employee['hourly_rate']
-        }
-        
         return render_template('employee/dashboard.html', 
                              employee=employee,
                              stats=stats,
-                             work_records=work_records,
                              recent_records=recent_records,
                              recent_reports=recent_reports)
     except Exception as e:
@@ -98,21 +70,13 @@ def change_password():
             flash('New passwords do not match', 'danger')
             return redirect(url_for('employee.dashboard'))
         
-        # Get user from database
-        user = query_db(
-            "SELECT * FROM users WHERE id = ?",
-            (current_user.id,),
-            one=True
-        )
+        try:
+            changed = set_new_password(current_user.id, current_password, new_password)
+        except VerifierBusy:
+            flash('Too many password checks right now, please try again in a moment', 'danger')
+            return redirect(url_for('employee.dashboard'))
         
-        if user and check_password_hash(user['password'], current_password):
-            # Update password
-            hashed_password = generate_password_hash(new_password)
-            query_db(
-                "UPDATE users SET password = ? WHERE id = ?",
-                (hashed_password, current_user.id),
-                commit=True
-            )
+        if changed:
             flash('Your password has been updated!', 'success')
             return redirect(url_for('employee.dashboard'))
         
@@ -129,15 +93,40 @@ def work_records():
         return redirect(url_for('admin.dashboard'))
         
     try:
-        # Get all work records for the current employee
-        work_records = query_db("""
-            SELECT * FROM work_records 
-            WHERE employee_id = ? 
-            ORDER BY date DESC
-        """, (current_user.employee_id,))
+        where = ["employee_id = :employee_id"]
+        params = {'employee_id': current_user.employee_id}
+        filters = {}
+        try:
+            for name, operator in (('start_date', '>='), ('end_date', '<=')):
+                value = request.args.get(name)
+                if value:
+                    params[name] = datetime.strptime(value, '%Y-%m-%d').date()
+                    where.append(f"date {operator} :{name}")
+                    filters[name] = value
+        except ValueError:
+            flash('Invalid date filter.', 'danger')
+            where, filters = where[:1], {}
+        
+        # Get one page of work records for the current employee
+        page_size = get_page_size(request.args)
+        with read_replica():
+            work_records, next_cursor = keyset_page(
+                "SELECT * FROM work_records",
+                where, params,
+                keys=[('date', 'date', date.fromisoformat), ('id', 'id', int)],
+                cursor=request.args.get('cursor'),
+                page_size=page_size
+            )
+        
+        if request.args.get('format') == 'json':
+            return jsonify(records=[serialize_row(r) for r in work_records],
+                           next_cursor=next_cursor)
         
         return render_template('employee/work_records.html', 
-                             work_records=work_records)
+                             work_records=work_records,
+                             filters=filters,
+                             next_cursor=next_cursor,
+                             per_page=page_size)
     except Exception as e:
         flash('Error loading work records: ' + str(e), 'error')
         return redirect(url_for('employee.dashboard'))
@@ -150,12 +139,8 @@ def profile():
         return redirect(url_for('admin.dashboard'))
         
     try:
-        # Get employee details
-        employee = query_db(
-            "SELECT * FROM employees WHERE id = ?",
-            (current_user.employee_id,),
-            one=True
-        )
+        # Employee details, loaded with the user
+        employee = current_user.employee
         if not employee:
             flash('Employee not found', 'error')
             return redirect(url_for('employee.dashboard'))
@@ -175,7 +160,9 @@ def reports():
     try:
         # Get recent reports for the current employee
         recent_reports = query_db("""
-            SELECT * FROM reports 
+            SELECT id, employee_id, report_type, start_date, end_date,
+                   content_size, date_created
+            FROM reports 
             WHERE employee_id = ? 
             ORDER BY date_created DESC
             LIMIT 10
@@ -198,6 +185,11 @@ def generate_report():
         start_date = request.form.get('start_date')
         end_date = request.form.get('end_date')
         report_type = request.form.get('report_type')
+        file_format = request.form.get('file_format', 'pdf')
+        
+        if report_type not in TEMPLATES or file_format not in FORMATS:
+            flash('Unknown report type or format', 'danger')
+            return redirect(url_for('employee.dashboard'))
         
         # Validate dates
         start_date = datetime.strptime(start_date, '%Y-%m-%d').date()
@@ -207,56 +199,35 @@ def generate_report():
             flash('End date must be after start date', 'danger')
             return redirect(url_for('employee.dashboard'))
         
-        # Build query based on report type
-        if report_type == 'work_records':
-            query = """
-                SELECT wr.*, e.name as employee_name
-                FROM work_records wr
-                JOIN employees e ON wr.employee_id = e.id
-                WHERE wr.employee_id = ? AND wr.date BETWEEN ? AND ?
-                ORDER BY wr.date DESC
-            """
-            records = query_db(query, (current_user.employee_id, start_date, end_date))
-            pdf_content = generate_work_records_pdf(records, start_date, end_date)
-            
-        elif report_type == 'earnings':
-            query = """
-                SELECT e.name as employee_name, 
-                       SUM(wr.hours_worked) as total_hours,
-                       SUM(wr.amount_earned) as total_earnings
-                FROM work_records wr
-                JOIN employees e ON wr.employee_id = e.id
-                WHERE wr.employee_id = ? AND wr.date BETWEEN ? AND ?
-                GROUP BY e.id, e.name
-            """
-            records = query_db(query, (current_user.employee_id, start_date, end_date))
-            pdf_content = generate_earnings_pdf(records, start_date, end_date)
-            
-        else:  # detailed report
-            query = """
-                SELECT wr.*, e.name as employee_name, e.hourly_rate
-                FROM work_records wr
-                JOIN employees e ON wr.employee_id = e.id
-                WHERE wr.employee_id = ? AND wr.date BETWEEN ? AND ?
-                ORDER BY wr.date DESC
-            """
-            records = query_db(query, (current_user.employee_id, start_date, end_date))
-            pdf_content = generate_detailed_pdf(records, start_date, end_date)
+        employee_id = current_user.employee_id
         
-        # Save report to database
-        report_id = execute_db(
-            """INSERT INTO reports 
-               (employee_id, report_type, start_date, end_date, content)
-               VALUES (?, ?, ?, ?, ?)""",
-            (current_user.employee_id,
-             report_type,
-             start_date,
-             end_date,
-             pdf_content)
+        # Serve an identical report over unchanged data straight from the store
+        fingerprint = report_fingerprint('employee', employee_id, report_type, start_date, end_date, file_format)
+        report_id = find_report(fingerprint)
+        if report_id:
+            download_url = url_for('employee.download_report', report_id=report_id)
+            if request.args.get('format') == 'json':
+                return jsonify(report_id=report_id, download_url=download_url)
+            return redirect(download_url)
+        
+        # Queue the report; a background worker builds and saves it
+        job_id = enqueue_report(
+            'employee',
+            employee_id,
+            report_type,
+            start_date,
+            end_date,
+            current_user.id,
+            file_format=file_format,
+            fingerprint=fingerprint
         )
         
-        flash('Report generated successfully!', 'success')
-        return redirect(url_for('employee.download_report', report_id=report_id))
+        if request.args.get('format') == 'json':
+            return jsonify(job_id=job_id,
+                           status_url=url_for('employee.report_job', job_id=job_id, format='json')), 202
+        
+        flash('Report queued. It will download when ready.', 'info')
+        return redirect(url_for('employee.report_job', job_id=job_id))
         
     except Exception as e:
         flash(f'Error generating report: {str(e)}', 'danger')
@@ -271,7 +242,7 @@ def download_report(report_id):
     
     try:
         report = query_db(
-            "SELECT * FROM reports WHERE id = ? AND employee_id = ?",
+            "SELECT id, employee_id, file_format, content_hash, content_size FROM reports WHERE id = ? AND employee_id = ?",
             (report_id, current_user.employee_id),
             one=True
         )
@@ -280,169 +251,34 @@ def download_report(report_id):
             flash('Report not found', 'danger')
             return redirect(url_for('employee.dashboard'))
         
-        # Create response with report content
-        response = make_response(report['content'])
-        response.headers['Content-Type'] = 'application/pdf'
-        response.headers['Content-Disposition'] = f'attachment; filename=report_{report_id}.pdf'
-        
-        return response
+        # Stream the stored file, honouring Range and If-None-Match
+        return send_report(report)
         
     except Exception as e:
         flash(f'Error downloading report: {str(e)}', 'danger')
         return redirect(url_for('employee.dashboard'))
 
-def generate_work_records_pdf(records, start_date, end_date):
-    """Generate PDF content for work records report"""
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=letter)
-    styles = getSampleStyleSheet()
-    elements = []
-    
-    # Title and Employee Info
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=16,
-        spaceAfter=30
-    )
-    elements.append(Paragraph('Work Records Report', title_style))
-    if records:
-        elements.append(Paragraph(f'Employee: {records[0]["employee_name"]}', styles['Normal']))
-    elements.append(Paragraph(f'Period: {start_date} to {end_date}', styles['Normal']))
-    elements.append(Spacer(1, 20))
-    
-    # Table data
-    data = [['Date', 'Hours Worked', 'Amount Earned']]
-    for record in records:
-        data.append([
-            record['date'].strftime('%Y-%m-%d'),
-            f"{record['hours_worked']:.2f}",
-            f"${record['amount_earned']:.2f}"
-        ])
-    
-    # Create table
-    table = Table(data)
-    table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 12),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-        ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
-        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-        ('FONTSIZE', (0, 1), (-1, -1), 10),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black)
-    ]))
-    
-    elements.append(table)
-    doc.build(elements)
-    
-    buffer.seek(0)
-    return buffer.getvalue()
-
-def generate_earnings_pdf(records, start_date, end_date):
-    """Generate PDF content for earnings report"""
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=letter)
-    styles = getSampleStyleSheet()
-    elements = []
-    
-    # Title and Employee Info
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=16,
-        spaceAfter=30
-    )
-    elements.append(Paragraph('Earnings Summary Report', title_style))
-    if records:
-        elements.append(Paragraph(f'Employee: {records[0]["employee_name"]}', styles['Normal']))
-    elements.append(Paragraph(f'Period: {start_date} to {end_date}', styles['Normal']))
-    elements.append(Spacer(1, 20))
-    
-    # Table data
-    data = [['Total Hours', 'Total Earnings']]
-    for record in records:
-        data.append([
-            f"{record['total_hours']:.2f}",
-            f"${record['total_earnings']:.2f}"
-        ])
-    
-    # Create table
-    table = Table(data)
-    table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 12),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-        ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
-        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-        ('FONTSIZE', (0, 1), (-1, -1), 10),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black)
-    ]))
-    
-    elements.append(table)
-    doc.build(elements)
-    
-    buffer.seek(0)
-    return buffer.getvalue()
-
-def generate_detailed_pdf(records, start_date, end_date):
-    """Generate PDF content for detailed report"""
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=letter)
-    styles = getSampleStyleSheet()
-    elements = []
-    
-    # Title and Employee Info
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=16,
-        spaceAfter=30
-    )
-    elements.append(Paragraph('Detailed Report', title_style))
-    if records:
-        elements.append(Paragraph(f'Employee: {records[0]["employee_name"]}', styles['Normal']))
-    elements.append(Paragraph(f'Period: {start_date} to {end_date}', styles['Normal']))
-    elements.append(Spacer(1, 20))
+@bp.route('/report_jobs/<int:job_id>')
+@login_required
+def report_job(job_id):
+    if current_user.is_admin:
+        flash('Access denied. This is an employee-only page.', 'error')
+        return redirect(url_for('admin.dashboard'))
     
-    # Table data
-    data = [['Date', 'Hourly Rate', 'Hours Worked', 'Amount Earned']]
-    for record in records:
-        data.append([
-            record['date'].strftime('%Y-%m-%d'),
-            f"${record['hourly_rate']:.2f}",
-            f"{record['hours_worked']:.2f}",
-            f"${record['amount_earned']:.2f}"
-        ])
+    # Only the requester's own jobs may be polled, and so recovered
+    job = get_job(job_id)
+    if not job or job['requested_by'] != current_user.id:
+        abort(404)
+    job = poll_job(job)
     
-    # Create table
-    table = Table(data)
-    table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 12),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-        ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
-        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-        ('FONTSIZE', (0, 1), (-1, -1), 10),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black)
-    ]))
+    download_url = None
+    if job['report_id']:
+        download_url = url_for('employee.download_report', report_id=job['report_id'])
     
-    elements.append(table)
-    doc.build(elements)
+    if request.args.get('format') == 'json':
+        return jsonify(job=serialize_row(job), download_url=download_url)
     
-    buffer.seek(0)
-    return buffer.getvalue() 
\ No newline at end of file
+    return render_template('report_job.html',
+                         job=job,
+                         download_url=download_url,
+                         back_url=url_for('employee.reports'))
@@ -1,7 +1,8 @@
-from flask import Blueprint, render_template, redirect, url_for
+import hmac
+from flask import Blueprint, render_template, current_app, request, abort, Response
 from flask_login import login_required, current_user
-from datetime import date, datetime
-from app.database import query_db
+from app import metrics
+from app.stats import get_admin_dashboard, get_employee_stats, get_recent_records
 
 bp = Blueprint('main', __name__)
 
@@ -11,69 +12,46 @@ bp = Blueprint('main', __name__)
 def index():
     if current_user.is_admin:
         try:
-            # Get all employees
-            employees = query_db("SELECT * FROM employees ORDER BY name")
-            
-            # Get all work records
-            work_records = query_db("SELECT * FROM work_records ORDER BY date DESC")
-            
-            # Get today's records
-            today = datetime.now().strftime('%Y-%m-%d')
-            today_records = query_db(
-                "SELECT * FROM work_records WHERE date = ?",
-                (today,)
-            )
-            
-            # Get recent records (last 5)
-            recent_records = query_db(
-                "SELECT * FROM work_records ORDER BY date DESC LIMIT 5"
-            )
-            
-            # Calculate statistics
-            stats = {
-                'employee_count': len(employees),
-                'record_count': len(work_records),
-                'today_records': len(today_records),
-                'total_payments': sum(record['amount_earned'] for record in work_records) if work_records else 0
-            }
+            # Get statistics, recent records and all employees
+            stats, recent_records, employees = get_admin_dashboard()
             
             return render_template('admin/dashboard.html',
                                  employees=employees,
-                                 work_records=work_records,
-                                 today_records=today_records,
                                  recent_records=recent_records,
                                  stats=stats)
         except Exception as e:
             return render_template('error.html', error=str(e))
     else:
         try:
-            # Get employee's work records
             employee_id = current_user.employee_id
-            work_records = query_db("""
-                SELECT * FROM work_records
-                WHERE employee_id = ?
-                ORDER BY date DESC
-            """, (employee_id,))
+            employee = current_user.employee
+            if not employee:
+                return render_template('error.html', error='Employee not found')
             
             # Calculate statistics
-            total_hours = sum(record['hours_worked'] for record in work_records)
-            total_earnings = sum(record['amount_earned'] for record in work_records)
-            month_earnings = sum(
-                record['amount_earned'] for record in work_records
-                if record['date'].startswith(date.today().strftime('%Y-%m'))
-            )
-            
-            stats = {
-                'total_hours': total_hours,
-                'total_earnings': total_earnings,
-                'month_earnings': month_earnings
-            }
+            stats = get_employee_stats(employee_id)
+            stats['hourly_rate'] = employee['hourly_rate']
             
             # Get recent records
-            recent_records = work_records[:10]
+            recent_records = get_recent_records(employee_id)
             
             return render_template('employee/dashboard.html',
+                                 employee=employee,
                                  stats=stats,
                                  recent_records=recent_records)
         except Exception as e:
-            return render_template('error.html', error=str(e)) 
\ No newline at end of file
+            return render_template('error.html', error=str(e))
+
+@bp.route('/metrics')
+def metrics_endpoint():
+    if not current_app.config['METRICS_ENABLED']:
+        abort(404)
+    
+    # Scrapers send the token; admins can look from the browser
+    token = current_app.config['METRICS_TOKEN']
+    sent = request.headers.get('Authorization', '')
+    if not (token and hmac.compare_digest(sent, f'Bearer {token}')):
+        if not (current_user.is_authenticated and current_user.is_admin):
+            abort(403)
+    
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
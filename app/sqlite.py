@@ -0,0 +1,221 @@
+"""Production settings for SQLite file databases.
+
+init_sqlite() tunes every new connection of the app's SQLite engine:
+
+- journal_mode=WAL, so readers no longer block behind a writer;
+- synchronous=NORMAL, which is safe in WAL mode and skips an fsync per
+  commit;
+- busy_timeout, so a writer waits for the lock instead of failing with
+  "database is locked";
+- mmap_size and cache_size, for reads from memory.
+
+The driver's own transaction handling is switched off and SQLAlchemy
+emits BEGIN itself, as the SQLAlchemy docs recommend for pysqlite. That
+makes SAVEPOINT work, and lets transaction() start writes with BEGIN
+IMMEDIATE. Taking the write lock up front waits out busy_timeout rather
+than failing when a read transaction is upgraded to a write.
+
+Writes then go through a per-process WriteQueue. With
+SQLITE_GROUP_COMMIT (off by default), threads of one process that write
+at the same time share a single transaction. Each unit of work runs in
+its own SAVEPOINT on a shared connection, and whoever finishes last
+commits for all of them. Instead of every thread fighting for the
+database lock, a process takes it once per batch, and a failing unit
+only rolls back its own savepoint. A unit does not return until the
+batch it belongs to is committed.
+
+Units run one at a time, so a batch is committed once it holds
+SQLITE_GROUP_COMMIT_MAX units or has been open SQLITE_GROUP_COMMIT_MAX_MS,
+whichever comes first. Units known to be long, transaction(long=True)
+such as bulk imports and recompute chunks, commit the open batch and
+then run in a transaction of their own, so they never hold up the
+commits of short writes.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from sqlalchemy import event
+from app.database import db
+
+_BEGIN = 'sqlite_begin'
+
+def _pragmas(config):
+    return (
+        f"PRAGMA journal_mode={config['SQLITE_JOURNAL_MODE']}",
+        f"PRAGMA synchronous={config['SQLITE_SYNCHRONOUS']}",
+        f"PRAGMA busy_timeout={int(config['SQLITE_BUSY_TIMEOUT'])}",
+        f"PRAGMA mmap_size={int(config['SQLITE_MMAP_SIZE'])}",
+        f"PRAGMA cache_size={int(config['SQLITE_CACHE_SIZE'])}",
+    )
+
+def begin_immediate(conn):
+    """Make the next BEGIN on conn take the write lock straight away."""
+    conn.info[_BEGIN] = 'BEGIN IMMEDIATE'
+
+class _Ticket:
+    """A finished unit of work waiting for its batch to commit."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.error = None
+
+class WriteQueue:
+    """Runs units of write work, group-committing the contended ones."""
+
+    def __init__(self, engine, group_commit=False, max_batch=32, max_wait=0.02):
+        self.engine = engine
+        self.group_commit = group_commit
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._mutex = threading.Lock()
+        self._state = threading.Lock()
+        self._waiting = 0
+        self._conn = None
+        self._trans = None
+        self._opened_at = None
+        self._batch = []
+        self.stats = {'units': 0, 'commits': 0, 'failed_units': 0}
+
+    @contextmanager
+    def unit(self, long=False):
+        """Yield a connection for one unit of work, committed on exit.
+        
+        A long unit never joins a group commit: it commits the open batch
+        first and then runs in its own transaction.
+        """
+        if long and self.group_commit:
+            with self._mutex:
+                if self._trans is not None:
+                    self._commit()
+        if long or not self.group_commit:
+            with self.engine.connect() as conn:
+                begin_immediate(conn)
+                with conn.begin():
+                    yield conn
+            self._count(units=1, commits=1)
+            return
+
+        with self._state:
+            self._waiting += 1
+        self._mutex.acquire()
+        with self._state:
+            self._waiting -= 1
+
+        ticket = None
+        try:
+            if self._trans is not None and self._expired():
+                self._commit()
+            if self._trans is None:
+                self._open()
+            savepoint = self._conn.begin_nested()
+            try:
+                yield self._conn
+            except BaseException:
+                self._count(failed_units=1)
+                try:
+                    savepoint.rollback()
+                except Exception as e:
+                    # The shared transaction is gone; so is the batch
+                    self._abort(e)
+                raise
+            savepoint.commit()
+            ticket = _Ticket()
+            self._batch.append(ticket)
+            self._count(units=1)
+        finally:
+            self._hand_over()
+
+        ticket.done.wait()
+        if ticket.error is not None:
+            raise ticket.error
+
+    def _open(self):
+        conn = self.engine.connect()
+        try:
+            begin_immediate(conn)
+            self._trans = conn.begin()
+        except Exception:
+            conn.close()
+            raise
+        self._conn = conn
+        self._opened_at = time.monotonic()
+
+    def _expired(self):
+        return time.monotonic() - self._opened_at >= self.max_wait
+
+    def _hand_over(self):
+        """Commit the batch unless another unit is about to join it, then release."""
+        try:
+            if self._trans is not None:
+                with self._state:
+                    more = self._waiting > 0
+                if not more or len(self._batch) >= self.max_batch or self._expired():
+                    self._commit()
+        finally:
+            self._mutex.release()
+
+    def _commit(self):
+        try:
+            self._trans.commit()
+        except Exception as e:
+            self._abort(e)
+            return
+        self._count(commits=1)
+        self._close(None)
+
+    def _abort(self, error):
+        try:
+            self._trans.rollback()
+        except Exception:
+            pass
+        self._close(error)
+
+    def _close(self, error):
+        batch, self._batch = self._batch, []
+        conn, self._conn, self._trans = self._conn, None, None
+        if conn is not None:
+            conn.close()
+        for ticket in batch:
+            ticket.error = error
+            ticket.done.set()
+
+    def _count(self, **changes):
+        with self._state:
+            for name, value in changes.items():
+                self.stats[name] += value
+
+def init_sqlite(app):
+    """Tune the app's engine connections and install its WriteQueue.
+
+    Does nothing unless the app uses an SQLite database with SQLITE_TUNING
+    on. The WriteQueue is kept in app.extensions['sqlite_writes'], where
+    database.transaction() finds it.
+    """
+    config = app.config
+    engine = db.get_engine(app)
+    if engine.dialect.name != 'sqlite' or not config['SQLITE_TUNING']:
+        return
+
+    pragmas = _pragmas(config)
+
+    @event.listens_for(engine, 'connect')
+    def _connect(dbapi_connection, connection_record):
+        # SQLAlchemy emits BEGIN itself from now on, see _begin()
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        try:
+            for pragma in pragmas:
+                cursor.execute(pragma)
+        finally:
+            cursor.close()
+
+    @event.listens_for(engine, 'begin')
+    def _begin(conn):
+        conn.exec_driver_sql(conn.info.pop(_BEGIN, 'BEGIN'))
+
+    app.extensions['sqlite_writes'] = WriteQueue(
+        engine,
+        group_commit=config['SQLITE_GROUP_COMMIT'],
+        max_batch=config['SQLITE_GROUP_COMMIT_MAX'],
+        max_wait=config['SQLITE_GROUP_COMMIT_MAX_MS'] / 1000,
+    )
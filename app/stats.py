@@ -0,0 +1,115 @@
+"""Dashboard statistics computed in SQL.
+
+The totals are a single aggregate query and the recent list is a LIMIT
+query, both served by the (employee_id, date, ...) covering index, so
+dashboard cost does not grow with an employee's history. Organisation
+totals are read from the monthly rollups.
+
+Admin dashboard fragments are cached under their row in cache_generations,
+which every write that changes them bumps. Each worker reads the
+generations with the dashboard, so a write in one gunicorn worker makes
+all of them reload, whichever cache backend holds the fragments. The
+fragments are loaded from the primary too: a lagging replica would cache
+pre-write totals under the new generation for every user.
+"""
+from datetime import date
+from app.database import query_db, execute_many
+from app.rollups import get_org_totals
+from app.cache import cached
+
+# Admin dashboard fragments held in app/cache.py
+STATS_FRAGMENT = 'dashboard:stats'
+RECENT_FRAGMENT = 'dashboard:recent_records'
+EMPLOYEES_FRAGMENT = 'dashboard:employees'
+DASHBOARD_FRAGMENTS = (STATS_FRAGMENT, RECENT_FRAGMENT, EMPLOYEES_FRAGMENT)
+
+def get_employee_stats(employee_id, today=None):
+    """Return total hours, total earnings and this month's earnings."""
+    today = today or date.today()
+    row = query_db("""
+        SELECT COALESCE(SUM(hours_worked), 0) AS total_hours,
+               COALESCE(SUM(amount_earned), 0) AS total_earnings,
+               COALESCE(SUM(CASE WHEN date >= :first_day THEN amount_earned ELSE 0 END), 0) AS month_earnings
+        FROM work_records
+        WHERE employee_id = :employee_id
+    """, {'employee_id': employee_id, 'first_day': today.replace(day=1)}, one=True)
+    return {
+        'total_hours': row['total_hours'],
+        'total_earnings': row['total_earnings'],
+        'month_earnings': row['month_earnings']
+    }
+
+def get_recent_records(employee_id, limit=10):
+    """Return the employee's most recent work records."""
+    return query_db("""
+        SELECT * FROM work_records
+        WHERE employee_id = :employee_id
+        ORDER BY date DESC, id DESC
+        LIMIT :limit
+    """, {'employee_id': employee_id, 'limit': limit})
+
+def get_admin_stats(today=None):
+    """Return the counts and totals shown on the admin dashboard."""
+    today = today or date.today()
+    employee_count = query_db("SELECT COUNT(*) FROM employees", one=True)[0]
+    totals = get_org_totals()
+    today_records = query_db(
+        "SELECT COUNT(*) FROM work_records WHERE date = ?",
+        (today,),
+        one=True
+    )[0]
+    return {
+        'employee_count': employee_count,
+        'record_count': totals['record_count'],
+        'today_records': today_records,
+        'total_payments': totals['total_payments']
+    }
+
+def get_recent_work_records(limit=10):
+    """Return the latest work records across all employees, with names."""
+    return query_db("""
+        SELECT wr.*, e.name as employee_name
+        FROM work_records wr
+        JOIN employees e ON wr.employee_id = e.id
+        ORDER BY wr.date DESC, wr.id DESC
+        LIMIT :limit
+    """, {'limit': limit})
+
+def get_all_employees():
+    return query_db("SELECT * FROM employees ORDER BY name")
+
+_BUMP_GENERATION = """
+    INSERT INTO cache_generations (name, generation) VALUES (:name, 1)
+    ON CONFLICT (name) DO UPDATE SET generation = cache_generations.generation + 1
+"""
+
+def _fragment_keys():
+    """Return the cache key of every dashboard fragment at its generation."""
+    generations = {row['name']: row['generation']
+                   for row in query_db("SELECT name, generation FROM cache_generations")}
+    keys = {f: f'{f}:{generations.get(f, 0)}' for f in DASHBOARD_FRAGMENTS}
+    # Today's record count rolls over at midnight, so stats are kept per day
+    keys[STATS_FRAGMENT] += f':{date.today().isoformat()}'
+    return keys
+
+def get_admin_dashboard():
+    """Return (stats, recent_records, employees) for the admin dashboard.
+    
+    The generations and the fragments missing from the cache are both
+    read from the primary, so a fragment is never cached under a
+    generation newer than the data it was built from.
+    """
+    keys = _fragment_keys()
+    return (
+        cached(keys[STATS_FRAGMENT], get_admin_stats),
+        cached(keys[RECENT_FRAGMENT], get_recent_work_records),
+        cached(keys[EMPLOYEES_FRAGMENT], get_all_employees),
+    )
+
+def invalidate_admin_dashboard(*fragments):
+    """Mark dashboard fragments stale after a write; all of them by default.
+    
+    Entries under the old generation are never read again and age out of
+    the cache.
+    """
+    execute_many(_BUMP_GENERATION, [{'name': f} for f in fragments or DASHBOARD_FRAGMENTS])
@@ -0,0 +1,86 @@
+"""Content-addressed store for generated report files.
+
+A report is saved under its SHA-256 hash (REPORT_STORE_PATH/ab/cd/<hash>),
+so identical reports are stored once and a stored file never changes. The
+reports table only keeps the hash and size, which keeps report listings
+small and lets downloads be streamed from disk with the hash as ETag.
+"""
+import hashlib
+import os
+import tempfile
+from flask import current_app, send_file, make_response
+from app.database import query_db
+from app.report_engine import FORMATS
+
+CHUNK_SIZE = 64 * 1024
+
+def _root():
+    return current_app.config['REPORT_STORE_PATH']
+
+def path_for(content_hash):
+    """Return the file path for a stored hash."""
+    return os.path.join(_root(), content_hash[:2], content_hash[2:4], content_hash)
+
+def store(source):
+    """Save bytes or a readable binary file; return (content_hash, size).
+
+    The data is hashed while it is copied to a temp file in the store, so
+    large reports are never held in memory. If a file with the same hash
+    already exists the copy is discarded.
+    """
+    root = _root()
+    os.makedirs(root, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+
+    fd, tmp_path = tempfile.mkstemp(dir=root, prefix='.incoming-')
+    try:
+        with os.fdopen(fd, 'wb') as tmp:
+            if isinstance(source, (bytes, bytearray)):
+                chunks = [source]
+            else:
+                chunks = iter(lambda: source.read(CHUNK_SIZE), b'')
+            for chunk in chunks:
+                digest.update(chunk)
+                size += len(chunk)
+                tmp.write(chunk)
+
+        content_hash = digest.hexdigest()
+        target = path_for(content_hash)
+        if os.path.exists(target):
+            os.remove(tmp_path)
+        else:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(tmp_path, target)
+        return content_hash, size
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def exists(content_hash):
+    return os.path.exists(path_for(content_hash))
+
+def send_report(report):
+    """Build the download response for a reports row.
+
+    Stored reports are streamed from disk with Range and If-None-Match
+    support. Rows from before the store still carry the PDF inline.
+    """
+    file_format = report['file_format'] if report['content_hash'] else 'pdf'
+    filename = f"report_{report['id']}.{file_format}"
+    if report['content_hash']:
+        return send_file(
+            path_for(report['content_hash']),
+            mimetype=FORMATS[file_format][0],
+            as_attachment=True,
+            download_name=filename,
+            conditional=True,
+            etag=report['content_hash']
+        )
+
+    legacy = query_db("SELECT content FROM reports WHERE id = ?", (report['id'],), one=True)
+    response = make_response(legacy['content'])
+    response.headers['Content-Type'] = 'application/pdf'
+    response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+    return response
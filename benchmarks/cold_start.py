@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Worker cold start: import time, app setup time and memory per worker.
+
+First runs --repeat fresh interpreters that each import the app, call
+create_app() and serve one request through the test client, and reports
+the median time of each step, the resulting RSS and whether ReportLab and
+numpy had to be loaded for it.
+
+Then starts gunicorn with --workers workers, with and without preloading
+the app (see gunicorn.conf.py), and reports the time to the first
+response and RSS, PSS and USS per worker. PSS counts pages shared with the
+master and the other workers in fractions and USS counts only a worker's
+private pages, so together they show what copy-on-write sharing saves.
+The memory figures need Linux (/proc/<pid>/smaps_rollup).
+
+    python benchmarks/cold_start.py
+    python benchmarks/cold_start.py --repeat 10 --workers 4
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+HEAVY = ('reportlab', 'numpy')
+
+def child():
+    """Child interpreter: time the boot path and print it as JSON."""
+    started = time.perf_counter()
+    from app import create_app
+    imported = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        app = create_app()
+    created = time.perf_counter()
+    status = app.test_client().get('/login').status_code
+    served = time.perf_counter()
+    print(json.dumps({
+        'import': imported - started,
+        'create_app': created - imported,
+        'first_request': served - created,
+        'status': status,
+        'rss_mb': memory(os.getpid())['Rss'],
+        'loaded': [name for name in HEAVY if name in sys.modules],
+    }))
+
+def memory(pid):
+    """Return the Rss, Pss and USS of a process in MB."""
+    fields = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                fields[parts[0].rstrip(':')] = int(parts[1]) / 1024
+    fields['Uss'] = fields.get('Private_Clean', 0) + fields.get('Private_Dirty', 0)
+    return fields
+
+def children(pid):
+    with open(f'/proc/{pid}/task/{pid}/children') as f:
+        return [int(n) for n in f.read().split()]
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def measure_gunicorn(env, workers, preload, requests):
+    port = free_port()
+    env = dict(env, GUNICORN_PRELOAD='1' if preload else '0')
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '--workers', str(workers), '--bind', f'127.0.0.1:{port}',
+         '--log-level', 'warning', 'run:app'],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        url = f'http://127.0.0.1:{port}/login'
+        while True:
+            if server.poll() is not None:
+                raise RuntimeError('gunicorn exited during startup')
+            try:
+                urllib.request.urlopen(url, timeout=5).read()
+                break
+            except OSError:
+                time.sleep(0.01)
+        first = time.perf_counter() - started
+        for _ in range(requests):
+            urllib.request.urlopen(url, timeout=5).read()
+        time.sleep(1)
+        pids = children(server.pid)
+        usage = [memory(pid) for pid in pids]
+        return {
+            'first_response': first,
+            'workers': len(pids),
+            'master_rss': memory(server.pid)['Rss'],
+            'rss': statistics.mean(u['Rss'] for u in usage),
+            'pss': statistics.mean(u['Pss'] for u in usage),
+            'uss': statistics.mean(u['Uss'] for u in usage),
+        }
+    finally:
+        server.terminate()
+        server.wait()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5, help='fresh interpreters to time')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn workers')
+    parser.add_argument('--requests', type=int, default=20, help='requests sent before measuring memory')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child()
+        return
+
+    directory = tempfile.mkdtemp()
+    env = dict(os.environ, DATABASE_URL='sqlite:///' + os.path.join(directory, 'bench.db'),
+               METRICS_ENABLED='0')
+    subprocess.run([sys.executable, '-m', 'flask', '--app', 'run', 'init-db'],
+                   cwd=ROOT, env=env, check=True, stdout=subprocess.DEVNULL)
+
+    runs = []
+    for _ in range(args.repeat):
+        output = subprocess.run([sys.executable, os.path.abspath(__file__), '--child'],
+                                env=env, check=True, capture_output=True, text=True).stdout
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+    print(f"Fresh interpreter, median of {args.repeat}:")
+    for step in ('import', 'create_app', 'first_request'):
+        print(f"  {step:<14} {statistics.median(r[step] for r in runs) * 1000:>8.1f} ms")
+    print(f"  {'rss':<14} {statistics.median(r['rss_mb'] for r in runs):>8.1f} MB")
+    print(f"  {'loaded':<14} {', '.join(runs[-1]['loaded']) or 'none of ' + ', '.join(HEAVY)}\n")
+
+    if not os.path.exists('/proc/self/smaps_rollup'):
+        print("No /proc/<pid>/smaps_rollup here, skipping the gunicorn measurements")
+    else:
+        print(f"gunicorn, {args.workers} workers:")
+        print(f"  {'mode':<10} {'first response':>14} {'master RSS':>11} {'RSS/worker':>11} "
+              f"{'PSS/worker':>11} {'USS/worker':>11}")
+        for preload in (False, True):
+            result = measure_gunicorn(env, args.workers, preload, args.requests)
+            print(f"  {'preload' if preload else 'default':<10} {result['first_response'] * 1000:>11.0f} ms "
+                  f"{result['master_rss']:>8.1f} MB {result['rss']:>8.1f} MB "
+                  f"{result['pss']:>8.1f} MB {result['uss']:>8.1f} MB")
+    shutil.rmtree(directory)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Deterministic synthetic payroll data for benchmarks and load tests.
+
+Fills an empty database with N employees and their logins, M years of
+weekday work records paid at each employee's effective-dated rate (about
+half of them get a raise along the way), the payroll rollups and K stored
+reports. The same arguments and --seed always produce the same rows.
+
+The schema is the app's own (init_db() and the migrations). Rows go in
+through the data layer in app/database.py, the same way the app and the
+bulk importers write them, and reports are built by the report engine
+and put in the report store the way report jobs do it. Every employee
+logs in with their lower-cased name and DEFAULT_PASSWORD, as accounts
+made by admin.add_employee do.
+
+    python benchmarks/dataset.py --database /tmp/payroll-bench.db
+    python benchmarks/dataset.py --database /tmp/big.db --employees 500 --years 3 --reports 100
+
+Other scripts call generate() inside an app context instead.
+"""
+import argparse
+import contextlib
+import io
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+DEFAULT_PASSWORD = 'password123'
+
+# Last day of generated work, fixed so that datasets do not depend on today
+END = date(2024, 12, 31)
+
+# Chance that an employee works on a given weekday
+ATTENDANCE = 0.92
+
+BATCH_SIZE = 50000
+
+def employee_name(number):
+    return f'Employee {number:04d}'
+
+def generate(employees=50, years=1, reports=10, seed=1, end=END):
+    """Fill the app's empty database and return what was created.
+
+    Runs inside an app context. Returns a dict with the row counts, the
+    data period, the id of the first employee (who is guaranteed a stored
+    report), the report ids and the seconds taken.
+    """
+    from app.database import init_db, query_db, execute_db, execute_many, transaction
+    from app.migrations import run_migrations
+    from app.passwords import hash_password
+    from app.rates import FIRST_DAY, UPSERT_RATE
+    from app.rollups import rebuild_rollups
+
+    started = time.perf_counter()
+    rng = random.Random(seed)
+    start = date(end.year - years + 1, 1, 1)
+    with contextlib.redirect_stdout(io.StringIO()):
+        init_db()
+        run_migrations()
+    if query_db("SELECT COUNT(*) AS n FROM employees", one=True)['n']:
+        raise RuntimeError('The database already has employees; generate() needs an empty one')
+
+    # Every account gets the same password, so it is hashed once
+    password = hash_password(DEFAULT_PASSWORD)
+    days = [start + timedelta(days=n) for n in range((end - start).days + 1)]
+    staff = []
+    with transaction():
+        for number in range(1, employees + 1):
+            rate = round(rng.uniform(15, 45), 2)
+            raise_on = rng.choice(days) if rng.random() < 0.5 else None
+            current = round(rate * 1.05, 2) if raise_on else rate
+            user_id = execute_db(
+                "INSERT INTO users (username, password, is_admin) VALUES (?, ?, ?)",
+                (employee_name(number).lower(), password, False)
+            )
+            employee_id = execute_db(
+                "INSERT INTO employees (name, hourly_rate, user_id) VALUES (?, ?, ?)",
+                (employee_name(number), current, user_id)
+            )
+            execute_db("UPDATE users SET employee_id = ? WHERE id = ?", (employee_id, user_id))
+            history = [{'employee_id': employee_id, 'effective_from': FIRST_DAY, 'hourly_rate': rate}]
+            if raise_on:
+                history.append({'employee_id': employee_id, 'effective_from': raise_on, 'hourly_rate': current})
+            execute_many(UPSERT_RATE, history)
+            staff.append((employee_id, rate, raise_on, current))
+
+    records = 0
+    batch = []
+    for day in days:
+        if day.weekday() >= 5:
+            continue
+        for employee_id, rate, raise_on, current in staff:
+            if rng.random() >= ATTENDANCE:
+                continue
+            hours = rng.randrange(16, 41) / 4
+            paid = current if raise_on and day >= raise_on else rate
+            batch.append({'employee_id': employee_id, 'date': day, 'hours': hours,
+                          'amount': round(hours * paid, 2)})
+        if len(batch) >= BATCH_SIZE:
+            records += _insert_records(batch)
+            batch = []
+    if batch:
+        records += _insert_records(batch)
+    months = rebuild_rollups()
+
+    report_ids = []
+    for number in range(reports):
+        # The first report belongs to the first employee, the second is
+        # all-employee; after that both kinds are mixed at random
+        if number == 0 or (number > 1 and rng.random() < 0.7):
+            employee_id = staff[0][0] if number == 0 else rng.choice(staff)[0]
+            source = 'employee'
+        else:
+            employee_id, source = None, 'admin'
+        first = date(rng.randint(start.year, end.year), rng.randint(1, 12), 1)
+        last = (first + timedelta(days=31)).replace(day=1) - timedelta(days=1)
+        report_type = ('work_records', 'earnings', 'detailed')[number % 3]
+        file_format = 'pdf' if number % 2 == 0 else 'csv'
+        report_ids.append(store_report(source, employee_id, report_type, first, last, file_format))
+
+    return {
+        'employees': employees,
+        'work_records': records,
+        'months': months,
+        'reports': len(report_ids),
+        'start_date': start.isoformat(),
+        'end_date': end.isoformat(),
+        'first_employee_id': staff[0][0] if staff else None,
+        'report_ids': report_ids,
+        'seconds': round(time.perf_counter() - started, 2),
+    }
+
+def _insert_records(rows):
+    from app.database import execute_many
+    return execute_many(
+        """INSERT INTO work_records (employee_id, date, hours_worked, amount_earned)
+           VALUES (:employee_id, :date, :hours, :amount)""",
+        rows
+    )
+
+def store_report(source, employee_id, report_type, start_date, end_date, file_format):
+    """Build a report, store it and record it as a report job would. Returns its id."""
+    from app import report_cache, storage
+    from app.database import execute_db
+    from app.report_engine import build_report
+
+    fingerprint = report_cache.report_fingerprint(source, employee_id, report_type,
+                                                  start_date, end_date, file_format)
+    output = build_report(source, employee_id, report_type, start_date, end_date, file_format)
+    try:
+        content_hash, content_size = storage.store(output)
+    finally:
+        output.close()
+    return execute_db(
+        """INSERT INTO reports
+           (employee_id, report_type, file_format, start_date, end_date,
+            content, content_hash, content_size, fingerprint)
+           VALUES (?, ?, ?, ?, ?, '', ?, ?, ?)""",
+        (employee_id, report_type, file_format, start_date, end_date,
+         content_hash, content_size, fingerprint)
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--database', help='SQLite file to create (default: DATABASE_URL)')
+    parser.add_argument('--employees', type=int, default=50)
+    parser.add_argument('--years', type=int, default=1)
+    parser.add_argument('--reports', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    if args.database:
+        path = os.path.abspath(args.database)
+        if os.path.exists(path):
+            parser.error(f'{path} already exists')
+        os.environ['DATABASE_URL'] = 'sqlite:///' + path
+        os.environ.setdefault('REPORT_STORE_PATH', os.path.splitext(path)[0] + '-reports')
+    elif not os.environ.get('DATABASE_URL'):
+        parser.error('pass --database or set DATABASE_URL, so the instance database is left alone')
+
+    from app import create_app
+    app = create_app()
+    with app.app_context():
+        summary = generate(args.employees, args.years, args.reports, args.seed)
+    print(f"{summary['employees']} employees, {summary['work_records']} work records over "
+          f"{summary['months']} months ({summary['start_date']} to {summary['end_date']}), "
+          f"{summary['reports']} reports in {summary['seconds']:.1f}s")
+    print(f"Employees log in as 'employee 0001' ... with password '{DEFAULT_PASSWORD}'")
+
+if __name__ == '__main__':
+    main()
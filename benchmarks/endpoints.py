@@ -0,0 +1,419 @@
+#!/usr/bin/env python3
+"""
+Latency, SQL statements and memory of every blueprint endpoint.
+
+For every dataset size a child process builds a fresh SQLite database
+with benchmarks/dataset.py, logs in the admin and the first employee
+through Flask's test client and requests each endpoint --iterations times
+after a warm-up (fewer times for the ones that hash passwords or run
+payroll). Per endpoint it records the latency percentiles, the SQL
+statements per request and the peak Python memory allocated while serving
+one request (tracemalloc). Read-only requests run first. Writes use dates
+after the generated period, so they leave the stored reports valid.
+
+    python benchmarks/endpoints.py
+    python benchmarks/endpoints.py --sizes small,medium,large --output baseline.json
+    python benchmarks/endpoints.py --compare baseline.json
+
+--output writes the results as JSON. --compare prints every endpoint's
+change against such a file. It exits with status 1 when a median got more
+than --tolerance and --min-ms slower, or an endpoint began running more SQL
+statements.
+Only compare runs made on the same machine.
+"""
+import argparse
+import io
+import itertools
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# name -> (employees, years, reports)
+SIZES = {
+    'small': (20, 1, 10),
+    'medium': (100, 2, 20),
+    'large': (400, 3, 40),
+}
+
+WARMUP = 2
+
+# Writes are dated after dataset.END, outside every stored report
+WRITE_DAY = date(2025, 3, 3)
+
+def case(name, endpoint, role='admin', method='GET', values=None, form=None, setup=None, repeat=None):
+    """One benchmarked request.
+
+    values and form are dicts or functions of the context; setup(context,
+    client) runs untimed before each request and its dict is added to the
+    context. role is 'admin', 'employee' or 'guest' (a new client every
+    time). repeat caps the iterations for slow endpoints.
+    """
+    return {'name': name, 'endpoint': endpoint, 'role': role, 'method': method,
+            'values': values or {}, 'form': form, 'setup': setup, 'repeat': repeat}
+
+def _month(c):
+    return {'start_date': c['month_start'], 'end_date': c['month_end']}
+
+def _login(c, client):
+    client.post('/login', data={'username': c['username'], 'password': c['password']})
+    return {}
+
+def _new_record(c, client):
+    from app.database import execute_db
+    with client.application.app_context():
+        return {'id': execute_db(
+            "INSERT INTO work_records (employee_id, date, hours_worked, amount_earned) VALUES (?, ?, ?, ?)",
+            (c['employee_id'], WRITE_DAY, 1.0, 20.0)
+        )}
+
+def _new_employee(c, client):
+    from app.database import execute_db, transaction
+    with client.application.app_context(), transaction():
+        user_id = execute_db("INSERT INTO users (username, password, is_admin) VALUES (?, ?, ?)",
+                             (f"leaver {c['n']}", 'x', False))
+        employee_id = execute_db("INSERT INTO employees (name, hourly_rate, user_id) VALUES (?, ?, ?)",
+                                 (f"Leaver {c['n']}", 20.0, user_id))
+        execute_db("UPDATE users SET employee_id = ? WHERE id = ?", (employee_id, user_id))
+    return {'id': employee_id}
+
+def _csv(text, filename):
+    return lambda c: {'file': (io.BytesIO(text(c).encode()), filename)}
+
+CASES = [
+    # Read-only pages. employee.profile and the change-password form are left
+    # out: their templates are not part of the app
+    case('main.index', 'main.index'),
+    case('admin.dashboard', 'admin.dashboard'),
+    case('admin.employees', 'admin.employees'),
+    case('admin.employees:json', 'admin.employees', values={'format': 'json'}),
+    case('admin.work_records', 'admin.work_records'),
+    case('admin.work_records:filtered', 'admin.work_records',
+         values=lambda c: dict(_month(c), employee_id=c['employee_id'])),
+    case('admin.work_records:json', 'admin.work_records', values={'format': 'json'}),
+    case('admin.add_employee', 'admin.add_employee'),
+    case('admin.edit_employee', 'admin.edit_employee', values=lambda c: {'id': c['employee_id']}),
+    case('admin.add_work_record', 'admin.add_work_record'),
+    case('admin.edit_work_record', 'admin.edit_work_record', values=lambda c: {'id': c['record_id']}),
+    case('admin.import_employees', 'admin.import_employees'),
+    case('admin.import_work_records', 'admin.import_work_records'),
+    case('admin.recompute_amounts', 'admin.recompute_amounts'),
+    case('admin.reports', 'admin.reports'),
+    case('admin.report_job', 'admin.report_job', values=lambda c: {'job_id': c['admin_job_id']}),
+    case('admin.download_report', 'admin.download_report',
+         values=lambda c: {'report_id': c['admin_report_id']}),
+    case('admin.export_work_records:month', 'admin.export_work_records', values=_month),
+    case('admin.export_work_records:year.gz', 'admin.export_work_records',
+         values=lambda c: {'start_date': c['year_start'], 'end_date': c['month_end'],
+                           'file_format': 'ndjson', 'gzip': '1'}),
+    case('admin.pay_runs', 'admin.pay_runs'),
+    case('admin.pay_run', 'admin.pay_run', values=lambda c: {'pay_run_id': c['pay_run_id']}),
+    case('admin.cache_stats', 'admin.cache_stats'),
+    case('admin.login_stats', 'admin.login_stats'),
+    case('main.metrics_endpoint', 'main.metrics_endpoint'),
+    case('employee.dashboard', 'employee.dashboard', role='employee'),
+    case('employee.work_records', 'employee.work_records', role='employee'),
+    case('employee.work_records:json', 'employee.work_records', role='employee', values={'format': 'json'}),
+    case('employee.reports', 'employee.reports', role='employee'),
+    case('employee.report_job', 'employee.report_job', role='employee',
+         values=lambda c: {'job_id': c['employee_job_id']}),
+    case('employee.download_report', 'employee.download_report', role='employee',
+         values=lambda c: {'report_id': c['employee_report_id']}),
+    case('auth.login', 'auth.login', role='guest'),
+
+    # Sessions, stored report hits and writes
+    case('auth.login:post', 'auth.login', role='guest', method='POST', repeat=5,
+         form=lambda c: {'username': c['username'], 'password': c['password']}),
+    case('auth.logout', 'auth.logout', role='guest', setup=_login, repeat=5),
+    case('auth.change_password:post', 'auth.change_password', role='employee', method='POST', repeat=3,
+         form=lambda c: {'current_password': c['password'], 'new_password': c['password'],
+                         'confirm_password': c['password']}),
+    case('admin.generate_report:stored', 'admin.generate_report', method='POST',
+         form=lambda c: c['admin_report_form']),
+    case('employee.generate_report:stored', 'employee.generate_report', role='employee', method='POST',
+         form=lambda c: c['employee_report_form']),
+    case('admin.add_work_record:post', 'admin.add_work_record', method='POST',
+         form=lambda c: {'employee_id': c['employee_id'], 'date': WRITE_DAY.isoformat(), 'hours_worked': '8'}),
+    case('admin.edit_work_record:post', 'admin.edit_work_record', method='POST',
+         values=lambda c: {'id': c['id']}, setup=_new_record,
+         form={'date': WRITE_DAY.isoformat(), 'hours_worked': '7.5'}),
+    case('admin.delete_work_record', 'admin.delete_work_record',
+         values=lambda c: {'id': c['id']}, setup=_new_record),
+    case('admin.edit_employee:post', 'admin.edit_employee', method='POST',
+         values=lambda c: {'id': c['employee_id']},
+         form=lambda c: {'name': c['employee_name'], 'hourly_rate': c['hourly_rate']}),
+    case('admin.add_employee:post', 'admin.add_employee', method='POST', repeat=5,
+         form=lambda c: {'name': f"New Hire {c['n']}", 'hourly_rate': '21.5'}),
+    case('admin.delete_employee', 'admin.delete_employee', values=lambda c: {'id': c['id']},
+         setup=_new_employee, repeat=5),
+    case('admin.import_work_records:post', 'admin.import_work_records', method='POST',
+         form=_csv(lambda c: 'employee_id,date,hours_worked\n' + ''.join(
+             f"{c['employee_id']},{WRITE_DAY + timedelta(days=n)},6\n" for n in range(20)), 'timesheet.csv')),
+    case('admin.import_employees:post', 'admin.import_employees', method='POST', repeat=3,
+         form=_csv(lambda c: f"name,hourly_rate\nImported {c['n']} A,18\nImported {c['n']} B,19\n", 'crew.csv')),
+    case('admin.recompute_amounts:post', 'admin.recompute_amounts', method='POST',
+         form=lambda c: dict(_month(c), employee_id=c['employee_id'])),
+    case('admin.pay_runs:post', 'admin.pay_runs', method='POST', repeat=5, form=_month),
+]
+
+def _resolve(value, context):
+    return value(context) if callable(value) else value
+
+def prepare(sizes):
+    """Child: generate the dataset and the ids the cases refer to."""
+    import dataset
+    from app import payroll
+    from app.database import query_db
+    from app.jobs import enqueue_report, get_job
+    from app.config import Config
+
+    employees, years, reports = SIZES[sizes]
+    summary = dataset.generate(employees, years, reports)
+    first = summary['first_employee_id']
+    employee = query_db("""SELECT e.name, e.hourly_rate, u.username, u.id AS user_id
+                           FROM employees e JOIN users u ON u.id = e.user_id WHERE e.id = ?""",
+                        (first,), one=True)
+    admin_id = query_db("SELECT id FROM users WHERE username = ?", (Config.ADMIN_USERNAME,), one=True)['id']
+    end = date.fromisoformat(summary['end_date'])
+    month_start = end.replace(day=1)
+
+    def report_form(report_id, all_employees):
+        report = query_db("SELECT * FROM reports WHERE id = ?", (report_id,), one=True)
+        form = {'start_date': str(report['start_date']), 'end_date': str(report['end_date']),
+                'report_type': report['report_type'], 'file_format': report['file_format']}
+        if all_employees:
+            form['employee_id'] = 'all'
+        return form
+
+    jobs = [
+        enqueue_report('admin', None, 'earnings', month_start, end, admin_id, 'csv'),
+        enqueue_report('employee', first, 'earnings', month_start, end, employee['user_id'], 'csv'),
+    ]
+    while any(get_job(job_id)['status'] in ('queued', 'running') for job_id in jobs):
+        time.sleep(0.05)
+
+    context = {
+        'employee_id': first,
+        'employee_name': employee['name'],
+        'hourly_rate': employee['hourly_rate'],
+        'username': employee['username'],
+        'password': dataset.DEFAULT_PASSWORD,
+        'admin_password': Config.ADMIN_PASSWORD,
+        'record_id': query_db("SELECT id FROM work_records WHERE employee_id = ? ORDER BY id LIMIT 1",
+                              (first,), one=True)['id'],
+        'employee_report_id': summary['report_ids'][0],
+        'admin_report_id': summary['report_ids'][1],
+        'employee_report_form': report_form(summary['report_ids'][0], False),
+        'admin_report_form': report_form(summary['report_ids'][1], True),
+        'admin_job_id': jobs[0],
+        'employee_job_id': jobs[1],
+        'pay_run_id': payroll.run_payroll(month_start, end, created_by=admin_id)['pay_run_id'],
+        'year_start': end.replace(month=1, day=1).isoformat(),
+        'month_start': month_start.isoformat(),
+        'month_end': end.isoformat(),
+    }
+    return summary, context
+
+def child(size, iterations):
+    """Child: print the measurements for one dataset size as JSON."""
+    import contextlib
+    from flask import url_for
+    from sqlalchemy import event
+    from app import create_app
+    from app.database import db
+    from app.config import Config
+    from app.metrics import is_query
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        app = create_app()
+        with app.app_context():
+            summary, context = prepare(size)
+            engine = db.engine
+    statements = [0]
+
+    # Counted like /metrics does, without BEGIN, SAVEPOINT and RELEASE
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _count(conn, cursor, statement, *args):
+        if is_query(statement):
+            statements[0] += 1
+
+    # Requests run outside any app context, as they would in a server:
+    # one pushed around them would share g (and the logged-in user)
+    clients = {'admin': app.test_client(), 'employee': app.test_client()}
+    clients['admin'].post('/login', data={'username': Config.ADMIN_USERNAME,
+                                          'password': Config.ADMIN_PASSWORD})
+    _login(context, clients['employee'])
+    counter = itertools.count()
+
+    def request_for(spec):
+        client = app.test_client() if spec['role'] == 'guest' else clients[spec['role']]
+        c = dict(context, n=next(counter))
+        if spec['setup']:
+            c.update(spec['setup'](c, client))
+        with app.test_request_context():
+            url = url_for(spec['endpoint'], **_resolve(spec['values'], c))
+        return client, url, _resolve(spec['form'], c)
+
+    def send(spec):
+        client, url, form = request_for(spec)
+        before = statements[0]
+        started = time.perf_counter()
+        response = client.open(url, method=spec['method'], data=form)
+        response.get_data()
+        seconds = time.perf_counter() - started
+        response.close()
+        return seconds, statements[0] - before, response.status_code
+
+    results = {}
+    for spec in CASES:
+        runs = min(iterations, spec['repeat'] or iterations)
+        for _ in range(min(WARMUP, runs)):
+            send(spec)
+        samples = [send(spec) for _ in range(runs)]
+        latencies = sorted(seconds * 1000 for seconds, _, _ in samples)
+        results[spec['name']] = {
+            'n': runs,
+            'p50_ms': round(_percentile(latencies, 0.5), 3),
+            'p95_ms': round(_percentile(latencies, 0.95), 3),
+            'p99_ms': round(_percentile(latencies, 0.99), 3),
+            'mean_ms': round(statistics.mean(latencies), 3),
+            'queries': statistics.median(count for _, count, _ in samples),
+            'statuses': sorted({status for _, _, status in samples}),
+        }
+
+    # Memory in a separate pass, since tracing slows every allocation down
+    tracemalloc.start()
+    for spec in CASES:
+        client, url, form = request_for(spec)
+        baseline = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        response = client.open(url, method=spec['method'], data=form)
+        response.get_data()
+        response.close()
+        results[spec['name']]['peak_kb'] = round((tracemalloc.get_traced_memory()[1] - baseline) / 1024, 1)
+    tracemalloc.stop()
+
+    summary.pop('report_ids')
+    print(json.dumps({'dataset': summary, 'endpoints': results}))
+
+def _percentile(values, fraction):
+    return values[int(fraction * (len(values) - 1))]
+
+def run_size(size, iterations):
+    directory = tempfile.mkdtemp()
+    env = dict(os.environ,
+               DATABASE_URL='sqlite:///' + os.path.join(directory, 'bench.db'),
+               REPORT_STORE_PATH=os.path.join(directory, 'reports'),
+               REPORT_EXECUTOR='thread')
+    try:
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--child', size, '--iterations', str(iterations)],
+            env=env, check=True, stdout=subprocess.PIPE, text=True, cwd=ROOT
+        ).stdout
+    finally:
+        shutil.rmtree(directory)
+    return json.loads(output.strip().splitlines()[-1])
+
+def _revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                              capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+def print_results(size, result):
+    data = result['dataset']
+    print(f"\n== {size}: {data['employees']} employees, {data['work_records']} work records, "
+          f"{data['reports']} reports ==")
+    print(f"{'endpoint':<38} {'n':>3} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'queries':>7} "
+          f"{'peak KB':>8}  status")
+    for name, row in result['endpoints'].items():
+        print(f"{name:<38} {row['n']:>3} {row['p50_ms']:>8.1f} {row['p95_ms']:>8.1f} {row['p99_ms']:>8.1f} "
+              f"{row['queries']:>7g} {row['peak_kb']:>8.0f}  {','.join(map(str, row['statuses']))}")
+
+def compare(results, baseline, tolerance, min_ms):
+    """Print the change against baseline; return the regressions found."""
+    regressions = []
+    print(f"\nAgainst {baseline['meta'].get('revision') or 'the baseline'} "
+          f"(over +{tolerance:.0%} and {min_ms:g} ms slower at p50, or more queries, is a regression):")
+    for size, result in results.items():
+        old = baseline['sizes'].get(size)
+        if not old:
+            continue
+        print(f"\n== {size} ==")
+        for name, row in result['endpoints'].items():
+            before = old['endpoints'].get(name)
+            if not before:
+                continue
+            change = row['p50_ms'] / before['p50_ms'] - 1 if before['p50_ms'] else 0.0
+            flags = []
+            if change > tolerance and row['p50_ms'] - before['p50_ms'] > min_ms:
+                flags.append('slower')
+            if row['queries'] > before['queries']:
+                flags.append(f"queries {before['queries']:g} -> {row['queries']:g}")
+            if flags:
+                regressions.append((size, name))
+            print(f"{name:<38} {before['p50_ms']:>8.1f} -> {row['p50_ms']:>8.1f} ms {change:>+7.0%}  "
+                  f"{', '.join(flags)}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default='small,medium', help=f"comma-separated, from {', '.join(SIZES)}")
+    parser.add_argument('--iterations', type=int, default=20, help='timed requests per endpoint')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='JSON file from an earlier --output run')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed p50 slowdown as a fraction')
+    parser.add_argument('--min-ms', type=float, default=1.0,
+                        help='ignore p50 slowdowns smaller than this, as timer noise')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        child(args.child, args.iterations)
+        return
+
+    sizes = args.sizes.split(',')
+    unknown = [size for size in sizes if size not in SIZES]
+    if unknown:
+        parser.error(f"unknown size {', '.join(unknown)}")
+
+    results = {}
+    for size in sizes:
+        results[size] = run_size(size, args.iterations)
+        print_results(size, results[size])
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'meta': {
+                    'revision': _revision(),
+                    'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                    'python': platform.python_version(),
+                    'machine': platform.machine(),
+                    'cpus': os.cpu_count(),
+                    'iterations': args.iterations,
+                },
+                'sizes': results,
+            }, f, indent=2, sort_keys=True)
+        print(f"\nWrote {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.tolerance, args.min_ms):
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,518 @@
+#!/usr/bin/env python3
+"""
+Load test a running `gunicorn run:app` with a realistic payroll traffic mix.
+
+Virtual users are asyncio tasks, each with its own cookie session, that
+keep running scenarios picked by weight, with exponentially distributed
+think time between pages:
+
+  shift      an employee logs in, polls /dashboard a few times, opens the
+             timesheet and logs out (shift change)
+  reports    an employee logs in and generates, waits for and downloads
+             one of their monthly reports
+  month_end  an admin logs in, opens the dashboard and pay runs, and
+             generates, waits for and downloads an all-employee report
+
+The number of users follows a profile made of stages:
+
+  steady     --users for --duration seconds
+  ramp       1/--steps of --users more at every step, to find the
+             saturation point
+  spike      a tenth of --users, then all of them logging in at once for
+             half of --duration, then a tenth again
+
+By default a synthetic dataset (benchmarks/dataset.py) and gunicorn with
+--workers and --threads are started in a temporary directory; --url aims
+at a server that is already running instead, whose database must have
+been made by dataset.py with the same --employees.
+
+For every endpoint the report gives the requests per second, latency
+percentiles and error rate, and per stage the throughput, p95 and error
+rate. An endpoint's saturation point is the first stage adding users in
+which its p95 exceeds --slo-factor times its p95 in the first stage, or
+more than 1% of its requests fail (5xx, timeouts, refused logins or other
+unexpected statuses). Users finish the scenario they are in when a stage
+removes them, so a stage after a spike still carries some of its load.
+
+    python benchmarks/load_test.py
+    python benchmarks/load_test.py --profile ramp --users 64 --steps 8 --duration 120 --workers 4
+    python benchmarks/load_test.py --profile spike --mix shift=1 --users 100
+    python benchmarks/load_test.py --url http://127.0.0.1:8000 --employees 50 --output load.json
+
+The client is deliberately plain: one connection per request with
+"Connection: close", as gunicorn's default sync workers close every
+connection anyway, and responses are read completely before a request
+counts as done.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import dataset
+
+DEFAULT_MIX = 'shift=6,reports=2,month_end=1'
+
+# Error rate that marks an endpoint as saturated
+MAX_ERROR_RATE = 0.01
+
+# Seconds between report job status checks
+POLL_INTERVAL = 0.5
+
+class Response:
+    def __init__(self, status, headers, cookies, body):
+        self.status = status
+        self.headers = headers
+        self.cookies = cookies
+        self.body = body
+
+    def json(self):
+        return json.loads(self.body)
+
+class ScenarioFailed(Exception):
+    """A step got an unexpected answer; the user starts another scenario."""
+
+async def fetch(host, port, method, path, headers, body=b''):
+    """Send one HTTP/1.1 request and read the whole response."""
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        head = [f'{method} {path} HTTP/1.1', f'Host: {host}:{port}', 'Connection: close',
+                'Accept-Encoding: identity', 'User-Agent: payroll-load-test']
+        head += [f'{name}: {value}' for name, value in headers.items()]
+        if body:
+            head.append(f'Content-Length: {len(body)}')
+        writer.write('\r\n'.join(head).encode('latin-1') + b'\r\n\r\n' + body)
+        raw = await reader.read()
+    finally:
+        writer.close()
+
+    head, _, content = raw.partition(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    if len(lines[0].split()) < 2:
+        raise ConnectionError('connection closed without a response')
+    response_headers, cookies = {}, []
+    for line in lines[1:]:
+        name, _, value = line.partition(':')
+        if name.lower() == 'set-cookie':
+            cookies.append(value.strip())
+        else:
+            response_headers[name.lower()] = value.strip()
+    if response_headers.get('transfer-encoding') == 'chunked':
+        content = _dechunk(content)
+    return Response(int(lines[0].split()[1]), response_headers, cookies, content)
+
+def _dechunk(content):
+    chunks = []
+    while content:
+        size, _, content = content.partition(b'\r\n')
+        size = int(size.split(b';')[0], 16)
+        if not size:
+            break
+        chunks.append(content[:size])
+        content = content[size + 2:]
+    return b''.join(chunks)
+
+class Recorder:
+    """Every finished request as (endpoint, stage, seconds, outcome, ok)."""
+
+    def __init__(self):
+        self.stage = 0
+        self.samples = []
+
+    def add(self, endpoint, seconds, outcome, ok):
+        self.samples.append((endpoint, self.stage, seconds, outcome, ok))
+
+class User:
+    """One virtual user: a cookie session, a random generator and the target."""
+
+    def __init__(self, number, options, recorder):
+        self.number = number
+        self.options = options
+        self.recorder = recorder
+        self.rng = random.Random(options.seed * 100003 + number)
+        self.cookies = {}
+
+    async def request(self, endpoint, method, path, form=None, expect=(200,)):
+        """Request path, recording it under endpoint; return the response.
+
+        Raises ScenarioFailed when the status is not in expect or the
+        request fails or times out.
+        """
+        headers = {}
+        if self.cookies:
+            headers['Cookie'] = '; '.join(f'{name}={value}' for name, value in self.cookies.items())
+        body = b''
+        if form is not None:
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+            body = urllib.parse.urlencode(form).encode()
+
+        endpoint = f'{method} {endpoint}'
+        started = time.perf_counter()
+        try:
+            response = await asyncio.wait_for(
+                fetch(self.options.host, self.options.port, method, path, headers, body),
+                self.options.timeout
+            )
+        except asyncio.TimeoutError:
+            self.recorder.add(endpoint, time.perf_counter() - started, 'timeout', False)
+            raise ScenarioFailed(f'{endpoint}: timeout')
+        except OSError as e:
+            self.recorder.add(endpoint, time.perf_counter() - started, type(e).__name__, False)
+            raise ScenarioFailed(f'{endpoint}: {e}')
+        seconds = time.perf_counter() - started
+
+        for cookie in response.cookies:
+            pair, _, attributes = cookie.partition(';')
+            name, _, value = pair.partition('=')
+            if not value or 'max-age=0' in attributes.lower().replace(' ', ''):
+                self.cookies.pop(name, None)
+            else:
+                self.cookies[name] = value
+
+        # A lost session shows up as an unexpected redirect to the login page
+        ok = response.status in expect
+        self.recorder.add(endpoint, seconds, response.status, ok)
+        if not ok:
+            raise ScenarioFailed(f'{endpoint}: {response.status}')
+        return response
+
+    def get(self, endpoint, path=None, expect=(200,)):
+        return self.request(endpoint, 'GET', path or endpoint, expect=expect)
+
+    def post(self, endpoint, form, path=None, expect=(302,)):
+        return self.request(endpoint, 'POST', path or endpoint, form, expect)
+
+    async def think(self):
+        if self.options.think:
+            await asyncio.sleep(self.rng.expovariate(1 / self.options.think))
+
+    async def login(self, username, password):
+        await self.get('/login')
+        await self.think()
+        await self.post('/login', {'username': username, 'password': password})
+
+    async def logout(self):
+        await self.get('/logout', expect=(302,))
+        self.cookies.clear()
+
+    def employee(self):
+        number = self.rng.randint(1, self.options.employees)
+        return dataset.employee_name(number).lower(), dataset.DEFAULT_PASSWORD
+
+    def month(self):
+        """A month of the dataset, the latest one half of the time."""
+        end = dataset.END
+        if self.rng.random() < 0.5:
+            first = end.replace(day=1)
+        else:
+            first = date(end.year - self.rng.randrange(self.options.years), self.rng.randint(1, 12), 1)
+        last = (first + timedelta(days=31)).replace(day=1) - timedelta(days=1)
+        return {'start_date': first.isoformat(), 'end_date': last.isoformat()}
+
+    async def report(self, prefix, form):
+        """Generate a report through the JSON API, wait for it and download it."""
+        response = await self.post(f'{prefix}/generate_report', form,
+                                   path=f'{prefix}/generate_report?format=json', expect=(200, 202))
+        answer = response.json()
+        if response.status == 202:
+            # Queued: poll the job like the report page does
+            status_url = answer['status_url']
+            deadline = time.monotonic() + self.options.timeout
+            while not answer.get('download_url'):
+                if time.monotonic() > deadline:
+                    self.recorder.add(f'GET {prefix}/report_jobs/<id>', 0.0, 'not done in time', False)
+                    raise ScenarioFailed(f'{status_url}: not done in time')
+                await asyncio.sleep(POLL_INTERVAL)
+                answer = (await self.get(f'{prefix}/report_jobs/<id>', status_url)).json()
+                if answer['job']['status'] == 'failed':
+                    self.recorder.add(f'GET {prefix}/report_jobs/<id>', 0.0, 'job failed', False)
+                    raise ScenarioFailed(f'{status_url}: failed')
+        await self.get(f'{prefix}/download_report/<id>', answer['download_url'])
+
+def _report_form(user):
+    form = user.month()
+    form['report_type'] = user.rng.choice(('work_records', 'earnings', 'detailed'))
+    form['file_format'] = user.rng.choice(('pdf', 'csv'))
+    return form
+
+async def shift(user):
+    await user.login(*user.employee())
+    for _ in range(user.rng.randint(3, 6)):
+        await user.think()
+        await user.get('/dashboard')
+    await user.think()
+    await user.get('/work_records')
+    await user.think()
+    await user.logout()
+
+async def reports(user):
+    await user.login(*user.employee())
+    await user.think()
+    await user.get('/reports')
+    await user.think()
+    await user.report('', _report_form(user))
+    await user.think()
+    await user.logout()
+
+async def month_end(user):
+    await user.login(user.options.admin_user, user.options.admin_password)
+    await user.think()
+    await user.get('/admin/dashboard')
+    await user.think()
+    await user.get('/admin/pay_runs')
+    await user.think()
+    await user.report('/admin', dict(_report_form(user), employee_id='all'))
+    await user.think()
+    await user.logout()
+
+SCENARIOS = {'shift': shift, 'reports': reports, 'month_end': month_end}
+
+def stages(profile, users, duration, steps):
+    """Return the profile as a list of (users, seconds)."""
+    if profile == 'steady':
+        return [(users, duration)]
+    if profile == 'ramp':
+        return [(math.ceil(users * step / steps), duration / steps) for step in range(1, steps + 1)]
+    low = max(1, users // 10)
+    return [(low, duration / 4), (users, duration / 2), (low, duration / 4)]
+
+async def run_user(user, scenarios, weights, state):
+    # Spread the first logins over one think time, except in a spike
+    if state['stagger']:
+        await asyncio.sleep(user.rng.uniform(0, user.options.think))
+    while user.number < state['target']:
+        scenario = user.rng.choices(scenarios, weights)[0]
+        try:
+            await scenario(user)
+        except ScenarioFailed:
+            # Whatever state the session is in, start over logged out
+            user.cookies.clear()
+            await user.think()
+
+async def drive(options, plan, mix):
+    recorder = Recorder()
+    scenarios = [SCENARIOS[name] for name in mix]
+    weights = list(mix.values())
+    state = {'target': 0, 'stagger': options.profile != 'spike'}
+    tasks = {}
+    for number, (users, seconds) in enumerate(plan):
+        recorder.stage = number
+        state['target'] = users
+        for n in range(users):
+            if n not in tasks or tasks[n].done():
+                tasks[n] = asyncio.ensure_future(
+                    run_user(User(n, options, recorder), scenarios, weights, state))
+        await asyncio.sleep(seconds)
+    # Let users finish what they are doing, but do not count it any more
+    state['target'] = 0
+    recorder.stage = len(plan)
+    done, pending = await asyncio.wait(tasks.values(), timeout=options.timeout)
+    for task in pending:
+        task.cancel()
+    return [sample for sample in recorder.samples if sample[1] < len(plan)]
+
+def _percentile(values, fraction):
+    return values[int(fraction * (len(values) - 1))]
+
+def summarize(samples, plan, slo_factor):
+    """Return per-endpoint and per-stage statistics and the saturation points."""
+    duration = sum(seconds for _, seconds in plan)
+    by_endpoint = defaultdict(list)
+    by_stage = defaultdict(list)
+    for sample in samples:
+        by_endpoint[sample[0]].append(sample)
+        by_stage[sample[1]].append(sample)
+
+    def stats(group, seconds):
+        latencies = sorted(s[2] * 1000 for s in group if s[4])
+        errors = defaultdict(int)
+        for s in group:
+            if not s[4]:
+                errors[str(s[3])] += 1
+        return {
+            'requests': len(group),
+            'rps': round(sum(1 for s in group if s[4]) / seconds, 2),
+            'p50_ms': round(_percentile(latencies, 0.5), 1) if latencies else None,
+            'p95_ms': round(_percentile(latencies, 0.95), 1) if latencies else None,
+            'p99_ms': round(_percentile(latencies, 0.99), 1) if latencies else None,
+            'max_ms': round(latencies[-1], 1) if latencies else None,
+            'error_rate': round(sum(errors.values()) / len(group), 4),
+            'errors': dict(errors),
+        }
+
+    endpoints = {}
+    for endpoint, group in sorted(by_endpoint.items()):
+        row = stats(group, duration)
+        row['stages'] = []
+        row['saturated_at'] = None
+        first_p95 = None
+        most = 0
+        for number, (users, seconds) in enumerate(plan):
+            rising, most = users > most, max(users, most)
+            staged = [s for s in group if s[1] == number]
+            if not staged:
+                row['stages'].append(None)
+                continue
+            stage = stats(staged, seconds)
+            row['stages'].append(stage)
+            if first_p95 is None:
+                first_p95 = stage['p95_ms']
+            slow = stage['p95_ms'] is not None and first_p95 and stage['p95_ms'] > slo_factor * first_p95
+            if rising and row['saturated_at'] is None and (slow or stage['error_rate'] > MAX_ERROR_RATE):
+                row['saturated_at'] = users
+        endpoints[endpoint] = row
+
+    overall = []
+    for number, (users, seconds) in enumerate(plan):
+        stage = stats(by_stage[number], seconds) if by_stage[number] else None
+        if stage:
+            stage['users'] = users
+        overall.append(stage)
+    return {'total': stats(samples, duration) if samples else None, 'stages': overall, 'endpoints': endpoints}
+
+def _ms(value):
+    return f'{value:>8.1f}' if value is not None else f"{'-':>8}"
+
+def print_summary(summary, plan, profile):
+    print(f"\n{'endpoint':<36} {'requests':>8} {'ok/s':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+          f"{'max ms':>8} {'errors':>7}  saturated at")
+    for endpoint, row in summary['endpoints'].items():
+        saturated = f"{row['saturated_at']} users" if row['saturated_at'] else '-'
+        print(f"{endpoint:<36} {row['requests']:>8} {row['rps']:>7.1f} {_ms(row['p50_ms'])} {_ms(row['p95_ms'])} "
+              f"{_ms(row['p99_ms'])} {_ms(row['max_ms'])} {row['error_rate']:>7.1%}  {saturated}")
+        if row['errors']:
+            print(f"{'':<36}   errors: " + ', '.join(f'{n}x {outcome}' for outcome, n in row['errors'].items()))
+
+    print(f"\n{'stage':<6} {'users':>6} {'seconds':>8} {'requests':>9} {'ok/s':>7} {'p50 ms':>8} {'p95 ms':>8} "
+          f"{'errors':>7}")
+    best = None
+    for number, ((users, seconds), stage) in enumerate(zip(plan, summary['stages'])):
+        if not stage:
+            print(f"{number + 1:<6} {users:>6} {seconds:>8.0f} {0:>9}")
+            continue
+        print(f"{number + 1:<6} {users:>6} {seconds:>8.0f} {stage['requests']:>9} {stage['rps']:>7.1f} "
+              f"{_ms(stage['p50_ms'])} {_ms(stage['p95_ms'])} {stage['error_rate']:>7.1%}")
+        if best is None or stage['rps'] > best['rps']:
+            best = stage
+    if best and profile == 'ramp':
+        print(f"\nThroughput peaked at {best['rps']:.1f} ok/s with {best['users']} users")
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def start_server(options, directory):
+    """Generate a dataset and start gunicorn on it; return the process."""
+    database = os.path.join(directory, 'load.db')
+    env = dict(os.environ, REPORT_STORE_PATH=os.path.join(directory, 'reports'))
+    env.pop('DATABASE_URL', None)
+    print(f"Generating {options.employees} employees over {options.years} years ...")
+    subprocess.run([sys.executable, os.path.join(ROOT, 'benchmarks', 'dataset.py'), '--database', database,
+                    '--employees', str(options.employees), '--years', str(options.years),
+                    '--reports', str(options.reports), '--seed', str(options.seed)],
+                   env=env, check=True, stdout=subprocess.DEVNULL)
+
+    env['DATABASE_URL'] = 'sqlite:///' + database
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '--workers', str(options.workers), '--threads', str(options.threads),
+         '--bind', f'{options.host}:{options.port}', '--log-level', 'warning', 'run:app'],
+        cwd=ROOT, env=env
+    )
+    url = f'http://{options.host}:{options.port}/login'
+    while True:
+        if server.poll() is not None:
+            raise RuntimeError('gunicorn exited during startup')
+        try:
+            urllib.request.urlopen(url, timeout=5).read()
+            return server
+        except OSError:
+            time.sleep(0.05)
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        if name not in SCENARIOS:
+            raise ValueError(f"unknown scenario {name!r}, pick from {', '.join(SCENARIOS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+def main():
+    from app.config import Config
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--url', help='server to test (default: start gunicorn on a synthetic dataset)')
+    parser.add_argument('--profile', choices=('steady', 'ramp', 'spike'), default='steady')
+    parser.add_argument('--users', type=int, default=20, help='virtual users at the peak')
+    parser.add_argument('--duration', type=float, default=60, help='seconds the profile lasts')
+    parser.add_argument('--steps', type=int, default=5, help='stages of the ramp profile')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help=f'scenario weights (default {DEFAULT_MIX})')
+    parser.add_argument('--think', type=float, default=1.0, help='mean think time in seconds, 0 for none')
+    parser.add_argument('--timeout', type=float, default=30, help='seconds before a request or report fails')
+    parser.add_argument('--slo-factor', type=float, default=3.0,
+                        help="p95 growth over the first stage's that counts as saturated")
+    parser.add_argument('--employees', type=int, default=100, help='employees in the dataset')
+    parser.add_argument('--years', type=int, default=1, help='years of work records in the dataset')
+    parser.add_argument('--reports', type=int, default=20, help='stored reports in the dataset')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn workers')
+    parser.add_argument('--threads', type=int, default=1, help='gunicorn threads per worker')
+    parser.add_argument('--admin-user', default=Config.ADMIN_USERNAME)
+    parser.add_argument('--admin-password', default=Config.ADMIN_PASSWORD)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='write the summary to this JSON file')
+    options = parser.parse_args()
+    try:
+        mix = parse_mix(options.mix)
+    except ValueError as e:
+        parser.error(str(e))
+
+    directory = server = None
+    if options.url:
+        target = urllib.parse.urlsplit(options.url)
+        if target.scheme != 'http':
+            parser.error('only http:// servers can be tested')
+        options.host, options.port = target.hostname, target.port or 80
+    else:
+        options.host, options.port = '127.0.0.1', free_port()
+        directory = tempfile.mkdtemp()
+        server = start_server(options, directory)
+
+    plan = stages(options.profile, options.users, options.duration, options.steps)
+    print(f"{options.profile} profile, {' -> '.join(str(users) for users, _ in plan)} users over "
+          f"{options.duration:.0f}s, mix {', '.join(f'{name}={weight:g}' for name, weight in mix.items())}, "
+          f"against http://{options.host}:{options.port}")
+    try:
+        samples = asyncio.run(drive(options, plan, mix))
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+            shutil.rmtree(directory)
+
+    summary = summarize(samples, plan, options.slo_factor)
+    print_summary(summary, plan, options.profile)
+    if options.output:
+        with open(options.output, 'w') as f:
+            json.dump({'options': {name: value for name, value in vars(options).items()
+                                   if name != 'admin_password'},
+                       'plan': plan, **summary}, f, indent=2)
+        print(f"\nWrote {options.output}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Wall time of a vectorized pay run over a large pay period.
+
+Builds a throwaway SQLite database with --employees employees and
+--records work records spread over a four-week period, with a rate
+change half way through for every other employee, then times
+payroll.run_payroll() split into load, compute and save.
+
+    python benchmarks/payroll_run.py
+    python benchmarks/payroll_run.py --records 100000 --employees 1000 --python
+
+--python also computes the same pay with a plain per-record loop, checks
+both give the same totals, and times rates.RateTable looking up the rate
+of every record one at a time.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# A Monday, so the period is exactly four payroll weeks
+START = date(2024, 1, 1)
+DAYS = 28
+
+def populate(conn, employees, records):
+    from sqlalchemy import text
+    rng = random.Random(42)
+    rates = {i: round(rng.uniform(15, 60), 2) for i in range(1, employees + 1)}
+    conn.execute(text("INSERT INTO employees (id, name, hourly_rate) VALUES (:id, :name, :rate)"),
+                 [{'id': i, 'name': f'Employee {i:05d}', 'rate': rate} for i, rate in rates.items()])
+    history = [{'employee_id': i, 'effective_from': START - timedelta(days=365), 'rate': rate}
+               for i, rate in rates.items()]
+    history += [{'employee_id': i, 'effective_from': START + timedelta(days=DAYS // 2), 'rate': round(rate * 1.1, 2)}
+                for i, rate in rates.items() if i % 2]
+    conn.execute(text("""INSERT INTO employee_rates (employee_id, effective_from, hourly_rate)
+                         VALUES (:employee_id, :effective_from, :rate)"""), history)
+    per_employee = records // employees
+    insert = text("""INSERT INTO work_records (employee_id, date, hours_worked, amount_earned)
+                     VALUES (:employee_id, :date, :hours, :amount)""")
+    batch = []
+    for n in range(per_employee * employees):
+        employee_id = n % employees + 1
+        day = (n // employees) * DAYS // per_employee
+        rate = rates[employee_id]
+        # Every other employee gets a 10% raise from the third week
+        if employee_id % 2 and day >= DAYS // 2:
+            rate = round(rate * 1.1, 2)
+        hours = round(rng.uniform(1, 6), 2)
+        batch.append({'employee_id': employee_id, 'date': START + timedelta(days=day),
+                      'hours': hours, 'amount': hours * rate})
+        if len(batch) >= 50000:
+            conn.execute(insert, batch)
+            batch = []
+    if batch:
+        conn.execute(insert, batch)
+
+def python_pay(records, overtime_threshold, overtime_multiplier):
+    """The same pay rules as payroll.compute_pay(), one record at a time."""
+    week_hours = {}
+    gross = {}
+    for employee_id, day, hours, amount in zip(records['employee_id'].tolist(), records['day'].tolist(),
+                                               records['hours'].tolist(), records['amount'].tolist()):
+        rate = amount / hours if hours > 0 else 0.0
+        key = (employee_id, (day + 3) // 7)
+        before = week_hours.get(key, 0.0)
+        week_hours[key] = before + hours
+        overtime = min(max(before + hours - overtime_threshold, 0.0), hours)
+        gross[employee_id] = gross.get(employee_id, 0.0) + rate * (hours - overtime + overtime * overtime_multiplier)
+    return gross
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--records', type=int, default=1000000)
+    parser.add_argument('--employees', type=int, default=10000)
+    parser.add_argument('--python', action='store_true', help='also time a per-record Python loop')
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + path
+
+    from app import create_app
+    from app.database import db, query_db, init_db
+    from app import payroll
+    from app.rates import RateTable
+    import numpy as np
+
+    app = create_app()
+    with app.app_context():
+        init_db()
+        started = time.perf_counter()
+        with db.engine.begin() as conn:
+            populate(conn, args.employees, args.records)
+        print(f"{args.records} work records for {args.employees} employees in {path} "
+              f"({time.perf_counter() - started:.1f}s)\n")
+
+        end = START + timedelta(days=DAYS - 1)
+        result = payroll.run_payroll(START, end)
+        run = query_db("SELECT * FROM pay_runs WHERE id = ?", (result['pay_run_id'],), one=True)
+        total = result['load_seconds'] + result['compute_seconds'] + result['save_seconds']
+        print(f"{'load':<10} {result['load_seconds']:>8.3f}s")
+        print(f"{'compute':<10} {result['compute_seconds']:>8.3f}s")
+        print(f"{'save':<10} {result['save_seconds']:>8.3f}s")
+        print(f"{'total':<10} {total:>8.3f}s  {result['records'] / total:,.0f} records/s")
+        print(f"\n{run['employee_count']} employees, {run['regular_hours']:.2f} regular and "
+              f"{run['overtime_hours']:.2f} overtime hours, gross ${run['gross_pay']:,.2f}")
+
+        if args.python:
+            threshold = app.config['OVERTIME_WEEKLY_HOURS']
+            multiplier = app.config['OVERTIME_MULTIPLIER']
+            records = payroll.load_period(START, end)
+            started = time.perf_counter()
+            pay = payroll.compute_pay(records, threshold, multiplier)
+            vectorized = time.perf_counter() - started
+            started = time.perf_counter()
+            expected = python_pay(records, threshold, multiplier)
+            loop = time.perf_counter() - started
+            difference = max(abs(expected[employee_id] - gross)
+                             for employee_id, gross in zip(pay['employee_id'].tolist(), pay['gross_pay'].tolist()))
+            print(f"\ncompute: numpy {vectorized:.3f}s, python loop {loop:.3f}s "
+                  f"({loop / vectorized:.0f}x), largest difference ${difference:.6f}")
+
+            epoch = date(1970, 1, 1)
+            pairs = [(employee_id, epoch + timedelta(days=day))
+                     for employee_id, day in zip(records['employee_id'].tolist(), records['day'].tolist())]
+            started = time.perf_counter()
+            table = RateTable.load()
+            loaded = time.perf_counter() - started
+            started = time.perf_counter()
+            looked_up = [table.rate_on(employee_id, day) for employee_id, day in pairs]
+            lookups = time.perf_counter() - started
+            mismatches = int((np.array(looked_up) != records['rate']).sum())
+            print(f"RateTable: load {loaded:.3f}s, {len(pairs)} lookups {lookups:.3f}s "
+                  f"({len(pairs) / lookups:,.0f}/s), {mismatches} differ from the vectorized rates")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Before/after benchmark for the indexes added by migration 1.
+
+Builds a throwaway SQLite database, fills it with synthetic work records,
+then times the hot queries and prints their query plans with the indexes
+dropped and again after run_migrations() has recreated them.
+
+    python benchmarks/query_plans.py --employees 200 --days 730
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+QUERIES = {
+    'admin work records': (
+        """SELECT wr.*, e.name as employee_name
+           FROM work_records wr
+           JOIN employees e ON wr.employee_id = e.id
+           ORDER BY wr.date DESC, wr.id DESC
+           LIMIT 50""",
+        {}
+    ),
+    'employee dashboard sums': (
+        """SELECT COALESCE(SUM(hours_worked), 0), COALESCE(SUM(amount_earned), 0)
+           FROM work_records WHERE employee_id = :employee_id""",
+        {'employee_id': 7}
+    ),
+    'employee recent records': (
+        """SELECT * FROM work_records WHERE employee_id = :employee_id
+           ORDER BY date DESC LIMIT 10""",
+        {'employee_id': 7}
+    ),
+    'report range scan': (
+        """SELECT wr.*, e.name as employee_name
+           FROM work_records wr
+           JOIN employees e ON wr.employee_id = e.id
+           WHERE wr.date BETWEEN :start AND :end AND wr.employee_id = :employee_id""",
+        {'start': '2023-01-01', 'end': '2023-01-31', 'employee_id': 7}
+    ),
+    'today count': (
+        "SELECT COUNT(*) FROM work_records WHERE date = :day",
+        {'day': '2023-06-01'}
+    ),
+    'employee reports': (
+        """SELECT * FROM reports WHERE employee_id = :employee_id
+           ORDER BY date_created DESC LIMIT 10""",
+        {'employee_id': 7}
+    ),
+}
+
+INDEXES = [
+    'ix_work_records_employee_date',
+    'ix_work_records_date_id',
+    'ix_reports_employee_created',
+    'ix_reports_created',
+    'ix_users_employee_id',
+]
+
+def populate(conn, employees, days):
+    from sqlalchemy import text
+    rng = random.Random(42)
+    conn.execute(text("INSERT INTO employees (id, name, hourly_rate) VALUES (:id, :name, :rate)"),
+                 [{'id': i, 'name': f'Employee {i:04d}', 'rate': rng.uniform(12, 40)}
+                  for i in range(1, employees + 1)])
+    start = date(2022, 1, 1)
+    rows = []
+    for day in range(days):
+        day_value = start + timedelta(days=day)
+        for employee_id in range(1, employees + 1):
+            hours = round(rng.uniform(4, 10), 2)
+            rows.append({'employee_id': employee_id, 'date': day_value,
+                         'hours': hours, 'amount': hours * 20})
+        if len(rows) >= 50000:
+            conn.execute(text("""INSERT INTO work_records (employee_id, date, hours_worked, amount_earned)
+                                 VALUES (:employee_id, :date, :hours, :amount)"""), rows)
+            rows = []
+    if rows:
+        conn.execute(text("""INSERT INTO work_records (employee_id, date, hours_worked, amount_earned)
+                             VALUES (:employee_id, :date, :hours, :amount)"""), rows)
+    conn.execute(text("ANALYZE"))
+
+def measure(conn, label, repeat):
+    from sqlalchemy import text
+    print(f"\n== {label} ==")
+    results = {}
+    for name, (sql, params) in QUERIES.items():
+        plan = conn.execute(text("EXPLAIN QUERY PLAN " + sql), params).fetchall()
+        started = time.perf_counter()
+        for _ in range(repeat):
+            conn.execute(text(sql), params).fetchall()
+        elapsed = (time.perf_counter() - started) / repeat * 1000
+        results[name] = elapsed
+        print(f"{name:<26} {elapsed:9.3f} ms  | " + '; '.join(row[-1] for row in plan))
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--employees', type=int, default=100)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + path
+
+    from app import create_app
+    from app.database import db, init_db
+    from app.migrations import run_migrations
+    from sqlalchemy import text
+
+    app = create_app()
+    with app.app_context():
+        init_db()
+        with db.engine.begin() as conn:
+            populate(conn, args.employees, args.days)
+            for name in INDEXES:
+                conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+            conn.execute(text("DELETE FROM schema_version"))
+        print(f"{args.employees * args.days} work records in {path}")
+
+        with db.engine.connect() as conn:
+            before = measure(conn, 'before migrations', args.repeat)
+        run_migrations()
+        with db.engine.begin() as conn:
+            conn.execute(text("ANALYZE"))
+        with db.engine.connect() as conn:
+            after = measure(conn, 'after migrations', args.repeat)
+
+    print("\n== speedup ==")
+    for name in QUERIES:
+        print(f"{name:<26} {before[name] / max(after[name], 1e-6):8.1f}x")
+
+if __name__ == '__main__':
+    main()
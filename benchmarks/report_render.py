@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Peak memory and wall time of the streaming PDF report renderer.
+
+Builds a throwaway SQLite database with --rows work records, then renders
+the admin detailed report over growing slices of it. Each render runs in
+a fresh process so its peak RSS is measured on its own. Time and memory
+per page should stay flat as the report grows.
+
+    python benchmarks/report_render.py --rows 100000
+    python benchmarks/report_render.py --rows 20000 --single-table
+
+--single-table also renders each slice the old way, as one Table built
+from a fully materialized list into a BytesIO, for comparison.
+"""
+import argparse
+import io
+import os
+import re
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+EMPLOYEES = 100
+START = date(2020, 1, 1)
+
+def populate(conn, rows):
+    from sqlalchemy import text
+    conn.execute(text("INSERT INTO employees (id, name, hourly_rate) VALUES (:id, :name, :rate)"),
+                 [{'id': i, 'name': f'Employee {i:04d}', 'rate': 20.0} for i in range(1, EMPLOYEES + 1)])
+    batch = []
+    for n in range(rows):
+        batch.append({'employee_id': n % EMPLOYEES + 1, 'date': START + timedelta(days=n // EMPLOYEES),
+                      'hours': 8.0, 'amount': 160.0})
+        if len(batch) >= 50000:
+            conn.execute(text("""INSERT INTO work_records (employee_id, date, hours_worked, amount_earned)
+                                 VALUES (:employee_id, :date, :hours, :amount)"""), batch)
+            batch = []
+    if batch:
+        conn.execute(text("""INSERT INTO work_records (employee_id, date, hours_worked, amount_earned)
+                             VALUES (:employee_id, :date, :hours, :amount)"""), batch)
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def single_table_pdf(records, start_date, end_date):
+    """The renderer this benchmark replaced: one Table over every row."""
+    from reportlab.lib.pagesizes import letter
+    from reportlab.platypus import SimpleDocTemplate, Table, Paragraph, Spacer
+    from app.pdf_report import TABLE_STYLE, TITLE_STYLE, TEXT_STYLE
+
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=letter)
+    data = [['Employee', 'Date', 'Hourly Rate', 'Hours Worked', 'Amount Earned']]
+    for record in records:
+        data.append([
+            record['employee_name'],
+            record['date'].strftime('%Y-%m-%d'),
+            f"${record['hourly_rate']:.2f}",
+            f"{record['hours_worked']:.2f}",
+            f"${record['amount_earned']:.2f}"
+        ])
+    table = Table(data)
+    table.setStyle(TABLE_STYLE)
+    doc.build([Paragraph('Detailed Report', TITLE_STYLE),
+               Paragraph(f'Period: {start_date} to {end_date}', TEXT_STYLE),
+               Spacer(1, 20), table])
+    buffer.seek(0)
+    return buffer
+
+def render(rows, mode):
+    """Child process: render a report over the first `rows` records."""
+    from app import create_app
+    from app.database import query_db
+    from app.report_engine import build_report
+
+    app = create_app()
+    with app.app_context():
+        end = START + timedelta(days=(rows - 1) // EMPLOYEES)
+        baseline = peak_rss_mb()
+        started = time.perf_counter()
+        if mode == 'stream':
+            output = build_report('admin', None, 'detailed', START, end)
+        else:
+            records = query_db(
+                """SELECT wr.*, e.name as employee_name, e.hourly_rate
+                   FROM work_records wr JOIN employees e ON wr.employee_id = e.id
+                   WHERE wr.date BETWEEN ? AND ? ORDER BY e.name, wr.date DESC""",
+                (START, end)
+            )
+            output = single_table_pdf(records, START, end)
+        content = output.read()
+        elapsed = time.perf_counter() - started
+    pages = len(re.findall(rb'/Type /Page\b(?!s)', content))
+    print(f"{pages} {elapsed:.3f} {baseline:.1f} {peak_rss_mb():.1f} {len(content)}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--steps', type=int, default=4, help='number of report sizes up to --rows')
+    parser.add_argument('--single-table', action='store_true', help='also time the old renderer')
+    parser.add_argument('--child', choices=['stream', 'single'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        render(args.rows, args.child)
+        return
+
+    path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + path
+
+    from app import create_app
+    from app.database import db, init_db
+
+    app = create_app()
+    with app.app_context():
+        init_db()
+        with db.engine.begin() as conn:
+            populate(conn, args.rows)
+    print(f"{args.rows} work records in {path}\n")
+
+    modes = ['stream'] + (['single'] if args.single_table else [])
+    print(f"{'renderer':<8} {'rows':>8} {'pages':>6} {'seconds':>8} {'ms/page':>8} "
+          f"{'peak MB':>8} {'+MB':>7} {'KB/page':>8} {'PDF KB':>8}")
+    for step in range(1, args.steps + 1):
+        rows = args.rows * step // args.steps
+        for mode in modes:
+            out = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '--child', mode, '--rows', str(rows)],
+                capture_output=True, text=True, env=os.environ, check=True
+            ).stdout.splitlines()[-1].split()
+            pages, seconds, baseline, peak, size = int(out[0]), float(out[1]), float(out[2]), float(out[3]), int(out[4])
+            growth = peak - baseline
+            print(f"{mode:<8} {rows:>8} {pages:>6} {seconds:>8.2f} {seconds / pages * 1000:>8.2f} "
+                  f"{peak:>8.1f} {growth:>7.1f} {growth * 1024 / pages:>8.1f} {size / 1024:>8.0f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Reads and writes per second on SQLite with 1 to 16 concurrent workers.
+
+Seeds a throwaway SQLite database, then for every profile and worker
+count starts that many worker processes (like gunicorn workers), each
+running --threads threads that for --seconds read an employee's recent
+records and monthly totals or, with probability --write-ratio, add a work
+record with its rollup deltas the way admin.add_work_record does.
+
+    python benchmarks/sqlite_concurrency.py
+    python benchmarks/sqlite_concurrency.py --workers 1,4,16 --threads 4 --seconds 5
+
+Profiles:
+  stock  rollback journal and driver defaults (SQLITE_TUNING off)
+  wal    WAL, tuned pragmas and BEGIN IMMEDIATE writes, one commit per write
+  group  wal plus group commit of concurrent writes within a process
+
+Failed operations, such as "database is locked", are counted as errors,
+and the write latency percentiles show how long writes wait for the lock.
+Request metrics are switched off so that only the database is measured.
+"""
+import argparse
+import contextlib
+import io
+import multiprocessing
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+EMPLOYEES = 200
+RECORDS = 20000
+START = date(2024, 1, 1)
+
+PROFILES = {
+    'stock': {'SQLITE_TUNING': '0'},
+    'wal': {'SQLITE_TUNING': '1', 'SQLITE_GROUP_COMMIT': '0'},
+    'group': {'SQLITE_TUNING': '1', 'SQLITE_GROUP_COMMIT': '1'},
+}
+
+def seed(path):
+    os.environ['DATABASE_URL'] = 'sqlite:///' + path
+    os.environ.update(PROFILES['stock'])
+    from app import create_app
+    from app.database import execute_many, transaction, init_db
+    from app.rollups import record_deltas
+
+    rng = random.Random(1)
+    app = create_app()
+    with app.app_context():
+        init_db()
+        with transaction():
+            execute_many("INSERT INTO employees (id, name, hourly_rate) VALUES (:id, :name, 20)",
+                         [{'id': i, 'name': f'Employee {i:03d}'} for i in range(1, EMPLOYEES + 1)])
+            records = [(rng.randint(1, EMPLOYEES), START + timedelta(days=rng.randrange(365)),
+                        round(rng.uniform(1, 8), 2)) for _ in range(RECORDS)]
+            execute_many("""INSERT INTO work_records (employee_id, date, hours_worked, amount_earned)
+                            VALUES (:employee_id, :date, :hours, :amount)""",
+                         [{'employee_id': e, 'date': d, 'hours': h, 'amount': h * 20} for e, d, h in records])
+            record_deltas((e, d, h, h * 20) for e, d, h in records)
+
+def worker(path, profile, threads, seconds, write_ratio, seed_value, ready, start, results):
+    import threading
+    os.environ['DATABASE_URL'] = 'sqlite:///' + path
+    os.environ.update(PROFILES[profile])
+    os.environ['METRICS_ENABLED'] = '0'
+    from app import create_app
+    from app.database import query_db, execute_db, transaction
+    from app.rollups import record_delta
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        app = create_app()
+    counts = {'reads': 0, 'writes': 0, 'errors': 0}
+    latencies = []
+    lock = threading.Lock()
+
+    def run(n):
+        rng = random.Random(seed_value * 100 + n)
+        done = {'reads': 0, 'writes': 0, 'errors': 0}
+        waits = []
+        with app.app_context():
+            deadline = time.perf_counter() + seconds
+            while time.perf_counter() < deadline:
+                employee_id = rng.randint(1, EMPLOYEES)
+                try:
+                    if rng.random() < write_ratio:
+                        day = START + timedelta(days=rng.randrange(365))
+                        hours = round(rng.uniform(1, 8), 2)
+                        started = time.perf_counter()
+                        with transaction():
+                            execute_db(
+                                "INSERT INTO work_records (employee_id, date, hours_worked, amount_earned) VALUES (?, ?, ?, ?)",
+                                (employee_id, day, hours, hours * 20)
+                            )
+                            record_delta(employee_id, day, hours, hours * 20)
+                        waits.append(time.perf_counter() - started)
+                        done['writes'] += 1
+                    else:
+                        query_db("""SELECT * FROM work_records WHERE employee_id = ?
+                                    ORDER BY date DESC, id DESC LIMIT 20""", (employee_id,))
+                        query_db("""SELECT month, total_hours, total_earnings FROM payroll_monthly
+                                    WHERE employee_id = ? ORDER BY month DESC LIMIT 12""", (employee_id,))
+                        done['reads'] += 1
+                except Exception:
+                    done['errors'] += 1
+        with lock:
+            for key, value in done.items():
+                counts[key] += value
+            latencies.extend(waits)
+
+    ready.wait()
+    start.wait()
+    pool = [threading.Thread(target=run, args=(n,)) for n in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    results.put((counts, latencies))
+
+def measure(template, profile, workers, args):
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'bench.db')
+    shutil.copy(template, path)
+    context = multiprocessing.get_context('spawn')
+    ready = context.Barrier(workers + 1)
+    start = context.Barrier(workers + 1)
+    results = context.Queue()
+    processes = [context.Process(target=worker, args=(path, profile, args.threads, args.seconds,
+                                                      args.write_ratio, n, ready, start, results))
+                 for n in range(workers)]
+    for process in processes:
+        process.start()
+    ready.wait()
+    start.wait()
+    totals = {'reads': 0, 'writes': 0, 'errors': 0}
+    latencies = []
+    for _ in processes:
+        counts, waits = results.get()
+        for key, value in counts.items():
+            totals[key] += value
+        latencies.extend(waits)
+    for process in processes:
+        process.join()
+    shutil.rmtree(directory)
+    rates = {key: value / args.seconds for key, value in totals.items()}
+    latencies.sort()
+    for name, fraction in (('p50', 0.5), ('p99', 0.99)):
+        rates[name] = latencies[int(fraction * (len(latencies) - 1))] * 1000 if latencies else 0.0
+    return rates
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--workers', default='1,2,4,8,16', help='comma-separated worker process counts')
+    parser.add_argument('--threads', type=int, default=2, help='threads per worker')
+    parser.add_argument('--seconds', type=float, default=3)
+    parser.add_argument('--write-ratio', type=float, default=0.2)
+    parser.add_argument('--profiles', default=','.join(PROFILES))
+    args = parser.parse_args()
+
+    template = os.path.join(tempfile.mkdtemp(), 'template.db')
+    started = time.perf_counter()
+    seed(template)
+    print(f"{EMPLOYEES} employees, {RECORDS} work records ({time.perf_counter() - started:.1f}s), "
+          f"{args.threads} threads per worker, {args.write_ratio:.0%} writes\n")
+
+    print(f"{'profile':<8} {'workers':>7} {'reads/s':>10} {'writes/s':>10} {'errors/s':>10} "
+          f"{'write p50':>10} {'write p99':>10}")
+    for profile in args.profiles.split(','):
+        for workers in (int(n) for n in args.workers.split(',')):
+            rates = measure(template, profile, workers, args)
+            print(f"{profile:<8} {workers:>7} {rates['reads']:>10,.0f} {rates['writes']:>10,.0f} "
+                  f"{rates['errors']:>10,.1f} {rates['p50']:>8.1f}ms {rates['p99']:>8.1f}ms")
+    shutil.rmtree(os.path.dirname(template))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,24 @@
+"""Gunicorn settings, picked up by `gunicorn run:app` from this directory.
+
+The app is loaded once in the master and the workers are forked from it,
+so a worker boots without importing or configuring anything and shares
+the master's loaded code copy-on-write. Set GUNICORN_PRELOAD=0 to load
+the app in every worker instead, e.g. to deploy code with a plain HUP.
+Other settings (workers, threads, ...) come from the command line,
+WEB_CONCURRENCY or GUNICORN_CMD_ARGS as usual.
+"""
+import gc
+import os
+
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'true').lower() in ('1', 'true', 'yes', 'on')
+
+def when_ready(server):
+    if server.cfg.preload_app:
+        # Keep the garbage collector from touching, and so copying, the
+        # objects the workers inherit
+        gc.freeze()
+
+def post_fork(server, worker):
+    if server.cfg.preload_app:
+        from app import after_fork
+        after_fork(worker.app.wsgi())
@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+"""
+Add employees and their logins from a CSV or XLSX file
+
+    python import_employees.py crew.csv
+    python import_employees.py crew.xlsx --skip-invalid
+"""
+import argparse
+import sys
+from app import create_app
+from app.onboarding import read_employee_rows, onboard_employees
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('path', help='CSV or XLSX file with name and hourly_rate columns '
+                                     '(and optional username and password)')
+    parser.add_argument('--skip-invalid', action='store_true',
+                        help='add the valid rows even if some rows have errors')
+    args = parser.parse_args()
+
+    app = create_app()
+
+    with app.app_context(), open(args.path, 'rb') as stream:
+        try:
+            result = onboard_employees(read_employee_rows(stream, args.path), skip_invalid=args.skip_invalid)
+        except ValueError as e:
+            print(f"Could not read {args.path}: {e}")
+            return 1
+
+    for error in result['errors']:
+        print(f"line {error['line']}: {error['error']}")
+    print(f"Read {result['rows']} rows, added {result['created']} employees in {result['seconds']}s")
+    return 1 if result['errors'] and not result['created'] else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+"""
+Import work records from a CSV or XLSX timesheet
+
+    python import_records.py timesheet.csv
+    python import_records.py timesheet.xlsx --skip-invalid
+"""
+import argparse
+import sys
+from app import create_app
+from app.bulk_import import read_rows, import_work_records
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('path', help='CSV or XLSX file with employee_id, date and hours_worked columns')
+    parser.add_argument('--skip-invalid', action='store_true',
+                        help='import the valid rows even if some rows have errors')
+    args = parser.parse_args()
+
+    app = create_app()
+
+    with app.app_context(), open(args.path, 'rb') as stream:
+        try:
+            result = import_work_records(read_rows(stream, args.path), skip_invalid=args.skip_invalid)
+        except ValueError as e:
+            print(f"Could not read {args.path}: {e}")
+            return 1
+
+    for error in result['errors']:
+        print(f"line {error['line']}: {error['error']}")
+    print(f"Read {result['rows']} rows, imported {result['inserted']} "
+          f"in {result['seconds']}s ({result['rows_per_second']} rows/s)")
+    return 1 if result['errors'] and not result['inserted'] else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
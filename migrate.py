@@ -2,8 +2,11 @@
 """
 Database migration script for Render deployment
 """
+import sys
 from app import create_app
 from app.database import init_db
+from app.migrations import current_version, pending_migrations, run_migrations
+from app.rollups import rebuild_rollups
 from app.config import Config
 
 def setup_database():
@@ -13,8 +16,34 @@ def setup_database():
     with app.app_context():
         # Initialize database (this will create tables and admin user)
         init_db()
+        
+        # Bring existing tables up to the latest schema version
+        run_migrations()
         print("Database initialization completed!")
         print(f"Admin user '{Config.ADMIN_USERNAME}' is ready!")
 
+def show_status():
+    """Print the current schema version and any pending migrations"""
+    app = create_app()
+    
+    with app.app_context():
+        print(f"Schema version: {current_version()}")
+        for version, description, _ in pending_migrations():
+            print(f"  pending {version}: {description}")
+
+def rebuild():
+    """Recompute the payroll rollup tables from work_records"""
+    app = create_app()
+    
+    with app.app_context():
+        months = rebuild_rollups()
+        print(f"Rebuilt payroll rollups ({months} months)")
+
 if __name__ == '__main__':
-    setup_database() 
\ No newline at end of file
+    command = sys.argv[1] if len(sys.argv) > 1 else None
+    if command == 'status':
+        show_status()
+    elif command == 'rebuild-rollups':
+        rebuild()
+    else:
+        setup_database()
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+Recompute work record amounts from the effective-dated rate history
+
+    python recompute_amounts.py
+    python recompute_amounts.py --employee 3 --employee 7 --start 2024-01-01 --end 2024-12-31
+"""
+import argparse
+import sys
+from datetime import datetime
+from app import create_app
+from app.recompute import recompute_amounts, CHUNK_SIZE
+
+def parse_date(value):
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+def show_progress(status):
+    percent = status['scanned'] * 100 // status['total'] if status['total'] else 100
+    print(f"\r{status['scanned']}/{status['total']} records ({percent}%), "
+          f"{status['updated']} updated", end='', flush=True)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--employee', type=int, action='append', dest='employee_ids',
+                        help='employee id to recompute (repeatable; default all employees)')
+    parser.add_argument('--start', type=parse_date, help='first record date, YYYY-MM-DD')
+    parser.add_argument('--end', type=parse_date, help='last record date, YYYY-MM-DD')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                        help=f'records per transaction (default {CHUNK_SIZE})')
+    args = parser.parse_args()
+
+    app = create_app()
+
+    with app.app_context():
+        result = recompute_amounts(args.employee_ids, args.start, args.end,
+                                   chunk_size=args.chunk_size, progress=show_progress)
+
+    print(f"\nUpdated {result['updated']} of {result['records']} records in {result['chunks']} chunks "
+          f"in {result['seconds']}s ({result['rows_per_second']} rows/s)")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,16 @@
+import pytest
+from app import create_app
+from app.config import Config
+from app.database import db, init_db
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    """An app on a fresh SQLite database, with its app context pushed."""
+    monkeypatch.setattr(Config, 'SQLALCHEMY_DATABASE_URI', f"sqlite:///{tmp_path / 'payroll.db'}")
+    monkeypatch.setattr(Config, 'REPORT_STORE_PATH', str(tmp_path / 'reports'))
+    monkeypatch.setattr(Config, 'PASSWORD_HASH_METHOD', 'pbkdf2:sha256:1000')
+    app = create_app()
+    with app.app_context():
+        init_db()
+        yield app
+        db.get_engine(app).dispose()
@@ -0,0 +1,83 @@
+"""The versioned migrations runner."""
+from datetime import date
+import pytest
+from sqlalchemy import inspect
+from app import migrations
+from app.database import db, execute_db, query_db
+from app.migrations import MIGRATIONS, add_column, current_version, pending_migrations, run_migrations
+
+def _applied():
+    return [row['version'] for row in query_db("SELECT version FROM schema_version ORDER BY version")]
+
+def _tables():
+    return set(inspect(db.engine).get_table_names())
+
+def test_a_new_database_gets_every_migration_in_order(app):
+    assert current_version() == 0
+
+    applied = run_migrations()
+
+    versions = [version for version, _, _ in MIGRATIONS]
+    assert applied == versions == sorted(versions)
+    assert _applied() == versions
+    assert current_version() == versions[-1]
+
+def test_applied_migrations_are_not_run_again(app):
+    run_migrations()
+
+    assert pending_migrations() == []
+    assert run_migrations() == []
+
+def test_only_later_versions_are_pending(app):
+    for version, description, _ in MIGRATIONS[:-2]:
+        execute_db(
+            "INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, CURRENT_TIMESTAMP)",
+            (version, description)
+        )
+
+    assert pending_migrations() == MIGRATIONS[-2:]
+    assert run_migrations() == [version for version, _, _ in MIGRATIONS[-2:]]
+
+def test_a_failing_migration_is_rolled_back(app, monkeypatch):
+    run_migrations()
+    version = MIGRATIONS[-1][0] + 1
+
+    def fail():
+        raise RuntimeError('step failed')
+
+    monkeypatch.setattr(migrations, 'MIGRATIONS', MIGRATIONS + [
+        (version, 'Broken', ["CREATE TABLE scratch (id INTEGER PRIMARY KEY)", fail]),
+    ])
+    with pytest.raises(RuntimeError):
+        run_migrations()
+
+    assert 'scratch' not in _tables()
+    assert current_version() == version - 1
+
+def test_add_column_skips_a_column_that_exists(app):
+    step = add_column('reports', 'fingerprint', 'VARCHAR(64)')
+
+    step()
+    step()
+
+    columns = [c['name'] for c in inspect(db.engine).get_columns('reports')]
+    assert columns.count('fingerprint') == 1
+
+def test_rate_backfill_follows_the_rates_records_were_paid_at(app):
+    employee_id = execute_db("INSERT INTO employees (name, hourly_rate) VALUES ('Alice', 25)")
+    for day, hours, amount in ((date(2024, 1, 2), 8, 160), (date(2024, 1, 3), 4, 80),
+                               (date(2024, 2, 1), 8, 192)):
+        execute_db(
+            "INSERT INTO work_records (employee_id, date, hours_worked, amount_earned) VALUES (?, ?, ?, ?)",
+            (employee_id, day, hours, amount)
+        )
+
+    run_migrations()
+
+    history = [(row['effective_from'], row['hourly_rate']) for row in query_db(
+        "SELECT effective_from, hourly_rate FROM employee_rates WHERE employee_id = ? ORDER BY effective_from",
+        (employee_id,)
+    )]
+    assert history[:2] == [(date(1970, 1, 1), 20.0), (date(2024, 2, 1), 24.0)]
+    # The current rate differs from the last one paid, so it starts today
+    assert history[2][1] == 25.0 and history[2][0] >= date.today()
@@ -0,0 +1,178 @@
+"""Overtime and rate rules of the pay-run engine."""
+import random
+from datetime import date, timedelta
+import numpy as np
+import pytest
+from app.database import execute_db, query_db
+from app.payroll import compute_pay, rates_on, run_payroll
+from app.rates import FIRST_DAY, RateTable, set_rate
+
+EPOCH = date(1970, 1, 1)
+
+# 2024-01-01 is a Monday
+MONDAY = date(2024, 1, 1)
+
+def _records(rows):
+    """load_period()-style arrays from (employee_id, day, hours, rate) rows."""
+    rows = sorted(rows, key=lambda row: (row[0], row[1]))
+    return {
+        'employee_id': np.array([row[0] for row in rows], dtype=np.int64),
+        'day': np.array([(row[1] - EPOCH).days for row in rows], dtype=np.int64),
+        'hours': np.array([row[2] for row in rows], dtype=np.float64),
+        'rate': np.array([row[3] for row in rows], dtype=np.float64),
+    }
+
+def _naive_pay(rows, threshold, multiplier):
+    """compute_pay() one record at a time, for comparison."""
+    pay = {}
+    week_hours = {}
+    for employee_id, day, hours, rate in sorted(rows, key=lambda row: (row[0], row[1])):
+        week = (employee_id, day - timedelta(days=day.weekday()))
+        before = week_hours.get(week, 0.0)
+        week_hours[week] = before + hours
+        overtime = min(hours, max(0.0, before + hours - threshold))
+        line = pay.setdefault(employee_id, [0, 0.0, 0.0, 0.0])
+        line[0] += 1
+        line[1] += hours - overtime
+        line[2] += overtime
+        line[3] += rate * (hours - overtime + overtime * multiplier)
+    return pay
+
+def _lines(pay):
+    return {
+        employee_id: (count, regular, overtime, gross)
+        for employee_id, count, regular, overtime, gross in zip(
+            pay['employee_id'].tolist(), pay['record_count'].tolist(),
+            pay['regular_hours'].tolist(), pay['overtime_hours'].tolist(),
+            pay['gross_pay'].tolist()
+        )
+    }
+
+def test_hours_past_the_weekly_threshold_are_overtime():
+    rows = [(1, MONDAY + timedelta(days=n), 9.0, 20.0) for n in range(5)]
+
+    assert _lines(compute_pay(_records(rows), 40, 1.5)) == {1: (5, 40.0, 5.0, 950.0)}
+
+def test_overtime_starts_again_on_monday():
+    # Thursday to Sunday, then the next Monday
+    rows = [(1, MONDAY + timedelta(days=n), 12.0, 10.0) for n in range(3, 8)]
+
+    count, regular, overtime, gross = _lines(compute_pay(_records(rows), 40, 2))[1]
+    assert (count, regular, overtime) == (5, 52.0, 8.0)
+    assert gross == pytest.approx(52 * 10 + 8 * 20)
+
+def test_overtime_is_paid_at_the_rate_of_the_record_it_falls_in():
+    rows = [
+        (1, MONDAY, 30.0, 10.0),
+        (1, MONDAY + timedelta(days=1), 20.0, 20.0),
+    ]
+
+    assert _lines(compute_pay(_records(rows), 40, 1.5))[1] == (2, 40.0, 10.0, 300 + 200 + 300)
+
+def test_employees_are_paid_separately():
+    rows = [
+        (1, MONDAY, 45.0, 10.0),
+        (2, MONDAY, 8.0, 15.0),
+    ]
+
+    assert _lines(compute_pay(_records(rows), 40, 1.5)) == {
+        1: (1, 40.0, 5.0, 475.0),
+        2: (1, 8.0, 0.0, 120.0),
+    }
+
+def test_no_records_pay_nobody():
+    pay = compute_pay(_records([]), 40, 1.5)
+
+    assert len(pay['employee_id']) == 0
+
+def test_matches_a_record_by_record_computation():
+    generator = random.Random(7)
+    rows = [
+        (employee_id, MONDAY + timedelta(days=generator.randrange(90)),
+         generator.randrange(0, 25) / 2, generator.choice([12.5, 18.0, 31.25]))
+        for employee_id in range(1, 8)
+        for _ in range(generator.randrange(20, 80))
+    ]
+
+    pay = _lines(compute_pay(_records(rows), 40, 1.5))
+    expected = _naive_pay(rows, 40, 1.5)
+    assert pay.keys() == expected.keys()
+    for employee_id, line in expected.items():
+        assert pay[employee_id][0] == line[0]
+        assert pay[employee_id][1:] == pytest.approx(tuple(line[1:]))
+
+def test_rates_on_matches_rate_table():
+    history_rows = [
+        (1, date(2024, 1, 1), 10.0),
+        (1, date(2024, 2, 1), 12.0),
+        (2, date(2024, 1, 15), 20.0),
+    ]
+    table = RateTable(history_rows)
+    history = {
+        'employee_id': np.array([row[0] for row in history_rows], dtype=np.int64),
+        'day': np.array([(row[1] - EPOCH).days for row in history_rows], dtype=np.int64),
+        'rate': np.array([row[2] for row in history_rows]),
+    }
+    lookups = [(1, date(2023, 12, 1)), (1, date(2024, 1, 31)), (1, date(2024, 2, 1)),
+               (2, date(2024, 1, 1)), (2, date(2025, 1, 1))]
+
+    rates = rates_on(np.array([e for e, _ in lookups], dtype=np.int64),
+                     np.array([(d - EPOCH).days for _, d in lookups], dtype=np.int64),
+                     history)
+    assert rates.tolist() == [table.rate_on(e, d) for e, d in lookups] == [10.0, 10.0, 12.0, 20.0, 20.0]
+
+def test_rates_on_gives_nan_without_history():
+    history = {'employee_id': np.array([1], dtype=np.int64), 'day': np.array([0], dtype=np.int64),
+               'rate': np.array([10.0])}
+
+    rates = rates_on(np.array([1, 3], dtype=np.int64), np.array([5, 5], dtype=np.int64), history)
+    assert rates[0] == 10.0
+    assert np.isnan(rates[1])
+
+def test_rate_table_without_history_applies_every_day():
+    table = RateTable([(1, None, 15.0)])
+
+    assert 1 in table and 2 not in table
+    assert table.rate_on(1, date(1990, 1, 1)) == table.rate_on(1, date(2090, 1, 1)) == 15.0
+    with pytest.raises(KeyError):
+        table.rate_on(2, date(2024, 1, 1))
+
+def _add_employee(name, hourly_rate, with_history=True):
+    employee_id = execute_db("INSERT INTO employees (name, hourly_rate) VALUES (?, ?)", (name, hourly_rate))
+    if with_history:
+        set_rate(employee_id, hourly_rate, FIRST_DAY)
+    return employee_id
+
+def _add_record(employee_id, day, hours, rate):
+    execute_db(
+        "INSERT INTO work_records (employee_id, date, hours_worked, amount_earned) VALUES (?, ?, ?, ?)",
+        (employee_id, day, hours, hours * rate)
+    )
+
+def test_run_payroll_stores_a_pay_run(app):
+    alice = _add_employee('Alice', 20.0)
+    set_rate(alice, 30.0, MONDAY + timedelta(days=7))
+    bob = _add_employee('Bob', 15.0, with_history=False)
+    for n in range(5):
+        _add_record(alice, MONDAY + timedelta(days=n), 9.0, 20.0)
+        _add_record(alice, MONDAY + timedelta(days=7 + n), 8.0, 30.0)
+        _add_record(bob, MONDAY + timedelta(days=n), 8.0, 15.0)
+    # Outside the period
+    _add_record(bob, MONDAY + timedelta(days=20), 8.0, 15.0)
+
+    result = run_payroll(MONDAY, MONDAY + timedelta(days=13), overtime_threshold=40, overtime_multiplier=1.5)
+
+    assert (result['records'], result['employees']) == (15, 2)
+    run = query_db("SELECT * FROM pay_runs WHERE id = ?", (result['pay_run_id'],), one=True)
+    assert (run['record_count'], run['regular_hours'], run['overtime_hours']) == (15, 120.0, 5.0)
+    lines = {
+        line['employee_id']: (line['record_count'], line['regular_hours'], line['overtime_hours'], line['gross_pay'])
+        for line in query_db("SELECT * FROM pay_run_lines WHERE pay_run_id = ?", (result['pay_run_id'],))
+    }
+    # Alice's first week is at 20 with 5 hours overtime, her second at 30;
+    # Bob has no rate history and is paid at the rate his records carry
+    assert lines == {
+        alice: (10, 80.0, 5.0, 40 * 20 + 5 * 30 + 40 * 30),
+        bob: (5, 40.0, 0.0, 600.0),
+    }
+    assert run['gross_pay'] == pytest.approx(2150 + 600)